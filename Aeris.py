@@ -1,81 +1,260 @@
+# i limiti dei thread delle librerie di calcolo vanno impostati prima di importare numpy
+from runtime.config import get_runtime
+get_runtime().apply_environment()
 from audio.wakeup import Porcupine
 from audio.audio_local import AerisEars
+from audio.capture import CaptureEngine
+from audio.bargein import BargeInMonitor
 from model.response_gen import AerisMind
+from model.intents import IntentEngine
 from speech.voice import AerisVoice
+from speech.chunker import SentenceChunker
+from speech.playback import PlaybackQueue
+from metrics.tracing import get_tracer
+from metrics.resources import get_resources
+import os
+import sys
 import time
 import asyncio
+import threading
+from queue import Empty
 
 class Aeris:
-    def __init__(self, gpt_model="gpt-4.1-mini"):
+    def __init__(self, gpt_model="gpt-4.1-mini", preroll_seconds: float = 0.5, streaming_stt: bool = None,
+                 streaming_response: bool = True, barge_in: str = "wakeword", follow_up_seconds: float = 5.0,
+                 capture=None, mind: AerisMind = None, voice: AerisVoice = None,
+                 wake_engine=None, stt_backend: str = None, stt_worker: bool = None, stt=None):
         
         # Inizializza i componenti
+        # unico stream del microfono, condiviso da wakeword e registrazione per tutta la sessione.
+        # capture, mind, voice e wake_engine permettono di sostituire microfono, modello,
+        # voce e pvporcupine (ad esempio con il replay da file di replay/)
+        # thread e core di whisper, Piper e cattura (AERIS_STT_THREADS, AERIS_CAPTURE_CPU, ...)
+        self.runtime = get_runtime()
+        self.resources = get_resources()
+        self.capture = capture or CaptureEngine(device_index=1, sample_rate=44100, cpu=self.runtime.capture_cpu)
         self.ears = None
         self.wakeword = None
-        self.mind = AerisMind(model=gpt_model)
-        self.voice = None
+        self.wake_engine = wake_engine
+        self.stt_backend = stt_backend
+        # trascrizione in un processo separato; None lascia decidere ad AERIS_STT_WORKER
+        self.stt_worker = stt_worker
+        # backend di trascrizione già pronto al posto di whisper (replay e test)
+        self.stt = stt
+        self.preroll_seconds = preroll_seconds
+        # trascrizione in streaming durante il parlato (AERIS_STREAMING_STT=1): su CPU whisper
+        # ridecodifica il buffer circa ogni secondo, di default si trascrivono a batch i
+        # segmenti chiusi dal VAD
+        self.streaming_stt = streaming_stt if streaming_stt is not None else os.getenv("AERIS_STREAMING_STT") == "1"
+        self.streaming_response = streaming_response
+        with self.resources.component("llm"):
+            self.mind = mind or AerisMind(model=gpt_model)
+        self.voice = voice
+        
+        # comandi fissi (ora, data, timer, volume, stop, ripeti) risolti senza modello
+        self.intents = IntentEngine(voice=voice, announce=self.announce)
+        
+        # barge-in durante la risposta: "wakeword", "vad" oppure None per disattivarlo
+        self.barge_in_trigger = barge_in
+        self.barge_in = None
+        self.interrupted = False # impostato quando l'utente interrompe la risposta
+        
+        # dopo una risposta si può continuare a parlare per follow_up_seconds senza wakeword
+        self.follow_up_seconds = follow_up_seconds
+        self.follow_up = False
         
         self.is_processing = False
         self.transcription_complete = False
+        self.turn_done = threading.Event() # impostato alla fine di ogni turno
         self.current_transcription = "" # prenderà audio di proceess audio queue e chiamerà create_response
         self.response = ""
+        
+        # tempi di caricamento e warm-up per componente, riempiti da startup()
+        self.startup_timings = {}
+        
+        # traccia dei turni, attiva con AERIS_TRACE
+        self.tracer = get_tracer()
+    
+    """ Fase di avvio: carica in parallelo il modello di trascrizione e quello di sintesi
+        vocale, esegue un'inferenza a vuoto su ciascuno e stampa i tempi, gli import e la
+        memoria di ogni componente. Con AERIS_PROFILE_STARTUP=1 i due caricamenti sono in
+        sequenza, così l'RSS aggiunto da ciascuno non contiene quello dell'altro. Il loop
+        della wakeword parte solo quando entrambi sono pronti."""
+    def startup(self):
+        errors = {}
+        
+        def load_ears():
+            self.ears = AerisEars(capture=self.capture, streaming=self.streaming_stt, backend=self.stt_backend,
+                                  worker=self.stt_worker, stt=self.stt)
+            self.ears.warmup()
+            self.startup_timings["stt"] = (self.ears.load_time, self.ears.warmup_time)
+        
+        def load_voice():
+            if self.voice is None:
+                self.voice = AerisVoice()
+            self.intents.voice = self.voice
+            self.voice.warmup()
+            self.startup_timings["tts"] = (self.voice.load_time, self.voice.warmup_time)
+        
+        def run(name, loader):
+            try:
+                with self.resources.component(name):
+                    loader()
+            except BaseException as e: # load_model chiama sys.exit in caso di errore
+                errors[name] = e
+        
+        start = time.perf_counter()
+        print(f"[AVVIO] runtime: {self.runtime.describe()}")
+        threads = [
+            threading.Thread(target=run, args=("stt", load_ears), daemon=True),
+            threading.Thread(target=run, args=("tts", load_voice), daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+            if self.runtime.profile_startup:
+                thread.join()
+        for thread in threads:
+            thread.join()
+        
+        for name, (load_time, warmup_time) in self.startup_timings.items():
+            print(f"[AVVIO] {name}: caricamento {load_time:.2f}s, warm-up {warmup_time:.2f}s")
+        self.resources.print_report("[AVVIO]")
+        print(f"[AVVIO] pronto in {time.perf_counter() - start:.2f}s")
+        
+        if errors:
+            raise RuntimeError(f"Avvio fallito: {errors}")
     
     """ Funzione chiamata quando una wakeword viene detectata da Porcupine..."""    
-    def wakeword_detection(self):
+    def wakeword_detection(self, start_at: int = None, preroll=None, no_speech_timeout: float = None):
+        # la connessione al modello si apre mentre l'utente parla
+        self.mind.preconnect()
         if not self.ears:
-            self.ears = AerisEars()
+            self.ears = AerisEars(capture=self.capture, streaming=self.streaming_stt, backend=self.stt_backend,
+                                  worker=self.stt_worker, stt=self.stt)
         
+        self.tracer.begin(follow_up=no_speech_timeout is not None)
         self.transcription_complete = False
+        self.turn_done.clear()
         self.current_transcription = ""
         self.response = ""
         
         self.ears.process_audio_queue = self.custom_process_queue
         
-        self.ears.start_recording(device_index=1)
+        # la registrazione riparte dal campione in cui è stata rilevata la wakeword,
+        # preceduta dagli ultimi secondi già ricampionati dal rilevatore
+        if start_at is None:
+            start_at, preroll = self.wakeword.detected_at, self.wakeword.preroll_audio
+        self.ears.start_recording(
+            device_index=1,
+            start_at=start_at,
+            preroll=preroll,
+            no_speech_timeout=no_speech_timeout
+        )
         
     """ Funzione che sostituisce process_audio_queue presente nel
         gruppo audio. Permette di unire le trascrizioni generate dal
-        modello whisper e ricavare una stringa che diventerà il prompt."""    
+        modello whisper e ricavare una stringa che diventerà il prompt.
+        In modalità streaming la trascrizione finale è pronta subito dopo la fine del parlato."""    
     def custom_process_queue(self):
+        if self.ears.streaming:
+            transcript = self.ears.transcribe_stream(on_hypothesis=self.show_partial_transcription)
+            transcribed_parts = [transcript] if transcript else []
+        else:
+            transcribed_parts = self.collect_segments()
+        
+        path = None
+        if transcribed_parts:
+            self.tracer.mark("stt_done")
+            start = time.perf_counter()
+            self.current_transcription = " ".join(transcribed_parts).strip()
+            if self.answer_intent():
+                path = "intent"
+            else:
+                path = "llm"
+                if self.streaming_response:
+                    self.stream_response()
+                else:
+                    self.generate_response()
+                    self.reproduce_audio()
+                self.intents.remember(self.response)
+            self.record_path(path, start)
+        else:
+            print("Nessuna trascrizione ottenuta.")
+        # dopo una risposta completa il turno successivo non richiede la wakeword
+        self.follow_up = bool(self.follow_up_seconds and (self.response or "").strip() and not self.interrupted)
+        player = self.voice.player if self.voice else None
+        if player is not None and player.first_sample_latency is not None:
+            self.tracer.mark("tts_first_sample", player.begin_time + player.first_sample_latency)
+        # contatori cumulativi della cattura: callback in overflow e campioni persi dai lettori
+        self.tracer.end(interrupted=self.interrupted, overflows=self.capture.overflows,
+                        dropped=self.ears.dropped + (self.wakeword.dropped if self.wakeword else 0),
+                        path=path, intent=self.intents.last_intent,
+                        llm=self.mind.last_backend if path == "llm" else None)
+        self.transcription_complete = True
+        self.turn_done.set()
+    
+    """ Risponde ai comandi riconosciuti dal motore degli intent senza passare dal
+        modello. Restituisce False se la trascrizione va mandata ad AerisMind."""
+    def answer_intent(self) -> bool:
+        if not self.voice:
+            self.voice = AerisVoice()
+        self.intents.voice = self.voice
+        reply = self.intents.handle(self.current_transcription)
+        if reply is None:
+            return False
+        self.tracer.mark("llm_first_token")
+        self.tracer.mark("llm_done")
+        self.response = reply
+        print(f"[INTENT] {self.intents.last_intent}: {reply}")
+        self.interrupted = False
+        if reply:
+            self.reproduce_audio()
+        return True
+    
+    """ Registra per il motore degli intent la latenza del turno, dalla fine della
+        trascrizione alla prima voce (o alla risposta, se non c'è nulla da dire)."""
+    def record_path(self, path: str, start: float):
+        if self.interrupted:
+            return
+        player = self.voice.player if self.voice else None
+        if self.response and player is not None and player.first_sample_latency is not None \
+                and player.begin_time >= start:
+            end = player.begin_time + player.first_sample_latency
+        else:
+            end = time.perf_counter()
+        self.intents.record(path, end - start)
+        self.intents.print_stats()
+    
+    """ Pronuncia l'avviso di un timer appena il player è libero."""
+    def announce(self, text: str):
+        print(f"[TIMER] {text}")
+        if self.voice is not None:
+            self.voice.player.wait()
+            self.voice.play_audio(text)
+    
+    """ Stampa le ipotesi parziali della trascrizione in streaming."""
+    def show_partial_transcription(self, committed: str, tentative: str, final: bool):
+        if not final:
+            print(f"... {committed} [{tentative}]")
+    
+    """ Trascrive a batch i segmenti chiusi dal VAD e restituisce le trascrizioni in ordine."""
+    def collect_segments(self):
         transcribed_parts = []
         
         while self.ears.is_recording or not self.ears.audio_queue.empty():
             try:
-                if not self.ears.audio_queue.empty():
-                    audio_data = self.ears.audio_queue.get(timeout=1)
-                    
-                    # Resampling dell'audio da 44.1kHz a 16kHz
-                    import librosa
-                    audio_resampled = librosa.resample(audio_data, orig_sr=44100, target_sr=16000)
-                    transcript = self.ears.transcribe_audio(audio_resampled)
-                    
-                    if transcript.strip():
+                # l'audio in coda è già stato portato a 16kHz dal resampler di AerisEars;
+                # get si sveglia appena il VAD chiude un segmento e i segmenti accumulati
+                # mentre whisper era occupato vengono decodificati in un unico batch
+                for transcript in self.ears.transcribe_next_batch():
+                    if transcript and transcript.strip():
                         transcribed_parts.append(transcript)
-                    
-                    self.ears.audio_queue.task_done()
-                else:
-                    time.sleep(0.1)
+            except Empty:
+                continue
             except Exception as e:
                 print(f"Errore nel processamento: {e}")
                 break
-        
-        # Processa eventuali elementi rimanenti nella coda
-        while not self.ears.audio_queue.empty():
-            try:
-                audio_data = self.ears.audio_queue.get_nowait()
-                import librosa
-                audio_resampled = librosa.resample(audio_data, orig_sr=44100, target_sr=16000)
-                transcript = self.ears.transcribe_audio(audio_resampled)
-                if transcript and transcript.strip():
-                    transcribed_parts.append(transcript)
-            except:
-                break
-        if transcribed_parts:
-            self.current_transcription = " ".join(transcribed_parts).strip()
-            self.generate_response()
-            self.reproduce_audio()
-        else:
-            print("Nessuna trascrizione ottenuta.")
-        self.transcription_complete = True
+        return transcribed_parts
         
         
     """ Funzione che richiama il modello di OpenAi per la generazione
@@ -85,47 +264,166 @@ class Aeris:
             self.response = self.mind.create_response(self.current_transcription)
             print(f"{self.response}")
     
-    """ Metodo che permette di passare la stringa data dall'output del modello
-        al TTS di Kitten. Successivamente l'audio array ottenuto viene passato
-        alla funzione di riproduzione audio tramite altoparlanti."""
+    """ Genera la risposta in streaming: ogni frase completa viene mandata subito a Piper
+        e la frase successiva viene sintetizzata mentre la precedente è in riproduzione."""
+    def stream_response(self):
+        if not self.current_transcription.strip():
+            return
+        try:
+            if not self.voice:
+                self.voice = AerisVoice()
+            playback = PlaybackQueue(self.voice)
+            # prima del barge-in e del generatore: un'interruzione da qui in poi vale per questo turno
+            self.mind.begin_turn()
+            
+            def cancel():
+                playback.cancel()
+                self.mind.cancel()
+            
+            self.watch_barge_in(cancel)
+            chunker = SentenceChunker()
+            try:
+                for delta in self.mind.stream_response(self.current_transcription):
+                    for sentence in chunker.feed(delta):
+                        playback.put(sentence)
+                for sentence in chunker.flush():
+                    playback.put(sentence)
+                playback.close()
+                
+                self.response = self.mind.response or ""
+                print(f"{self.response}")
+                playback.wait()
+            finally:
+                self.stop_barge_in()
+            if self.interrupted:
+                print("Risposta interrotta")
+            elif playback.first_audio_latency is not None:
+                print(f"Prima voce dopo {playback.first_audio_latency * 1000:.0f} ms")
+            stats = self.voice.cache.stats()
+            print(f"Cache TTS: {stats['hit_rate']:.0%} hit, {stats['saved_seconds']:.1f}s di sintesi risparmiati")
+            stats = self.mind.cache.stats()
+            print(f"Cache risposte: {stats['hit_rate']:.0%} hit ({stats['misses']} miss, "
+                  f"{stats['bypassed']} saltate), {stats['saved_seconds']:.1f}s risparmiati")
+        except Exception as e:
+            print(f"Errore nella riproduzione audio: {e}")
+    
+    """ Metodo che permette di passare la risposta completa del modello ad AerisVoice:
+        la frase viene cercata nella cache delle frasi e, se manca, sintetizzata da Piper.
+        I chunk PCM vengono scritti nel player man mano che sono pronti e riprodotti
+        tramite gli altoparlanti."""
     def reproduce_audio(self):
         try:
             if not self.voice:
                 self.voice = AerisVoice()
             if self.response.strip():
-                self.voice.play_audio(text=self.response, sample_rate=22050)
+                self.watch_barge_in()
+                try:
+                    self.voice.play_audio(text=self.response)
+                finally:
+                    self.stop_barge_in()
         except Exception as e:
             print(f"Errore nella riproduzione audio: {e}")
             
                 
+    """ Durante la riproduzione continua ad ascoltare il microfono: se l'utente interrompe
+        l'assistente ferma il player, esegue cancel e segna il turno come interrotto."""
+    def watch_barge_in(self, cancel=None):
+        self.interrupted = False
+        if self.barge_in is None:
+            return
+        
+        def on_barge_in():
+            self.interrupted = True
+            if cancel:
+                cancel()
+        
+        self.barge_in.start(on_barge_in)
+    
+    """ Crea il monitor di barge-in sul microfono condiviso e sul player della voce."""
+    def create_barge_in(self):
+        if self.barge_in_trigger:
+            self.wakeword.open()
+            self.barge_in = BargeInMonitor(self.wakeword, self.capture, self.voice.player,
+                                           trigger=self.barge_in_trigger)
+    
+    def stop_barge_in(self):
+        if self.barge_in is not None:
+            self.barge_in.stop()
+    
     """ Funzione che inizializza l'agente Porcupine per la rilevazione della wakeword.
          Nel momento in cui la parola viene rilevata il loop continua e viene chiamata
          on_wake_word_detected() come callback. """
     def start_listening_cycle(self, timeout: int = 10):
         try:
-            self.wakeword = Porcupine(sensitivity=0.25, callback=self.wakeword_detection)
+            self.startup()
+            self.capture.start()
+            self.wakeword = Porcupine(sensitivity=0.25, callback=self.wakeword_detection,
+                                      capture=self.capture, preroll_seconds=self.preroll_seconds,
+                                      engine=self.wake_engine)
+            self.create_barge_in()
             while True:
-                self.wakeword.start(timeout)
-                while not self.transcription_complete:
-                    time.sleep(0.5)
+                if self.interrupted:
+                    # l'utente ha interrotto la risposta: si registra subito, senza aspettare la wakeword
+                    self.interrupted = False
+                    self.wakeword_detection(self.barge_in.start_at, self.barge_in.preroll_audio)
+                elif self.follow_up:
+                    # finestra di follow-up: basta il VAD per riaprire la registrazione
+                    self.follow_up = False
+                    print(f"Puoi continuare per {self.follow_up_seconds:.0f}s senza wakeword")
+                    self.wakeword_detection(self.capture.position, None, no_speech_timeout=self.follow_up_seconds)
+                else:
+                    self.wakeword.start(timeout)
+                    # se la wakeword non è stata rilevata è scaduto il timeout,
+                    # oppure la sorgente audio è terminata (fine del file nel replay)
+                    if self.wakeword.detected_at is None:
+                        if self.capture.ring.closed:
+                            break
+                        continue
+                self.turn_done.wait()
                 self.ears.stop_recording()
         except KeyboardInterrupt:
             print("Uscita")
         finally:
             self.cleanup()
             
+    """ Avvia l'assistente con l'orchestratore asyncio al posto del ciclo a thread."""
+    def run_async(self):
+        from pipeline import AerisPipeline
+        try:
+            self.startup()
+            self.capture.start()
+            self.wakeword = Porcupine(sensitivity=0.25, capture=self.capture,
+                                      preroll_seconds=self.preroll_seconds, engine=self.wake_engine)
+            self.wakeword.open()
+            self.create_barge_in()
+            asyncio.run(AerisPipeline(self).run())
+        except KeyboardInterrupt:
+            print("Uscita")
+        finally:
+            self.cleanup()
+            
     """Funzione che chiama la chiusura dei microfoni."""
     def cleanup(self):
+        # memoria a regime dopo i turni, prima di chiudere il worker di trascrizione
+        self.resources.print_report("[RISORSE]")
         if self.ears:
-            self.ears.stop_recording()
+            self.ears.close()
         if self.wakeword:
             self.wakeword.stop()
+        self.capture.stop()
+        self.intents.close()
+        self.mind.close()
+        self.tracer.print_summary()
+        self.tracer.close()
         print("Sistema terminato")       
         
 def main():
     try:
         system = Aeris()
-        system.start_listening_cycle(timeout=10)
+        if "--async" in sys.argv:
+            system.run_async()
+        else:
+            system.start_listening_cycle(timeout=10)
     except Exception as e:
         print(f"Errore nell'avvio: {e}")
             
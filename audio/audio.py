@@ -5,41 +5,94 @@ from queue import Queue
 import base64
 import asyncio
 import  signal
-import pyaudio
 from audio.wakeup import Porcupine
 import speech_recognition as sr
 import struct
 
 
+class CaptureSource(sr.AudioSource):
+    """ Sorgente di speech_recognition che legge dal motore di cattura condiviso
+        (il microfono di CaptureEngine o il file di FileCapture nel replay) invece di
+        aprire un proprio stream PyAudio."""
+    def __init__(self, capture, chunk_size: int = 1024):
+        self.capture = capture
+        self.SAMPLE_RATE = capture.sample_rate
+        self.SAMPLE_WIDTH = 2 # int16
+        self.CHUNK = chunk_size
+        self.stream = None
+
+    def __enter__(self):
+        self.capture.start()
+        self.stream = CaptureStream(self.capture.reader())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+class CaptureStream:
+    """ Lo stream letto da Recognizer.listen: read restituisce byte PCM, vuoti quando
+        la sorgente è stata chiusa (fine del file)."""
+    def __init__(self, reader):
+        self.reader = reader
+
+    def read(self, size: int) -> bytes:
+        while True:
+            pcm = self.reader.read(size, timeout=1)
+            if pcm is not None:
+                return pcm.tobytes()
+            if self.reader.ring.closed:
+                return b""
+
+
 class AerisEars2:
 
-    def __init__(self):
+    def __init__(self, capture=None, engine=None):
         # audio settings
         self.chunk_size = 1024
-        self.sample_format = pyaudio.paInt16
         self.channels = 1
         self.sample_rate = 44100 # frequency
 
-        self.wakeword = Porcupine(sensitivity=0.25, callback=self._on_wakeword)
-        
-        # oggetto di PyAudio
-        self.audio = pyaudio.PyAudio()
-        self.audio_stream = self.audio.open(
-            rate=self.sample_rate,
-            channels=self.channels,
-            input=True,
-            format=self.sample_format,
-            output_device_index=1,
-            frames_per_buffer=self.wakeword.porcupine.frame_length,
-            stream_callback=self._wakeword_detection
-        )
-        self.audio_stream.start_stream()
-        
+        """ Con capture (e un motore di rilevazione al posto di pvporcupine) la wakeword e la
+            registrazione leggono dal motore di cattura condiviso, ad esempio il file del
+            replay; senza, il comportamento è quello originale con lo stream PyAudio."""
+        self.capture = capture
+        self.wakeword = Porcupine(sensitivity=0.25, callback=self._on_wakeword, capture=capture, engine=engine)
+        self.transcript = None
         self.recorder = sr.Recognizer()
-        self.microphone = sr.Microphone(device_index=1, chunk_size=self.chunk_size, sample_rate=self.sample_rate)
+        
+        self.audio = None
+        self.audio_stream = None
+        if capture is None:
+            import pyaudio
+            self.sample_format = pyaudio.paInt16
+            self._continue = pyaudio.paContinue
+            
+            # oggetto di PyAudio
+            self.audio = pyaudio.PyAudio()
+            self.audio_stream = self.audio.open(
+                rate=self.sample_rate,
+                channels=self.channels,
+                input=True,
+                format=self.sample_format,
+                output_device_index=1,
+                frames_per_buffer=self.wakeword.porcupine.frame_length,
+                stream_callback=self._wakeword_detection
+            )
+            self.audio_stream.start_stream()
+            self.microphone = sr.Microphone(device_index=1, chunk_size=self.chunk_size, sample_rate=self.sample_rate)
+        else:
+            self.microphone = CaptureSource(capture, chunk_size=self.chunk_size)
         # signal handler 
         signal.signal(signal.SIGINT, self.signal_handler)
 
+    """ Ascolta la wakeword sul motore di cattura condiviso per al massimo timeout secondi
+        e restituisce la trascrizione del comando, o None."""
+    def listen(self, timeout: int = 10):
+        self.transcript = None
+        self.wakeword.start(timeout)
+        return self.transcript
+
     """ Funzione che permette una gracefull degradation
         attraverso l'handling dei segnali. """
     def signal_handler(self, sig, frame):
@@ -49,6 +102,9 @@ class AerisEars2:
     """ Funzione che lista i dispositivi audio connessi alla Pi. 
         Utilizzata solo per riconoscere il nome del dispositivo audio connesso. """
     def list_audio_dev(self):
+        if self.audio is None:
+            print("Nessun dispositivo: l'audio arriva dal motore di cattura condiviso")
+            return
         print("Available audio devices: ")
         for i in range(self.audio.get_device_count()):
             print(f"{i} : {self.audio.get_device_info_by_index(i)}")
@@ -64,7 +120,7 @@ class AerisEars2:
         if keyword_index >= 0:
             print("[INFO] Wake word detected")
             self.wakeword.callback()
-        return (in_data, pyaudio.paContinue)
+        return (in_data, self._continue)
         
     """ Funzione che registra l'audio e lo passa al modello di trascrizione."""
     def _on_wakeword(self):
@@ -75,7 +131,8 @@ class AerisEars2:
         if not transcript:
             return
         self.stop_recording()
-        return transcript.strip()
+        self.transcript = transcript.strip()
+        return self.transcript
         
     """ Funzione che chiama il modello API di azure per la trascrizione dell'audio registrato.
         La trascrizione avviene usando la lingua italiana."""
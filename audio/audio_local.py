@@ -1,63 +1,149 @@
-import pyaudio
 import threading
 import time
 import numpy as np
-from queue import Queue
+from queue import Queue, Empty
 import signal
 import sys
-import torch
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
+import os
 import warnings
-import librosa
+from audio.resampler import StreamingResampler
+from audio.capture import CaptureEngine
+from audio.stt_worker import SttWorker
+from audio.decoding import DecodingPolicy, get_policy
+from audio.vad import VoiceActivityDetector
+from audio.noise import GainNormalizer, NoiseFloor, SpectralDenoiser, frame_rms
+from audio.streaming import StreamingTranscriber
+from metrics.tracing import get_tracer
+from metrics.resources import get_resources
+from runtime.config import get_runtime
 
 class AerisEars:
-    def __init__(self, model="openai/whisper-base"):
+    def __init__(self,
+                 model="openai/whisper-base",
+                 capture: CaptureEngine = None,
+                 backend: str = None,
+                 silence_seconds: float = 1.0,
+                 streaming: bool = False,
+                 batch_size: int = 4,
+                 batch_wait: float = 0.05,
+                 decoding: DecodingPolicy = None,
+                 worker: bool = None,
+                 threads: int = None,
+                 cpus: tuple = None,
+                 adaptive: bool = None,
+                 denoise: bool = None,
+                 stt=None):
       self.model_name = model
+      # backend di trascrizione: hf (default), int8 oppure onnx
+      self.backend_name = backend or os.getenv("AERIS_STT_BACKEND", "hf")
+      # trascrizione in un processo separato (AERIS_STT_WORKER=1); thread di torch e core
+      # del worker vengono dalla configurazione di runtime (AERIS_STT_THREADS, AERIS_STT_CPUS)
+      self.worker = worker if worker is not None else os.getenv("AERIS_STT_WORKER") == "1"
+      self.runtime = get_runtime()
+      self.threads = threads or self.runtime.stt_threads
+      cpus = cpus or self.runtime.stt_cpus
+      self.cpus = tuple(int(c) for c in cpus.split(",")) if isinstance(cpus, str) else cpus
+      # politica di decodifica: greedy con fallback di temperatura (default) oppure beam
+      self.decoding = decoding or get_policy(os.getenv("AERIS_STT_DECODING", "greedy"))
 
       # audio settings
-      self.chunk_size = 512
-      self.sample_format = pyaudio.paInt16
+      self.chunk_size = 1323 # ~30 ms a 44.1kHz, il VAD lavora su frame da 20 ms
+      self.sample_format = np.int16 # campioni letti dal buffer di cattura (paInt16)
       self.channels = 1
       self.sample_rate = 44100 # frequency
-      self.record_seconds = 3
+      self.target_rate = 16000 # frequenza richiesta da whisper
+      
+      # resampler con stato: i blocchi consecutivi di una registrazione restano continui
+      self.resampler = StreamingResampler(orig_sr=self.sample_rate, target_sr=self.target_rate)
       
       # Silence settings
-      self.silence_threshold = 0.05
-      self.silence_seconds = 3.0
+      self.silence_threshold = 0.05 # picco minimo di un segmento senza stima del rumore
+      self.silence_seconds = silence_seconds # silenzio dopo il parlato che chiude il turno
+      
+      """ Rumore di fondo stimato sui frame del VAD (AERIS_ADAPTIVE_NOISE=0 torna alle soglie
+          fisse): decide le soglie del VAD e quali segmenti contengono parlato. I segmenti
+          mandati a whisper passano dal controllo del guadagno e, con AERIS_DENOISE=1,
+          dalla sottrazione spettrale."""
+      self.adaptive = adaptive if adaptive is not None else os.getenv("AERIS_ADAPTIVE_NOISE", "1") != "0"
+      self.noise_floor = NoiseFloor() if self.adaptive else None
+      self.gain = GainNormalizer() if self.adaptive else None
+      denoise = denoise if denoise is not None else os.getenv("AERIS_DENOISE") == "1"
+      self.denoiser = SpectralDenoiser() if denoise else None
+      # secondi di audio mandati a whisper e segmenti scartati perché silenziosi
+      self.stt_audio_seconds = 0.0
+      self.skipped_segments = 0
+      
+      """ Il VAD divide l'audio in segmenti di parlato di lunghezza variabile che terminano
+          sulle pause e decide quando il turno è finito."""
+      self.vad = VoiceActivityDetector(sample_rate=self.target_rate, end_silence=self.silence_seconds,
+                                       noise_floor=self.noise_floor)
+      self.end_of_speech_latency = None
+      
+      # trascrizione a batch: fino a batch_size segmenti in coda decodificati insieme,
+      # aspettando al massimo batch_wait secondi che ne arrivino altri
+      self.batch_size = max(1, batch_size)
+      self.batch_wait = batch_wait
+      self._preroll = None
+      self._no_speech_timeout = None
+      self.tracer = get_tracer()
+      
+      # trascrizione incrementale con ipotesi parziali durante il parlato
+      self.streaming = streaming
+      self.stream_step_seconds = 1.0
 
       self.audio_queue = Queue()
       self.is_recording = False
+      self.dropped = 0 # campioni persi dai lettori di registrazione, sovrascritti prima della lettura
       
-      # Oggetto PyAudio
-      self.audio = pyaudio.PyAudio()
+      # Motore di cattura condiviso con Porcupine: nessuno stream viene riaperto ad ogni ciclo
+      self.capture = capture
+      self._owns_capture = capture is None
       
       #Pezzi di trascrizione
       self.transcribed_parts = []
 
       #Model Componenets
-      """ Il Whisper Processor è usato per preprocessare gli input audio e elaborare gli output di testo"""
+      """ Il backend contiene il Whisper Processor, usato per preprocessare gli input audio
+          e elaborare gli output di testo, e il modello vero e proprio."""
+      # backend già pronto (ad esempio FakeTranscriber del replay): load_model non carica nulla
+      self.stt = stt
       self.processor = None
       self.model = None
+      
+      # tempi di avvio in secondi, riempiti da load_model e warmup
+      self.load_time = None
+      self.warmup_time = None
 
       self.load_model()
 
     """ Gestisce l'uscita gracefull del programma. """
     def signal_handler(self, sig, frame):
-      self.stop_recording()
+      self.close()
       sys.exit(0)
 
-    """ Funzione che carica il modello."""
+    """ Funzione che carica il modello tramite il backend scelto. Se lo stesso modello
+        è già stato caricato nel processo viene riutilizzato dalla cache dei backend.
+        torch e transformers vengono importati solo qui e solo per la trascrizione nel
+        processo: con il worker restano fuori dal processo principale."""
     def load_model(self):
+      start = time.perf_counter()
+      resources = get_resources()
       try:
-        self.processor = WhisperProcessor.from_pretrained(self.model_name)
-        self.model = WhisperForConditionalGeneration.from_pretrained(
-          self.model_name,
-          torch_dtype=torch.float32, # forza il modello ad usare float a 32 bit 
-          low_cpu_mem_usage=True
-        )
-        
-        self.model.to("cpu")
-        self.model.eval()
+        if self.stt is not None:
+          pass
+        elif self.worker:
+          self.stt = SttWorker(self.backend_name, self.model_name, policy=self.decoding,
+                               threads=self.threads, cpus=self.cpus,
+                               interop_threads=self.runtime.stt_interop_threads).start()
+          resources.set_process("stt", self.stt, import_s=self.stt.import_time)
+        else:
+          with resources.imports("stt"):
+            from audio.stt_backends import get_backend
+          self.runtime.configure_torch(self.threads)
+          self.stt = get_backend(self.backend_name, self.model_name, policy=self.decoding)
+        self.processor = self.stt.processor
+        self.model = self.stt.model
+        self.load_time = time.perf_counter() - start
         
       except Exception as e:
         print(f"Error loading the model: {e}")
@@ -66,91 +152,134 @@ class AerisEars:
     """ Funzione che lista i dispositivi audio connessi alla Pi. 
         Utilizzata solo per riconoscere il nome del dispositivo audio connesso. """
     def list_audio_dev(self):
+        import pyaudio
+        audio = self.capture.pa if self.capture and self.capture.pa else pyaudio.PyAudio()
         print("Available audio devices: ")
-        for i in range(self.audio.get_device_count()):
-            print(f"{i} : {self.audio.get_device_info_by_index(i)}")
+        for i in range(audio.get_device_count()):
+            print(f"{i} : {audio.get_device_info_by_index(i)}")
             
             
-    """ Funzione che legge i byte dal microfono e li mette in una coda di audio dopo
-        aver effettuato operazioni di conversione dati e normalizzazione."""
-    def record_audio_chunk(self, device_index):
+    """ Funzione che legge i campioni dal motore di cattura condiviso, li converte in float,
+        li ricampiona a 16kHz e li passa al VAD. I segmenti di parlato restituiti dal VAD
+        vengono messi nella coda audio; la registrazione termina quando il VAD rileva la
+        fine del turno. Se start_at è indicato la lettura parte da quella posizione
+        assoluta del buffer (ad esempio il punto in cui è stata rilevata la wakeword)."""
+    def record_audio_chunk(self, start_at=None):
       try:
-        config = {
-          'format' : self.sample_format,
-          'channels' : self.channels,
-          'rate' : self.sample_rate,
-          'frames_per_buffer' : self.chunk_size,
-          'input' : True
-        }
-        if device_index is not None:
-          config['input_device_index'] = device_index
+        reader = self.capture.reader(start=start_at)
+        self.resampler.reset()
+        self.vad.reset(no_speech_timeout=self._no_speech_timeout)
         
-        stream = self.audio.open(**config)
-        silence_start = None
+        # il preroll è già a 16kHz: entra nel VAD prima dell'audio letto dal buffer
+        if self._preroll is not None and len(self._preroll):
+          self.enqueue_segments(self.vad.process(self._preroll))
         
-        while self.is_recording:
-          frames = [] # pezzi di audio grezzi letti dal microfono
-          
-          """
-          n. di campioni al secondo / n.di campioni in un frame * secondi di registrazione
-          indica il numero di chunk da registrare in n secondi di registrazione
-          """
-          for _ in range(int(self.sample_rate / self.chunk_size * self.record_seconds)):
-            if not self.is_recording:
-              break
-            # legge chunk size campioni di audio dalla stream 
-            frames.append(stream.read(self.chunk_size, exception_on_overflow=False))
+        while self.is_recording and not self.vad.turn_ended:
+          # vista int16 su chunk size campioni del buffer circolare, senza copia
+          chunk = reader.view(self.chunk_size, timeout=1)
+          if chunk is None:
+            break
+          self.tracer.mark("first_audio")
           
-          if frames and self.is_recording:
-            # converte i bytes in un array di interi a 16 bit unendo i bytes grezzi presenti in frames
-            audio_data = np.frombuffer(b''.join(frames), dtype=np.int16)
-            
-            # converte in float e normalizza in un range compreso tra [-1; 1]
-            audio_data = audio_data.astype(np.float32) / 32768.0
-            
-            if np.max(np.abs(audio_data)) < self.silence_threshold:
-              if silence_start is None:
-                silence_start = time.time()
-              elif time.time() - silence_start > self.silence_seconds:
-                print("Non sento nulla")
-                break
-            else:
-              silence_start = None
-            
-            try:
-              self.audio_queue.put_nowait(audio_data)
-            except:
-              pass
-            
-        stream.stop_stream()
-        stream.close()
+          with self.tracer.stage("vad"):
+            # resampling da 44.1kHz a 16kHz mantenendo la storia del blocco precedente: il
+            # resampler normalizza gli int16 in [-1; 1] mentre li copia nel proprio buffer,
+            # quindi il passaggio a float avviene una volta sola; il VAD copia ciò che conserva
+            audio_resampled = self.resampler.process(chunk, scale=1 / 32768, copy=False)
+            self.enqueue_segments(self.vad.process(audio_resampled))
+        
+        if reader.dropped:
+          print(f"Registrazione in ritardo: {reader.dropped} campioni persi")
+        self.dropped += reader.dropped
+        
+        if self.vad.heard_speech:
+          self.tracer.mark("end_of_speech")
+        
+        segment = self.vad.flush()
+        if segment is not None:
+          self.enqueue_segments([segment])
+        
+        if not self.vad.heard_speech:
+          print("Non sento nulla")
+        elif self.vad.end_of_speech_latency is not None:
+          self.end_of_speech_latency = self.vad.end_of_speech_latency
+          print(f"Fine del parlato rilevata in {self.end_of_speech_latency * 1000:.0f} ms")
       except Exception as e:
         print(f"Recording error: {e}")
+      # fine della registrazione: il thread di trascrizione può svuotare la coda e terminare
+      self.is_recording = False
+    
+    def enqueue_segments(self, segments):
+      for segment in segments:
+        try:
+          self.audio_queue.put_nowait(segment)
+        except:
+          pass
         
-    """ Funzione che si occupa della trascrizione dei dati audio passati presenti nella
-        audio_queue. Riprendere e verificare questi concetti!!!"""
+    """ True se il segmento non contiene parlato: nessun frame supera la soglia di
+        apertura del VAD sopra il rumore di fondo, oppure, senza stima del rumore, il
+        picco resta sotto silence_threshold."""
+    def is_silent(self, audio_data) -> bool:
+      if not len(audio_data):
+        return True
+      if self.noise_floor is None:
+        return np.max(np.abs(audio_data)) < self.silence_threshold
+      return np.max(frame_rms(audio_data, self.vad.frame_length)) < self.noise_floor.on_threshold()
+    
+    """ Sottrazione spettrale facoltativa e guadagno: l'audio che arriva a whisper."""
+    def prepare(self, audio_data):
+      if self.denoiser is not None:
+        audio_data = self.denoiser.apply(audio_data)
+      if self.gain is not None:
+        audio_data = self.gain.apply(audio_data)
+      self.stt_audio_seconds += len(audio_data) / self.target_rate
+      return audio_data
+    
+    """ Trascrive un singolo segmento a 16kHz preso dalla audio_queue: è il percorso di
+        transcribe_next e di transcribe_next_batch quando il batch contiene un solo
+        segmento. I segmenti silenziosi non arrivano al modello e restituiscono None."""
     def transcribe_audio(self, audio_data):
       try:
-        # se i dati audio sono inferiori ad una data cifra in valore assoluto
-        if np.max(np.abs(audio_data)) < self.silence_threshold:
+        # segmento senza parlato: whisper trascriverebbe solo rumore
+        if self.is_silent(audio_data):
+          self.skipped_segments += 1
           return None
 
-        inputs = self.processor(audio_data, sampling_rate=16000, return_tensors="pt", return_attention_mask=True)
-        with torch.no_grad():
-          
-          predicted_ids = self.model.generate(
-            inputs["input_features"],
-            language="italian",
-            task="transcribe",
-            max_new_tokens=443, # limita il numero di token delle risposte
-            do_sample=False, # generazione deterministica e non stocastica
-            num_beams=3
-          )
-          
-          transcription = self.processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-          return transcription.strip()
+        with self.tracer.stage("stt"):
+          return self.stt.transcribe(self.prepare(audio_data))
+      except Exception as e:
+        print(f"Transcription error: {e}")
+    
+    """ Trascrive un gruppo di segmenti con una sola chiamata al modello. I segmenti
+        silenziosi vengono saltati come in transcribe_audio e restituiscono None."""
+    def transcribe_batch(self, segments: list) -> list:
+      results = [None] * len(segments)
+      try:
+        voiced = [i for i, audio in enumerate(segments) if not self.is_silent(audio)]
+        self.skipped_segments += len(segments) - len(voiced)
+        with self.tracer.stage("stt"):
+          texts = self.stt.transcribe_batch([self.prepare(segments[i]) for i in voiced])
+        for i, text in zip(voiced, texts):
+          results[i] = text
       except Exception as e:
         print(f"Transcription error: {e}")
+      return results
+    
+    """ Statistiche dell'ultima decodifica, una per segmento: secondi di decodifica (la
+        quota del segmento nel batch, batch_seconds per l'intera chiamata), token generati, temperatura usata, numero di fallback e fermate della guardia
+        sulle ripetizioni."""
+    @property
+    def decode_stats(self) -> list:
+      return self.stt.last_stats if self.stt is not None else []
+    
+    """ Esegue una trascrizione a vuoto su un secondo di silenzio per inizializzare
+        kernel e allocatori di torch, così la prima richiesta reale non paga il warm-up.
+        Il controllo sul silenzio di transcribe_audio viene saltato di proposito."""
+    def warmup(self, seconds: float = 1.0):
+      start = time.perf_counter()
+      self.stt.transcribe(np.zeros(int(self.target_rate * seconds), dtype=np.float32))
+      self.warmup_time = time.perf_counter() - start
+      return self.warmup_time
         
         
     """ Funzione che verifica la presenza di byte all'interno della audio_queue
@@ -158,43 +287,106 @@ class AerisEars:
     def process_audio_queue(self):
       self.transcribed_parts = []
       
+      if self.streaming:
+        transcript = self.transcribe_stream()
+        if transcript:
+          self.transcribed_parts.append(transcript)
+        return
+      
       while self.is_recording or not self.audio_queue.empty():
         try:
           
-          transcript = self.resample_audio()  
-          
-          if transcript and transcript.strip():
-            self.transcribed_parts.append(transcript)
+          # i segmenti accumulati mentre il modello era occupato vengono decodificati insieme
+          for transcript in self.transcribe_next_batch():
+            if transcript and transcript.strip():
+              self.transcribed_parts.append(transcript)
             
-          self.audio_queue.task_done()
+        except Empty:
+          # il VAD non ha ancora chiuso un segmento
+          continue
         except Exception as e:
           print(f"Processing error: {e}")
           break
-      while not self.audio_queue.empty():
+        
+    """ Trascrizione in streaming: i segmenti chiusi dal VAD e il parlato ancora in corso
+        vengono passati a StreamingTranscriber ogni stream_step_seconds, che emette le
+        ipotesi parziali tramite on_hypothesis(confermato, provvisorio, finale).
+        Restituisce la trascrizione finale appena termina la registrazione."""
+    def transcribe_stream(self, on_hypothesis=None):
+      transcriber = StreamingTranscriber(
+        self.transcribe_audio,
+        sample_rate=self.target_rate,
+        step_seconds=self.stream_step_seconds,
+        on_hypothesis=on_hypothesis
+      )
+      while self.is_recording or not self.audio_queue.empty():
         try:
-          transcript = self.resample_audio()
-          if transcript and transcript.strip():
-            self.transcribed_parts.append(transcript)
-        except:
+          transcriber.append(self.audio_queue.get(timeout=self.stream_step_seconds / 4))
+          self.audio_queue.task_done()
+        except Empty:
+          pass
+        try:
+          transcriber.update(self.vad.open_segment())
+          transcriber.step()
+        except Exception as e:
+          print(f"Processing error: {e}")
           break
-        
-    def resample_audio(self):
+      
+      transcript = transcriber.finish()
+      print(f"Trascrizione finale pronta in {transcriber.final_latency * 1000:.0f} ms ({transcriber.passes} passaggi)")
+      return transcript.strip()
+    
+    """ Preleva dalla coda il prossimo blocco, già a 16kHz, e lo trascrive."""
+    def transcribe_next(self):
       audio_data = self.audio_queue.get(timeout=1)
-      audio_resampled = librosa.resample(audio_data, orig_sr=44100, target_sr=16000)
-      return self.transcribe_audio(audio_resampled)
+      return self.transcribe_audio(audio_data)
+    
+    """ Aspetta il prossimo segmento chiuso dal VAD (Empty dopo un secondo), preleva anche
+        quelli già in coda fino a batch_size e, se la registrazione è in corso, aspetta al
+        massimo batch_wait secondi per completare il batch. Un segmento solo passa da
+        transcribe_audio, più segmenti da transcribe_batch con una sola chiamata al modello.
+        Restituisce le trascrizioni nell'ordine dei segmenti, None per quelli silenziosi."""
+    def transcribe_next_batch(self) -> list:
+      segments = [self.audio_queue.get(timeout=1)]
+      self.tracer.queue_depth("audio_queue", self.audio_queue.qsize() + 1)
+      deadline = time.monotonic() + self.batch_wait
+      while len(segments) < self.batch_size:
+        try:
+          remaining = deadline - time.monotonic()
+          if remaining > 0 and self.is_recording:
+            segments.append(self.audio_queue.get(timeout=remaining))
+          else:
+            segments.append(self.audio_queue.get_nowait())
+        except Empty:
+          break
+      for _ in segments:
+        self.audio_queue.task_done()
+      if len(segments) == 1:
+        return [self.transcribe_audio(segments[0])]
+      return self.transcribe_batch(segments)
       
     """ Funzione che inizializza l'audio thread per catturare l'audio del microfono
-         e il thread che processa la coda audio."""  
-    def start_recording(self, device_index = 0):
+         e il thread che processa la coda audio. Il motore di cattura viene creato solo
+         se non ne è stato passato uno condiviso. Se è presente un preroll (audio a 16kHz
+         precedente alla rilevazione) viene passato per primo al VAD. no_speech_timeout
+         cambia per questa registrazione l'attesa massima del parlato."""  
+    def start_recording(self, device_index = 0, start_at = None, preroll = None, no_speech_timeout = None):
       # se stai già registrando o non c'è modello salta 
       if self.is_recording or self.model is None:
         return
       
+      self._preroll = preroll
+      self._no_speech_timeout = no_speech_timeout
+      
+      if self.capture is None:
+        self.capture = CaptureEngine(device_index=device_index, sample_rate=self.sample_rate)
+      self.capture.start()
+      
       self.is_recording = True
       
       self.audio_thread = threading.Thread(
         target=self.record_audio_chunk,
-        args=(device_index, ),
+        args=(start_at, ),
         daemon=True
       )
       self.processing_thread = threading.Thread(
@@ -207,8 +399,8 @@ class AerisEars:
       self.processing_thread.start()
       
       try:
-        while self.is_recording:
-          time.sleep(1)
+        # il thread di trascrizione termina dopo la fine della registrazione e lo svuotamento della coda
+        self.processing_thread.join()
       except KeyboardInterrupt:
         self.stop_recording()
         
@@ -228,6 +420,20 @@ class AerisEars:
         # aspetta finché il thread non termina
         self.processing_thread.join(timeout=1)
       
+      self.release_capture()
+    
+    """ Chiude il motore di cattura se è stato aperto da AerisEars: uno condiviso con la
+        wakeword resta a chi lo ha creato. Va chiamata anche quando non si sta registrando,
+        altrimenti lo stream di PyAudio e il thread della callback restano vivi."""
+    def release_capture(self):
+      if self._owns_capture and self.capture:
+        self.capture.stop()
+        self.capture = None
         
-
-      
+    """ Ferma la registrazione, chiude il motore di cattura aperto da AerisEars e, se la
+        trascrizione gira in un processo separato, il worker."""
+    def close(self):
+      self.stop_recording()
+      self.release_capture()
+      if isinstance(self.stt, SttWorker):
+        self.stt.close()
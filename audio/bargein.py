@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+from typing import Callable
+import numpy as np
+
+
+class BargeInMonitor:
+    """ Ascolta il microfono condiviso mentre l'assistente parla per permettere all'utente
+        di interromperlo. Con trigger="wakeword" i blocchi catturati durante la riproduzione
+        passano al rilevatore della wakeword, con trigger="vad" basta parlare per almeno
+        min_speech_ms.
+
+        Soppressione dell'eco: l'energia del microfono viene confrontata con il livello del
+        segnale riprodotto dal player moltiplicato per l'accoppiamento stimato tra altoparlante
+        e microfono. Solo l'energia in eccesso conta come voce dell'utente: in quel caso
+        l'uscita viene abbassata (ducking) e una wakeword rilevata viene accettata. Una
+        wakeword pronunciata dall'assistente stesso, senza voce dell'utente, viene ignorata."""
+    def __init__(self,
+                 wakeword,
+                 capture,
+                 player,
+                 trigger: str = "wakeword",
+                 duck_gain: float = 0.3,
+                 duck_hold: float = 1.0,
+                 margin: float = 2.0,
+                 noise_floor: float = 0.01,
+                 min_speech_ms: int = 200):
+        if trigger not in ("wakeword", "vad"):
+            raise ValueError(f"Trigger di barge-in sconosciuto: {trigger}")
+        self.wakeword = wakeword
+        self.capture = capture
+        self.player = player
+        self.trigger = trigger
+        self.duck_gain = duck_gain
+        self.duck_hold = duck_hold # secondi di ducking dopo l'ultimo blocco di voce dell'utente
+        self.margin = margin
+        self.noise_floor = noise_floor
+        self.min_speech = min_speech_ms / 1000
+
+        self.reader = None
+        self.thread = None
+        self.running = False
+        self.on_barge_in = None
+
+        # posizione nel buffer di cattura da cui far ripartire la registrazione e audio precedente
+        self.start_at = None
+        self.preroll_audio = None
+
+        # ultimi blocchi elaborati (posizione finale, blocco), per recuperare l'inizio del parlato
+        self.history = deque(maxlen=64)
+
+        # latenze interruzione -> silenzio, in secondi
+        self.latencies = []
+        self.reset()
+
+    def reset(self):
+        self.coupling = 1.0 # rapporto RMS microfono / riferimento quando c'è solo eco
+        self.talk_start = None
+        self.talk_position = None
+        self.last_talk = None
+        self.start_at = None
+        self.preroll_audio = None
+        self.history.clear()
+        if self.trigger == "wakeword":
+            self.wakeword.reset()
+
+    """ Elabora un blocco int16 catturato durante la riproduzione. position è la posizione
+        assoluta della fine del blocco nel buffer di cattura. Restituisce True se l'utente
+        vuole interrompere l'assistente."""
+    def process(self, block, position: int) -> bool:
+        now = time.perf_counter()
+        self.history.append((position, block))
+        level = float(np.sqrt(np.mean(np.square(block / 32768.0))))
+        reference = self.player.reference_level()
+
+        talking = level > self.coupling * reference * self.margin + self.noise_floor
+        if talking:
+            if self.talk_start is None:
+                self.talk_start = now
+                self.talk_position = position - len(block)
+            self.last_talk = now
+            self.player.duck(self.duck_gain)
+        else:
+            self.talk_start = None
+            if reference > 0.02:
+                # solo eco: aggiorna la stima dell'accoppiamento
+                self.coupling += 0.05 * (level / reference - self.coupling)
+            if self.last_talk is not None and now - self.last_talk > self.duck_hold:
+                self.player.duck(1.0)
+
+        if self.trigger == "vad":
+            if talking and now - self.talk_start >= self.min_speech:
+                self.start_at = self.talk_position
+                return True
+            return False
+
+        if not self.wakeword.detect(block, position):
+            return False
+        if self.last_talk is None or now - self.last_talk > self.duck_hold:
+            return False # wakeword nell'eco della risposta
+        self.start_at = self.wakeword.detected_at
+        self.preroll_audio = self.wakeword.preroll_audio
+        return True
+
+    """ Blocchi già elaborati che terminano dopo position, da passare alla registrazione
+        quando non si può rileggere il buffer di cattura."""
+    def blocks_since(self, position: int) -> list:
+        if position is None:
+            return []
+        return [block for end, block in self.history if end > position]
+
+    """ Ferma la riproduzione ed esegue cancel (sintesi e modello), poi misura il tempo
+        fino al primo buffer di silenzio più la latenza di uscita del dispositivo."""
+    def interrupt(self, cancel: Callable = None):
+        start = time.perf_counter()
+        self.player.stop()
+        if cancel:
+            cancel()
+        latency = None
+        if self.player.silenced.wait(0.5):
+            latency = self.player.silence_time - start + self.player.output_latency
+            print(f"[BARGE-IN] silenzio dopo {latency * 1000:.0f} ms")
+        self.latencies.append(latency)
+        return latency
+
+    """ Avvia l'ascolto in un thread dal campione corrente; alla rilevazione interrompe
+        il player e chiama on_barge_in."""
+    def start(self, on_barge_in: Callable = None):
+        if self.running:
+            return
+        self.reset()
+        self.on_barge_in = on_barge_in
+        self.reader = self.capture.reader()
+        self.running = True
+        self.thread = threading.Thread(target=self._listen_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        self.player.duck(1.0)
+
+    def _listen_loop(self):
+        block_size = self.wakeword.resampler.block_size if self.trigger == "wakeword" else 1411
+        while self.running:
+            pcm = self.reader.read(block_size, timeout=0.5)
+            if pcm is None:
+                if self.reader.ring.closed:
+                    break
+                continue
+            try:
+                if self.process(pcm, self.reader.position):
+                    self.running = False
+                    self.interrupt(self.on_barge_in)
+                    return
+            except Exception as e:
+                print(f"Errore nel barge-in: {e}")
+                return
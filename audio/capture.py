@@ -0,0 +1,213 @@
+import threading
+import time
+import numpy as np
+from metrics.resources import get_resources
+from runtime.config import RuntimeConfig
+
+
+class AudioRing:
+    """ Buffer circolare int16 preallocato con un solo scrittore (la callback di PyAudio)
+        e più lettori. Lo scrittore copia i campioni e solo dopo avanza il contatore assoluto
+        `written`, quindi i lettori non hanno bisogno di un lock per leggere: gli basta
+        confrontare la propria posizione con `written`."""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.written = 0 # numero totale di campioni scritti dall'avvio
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.written += n
+
+        # la callback audio non deve mai bloccarsi: se un lettore tiene il lock
+        # la notifica viene saltata e il lettore se ne accorge al prossimo timeout breve
+        if self._cond.acquire(blocking=False):
+            self._cond.notify_all()
+            self._cond.release()
+
+    def close(self):
+        self.closed = True
+        with self._cond:
+            self._cond.notify_all()
+
+    """ Attende finché il contatore di scrittura non raggiunge position."""
+    def wait_for(self, position: int, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.written < position and not self.closed:
+                step = 0.05
+                if deadline is not None:
+                    step = min(step, deadline - time.monotonic())
+                    if step <= 0:
+                        return False
+                self._cond.wait(step)
+        return self.written >= position
+
+    """ Copia i campioni [start, start + n). Il chiamante deve aver verificato che siano
+        già stati scritti e non ancora sovrascritti."""
+    def copy(self, start: int, n: int) -> np.ndarray:
+        begin = start % self.capacity
+        first = min(n, self.capacity - begin)
+        if first == n:
+            return self.buffer[begin:begin + n].copy()
+        return np.concatenate((self.buffer[begin:], self.buffer[:n - first]))
+
+    """ Come copy ma senza allocazioni: una vista sul buffer se i campioni sono contigui,
+        altrimenti le due parti vengono copiate in out (lungo almeno n)."""
+    def view(self, start: int, n: int, out: np.ndarray) -> np.ndarray:
+        begin = start % self.capacity
+        first = min(n, self.capacity - begin)
+        if first == n:
+            return self.buffer[begin:begin + n]
+        out[:first] = self.buffer[begin:]
+        out[first:n] = self.buffer[:n - first]
+        return out[:n]
+
+
+class RingReader:
+    """ Lettore con un proprio offset sul buffer circolare. Se resta indietro di più
+        della capacità del buffer salta in avanti e conta i campioni persi."""
+    def __init__(self, ring: AudioRing, start: int = None):
+        self.ring = ring
+        self.position = ring.written if start is None else start
+        self.dropped = 0
+        self._scratch = np.zeros(0, dtype=np.int16) # usato da view quando i campioni attraversano la fine del buffer
+        self._clamp()
+
+    def _clamp(self):
+        oldest = self.ring.written - self.ring.capacity
+        if self.position < oldest:
+            self.dropped += oldest - self.position
+            self.position = oldest
+        if self.position < 0:
+            self.position = 0
+
+    @property
+    def available(self) -> int:
+        return self.ring.written - self.position
+
+    """ Restituisce esattamente n campioni int16, bloccando finché non sono disponibili.
+        Restituisce None in caso di timeout o se il motore di cattura è stato fermato."""
+    def read(self, n: int, timeout: float = None):
+        if not self.ring.wait_for(self.position + n, timeout):
+            return None
+        self._clamp()
+        start = self.position
+        data = self.ring.copy(start, n)
+        # se nel frattempo lo scrittore ha superato la nostra finestra i dati sono corrotti
+        if self.ring.written - self.ring.capacity > start:
+            self.dropped += n
+        self.position = start + n
+        return data
+
+    """ Come read ma senza copia, per chi elabora i campioni subito senza conservarli
+        (resampler, rilevatore, VAD). Restituisce una vista int16 sul buffer circolare,
+        valida finché lo scrittore non la sovrascrive (capacity campioni più tardi), o,
+        quando i campioni attraversano la fine del buffer, un buffer del lettore riusato
+        alla chiamata successiva."""
+    def view(self, n: int, timeout: float = None):
+        if not self.ring.wait_for(self.position + n, timeout):
+            return None
+        self._clamp()
+        if len(self._scratch) < n:
+            self._scratch = np.zeros(n, dtype=np.int16)
+        start = self.position
+        data = self.ring.view(start, n, self._scratch)
+        self.position = start + n
+        return data
+
+
+class CaptureEngine:
+    """ Servizio di cattura unico e sempre attivo: apre una sola volta PyAudio e uno
+        stream in modalità callback che scrive nel buffer circolare. Il rilevatore della
+        wakeword e il registratore leggono lo stesso microfono con lettori indipendenti,
+        quindi tra "Hey Aeris" e la registrazione non si riapre mai il dispositivo."""
+    def __init__(self,
+                 device_index: int = 1,
+                 sample_rate: int = 44100,
+                 frames_per_buffer: int = 1024,
+                 buffer_seconds: float = 10.0,
+                 cpu: int = None):
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.ring = AudioRing(int(sample_rate * buffer_seconds))
+
+        self.pa = None
+        self.stream = None
+        self.overflows = 0 # callback segnalate da PyAudio con paInputOverflow
+
+        # costanti di PyAudio lette in start(): il modulo viene importato solo all'apertura
+        # del microfono, così chi usa una sorgente diversa (ad esempio un file) non ne ha bisogno
+        self._input_overflow = 0
+        self._continue = None
+
+        # core su cui fissare il thread della callback (creato da PortAudio, quindi
+        # viene fissato dalla prima callback); None lo lascia libero
+        self.cpu = cpu
+        self._pinned = cpu is None
+
+    @property
+    def is_running(self) -> bool:
+        return self.stream is not None
+
+    """ Posizione assoluta (in campioni) dell'ultimo campione catturato."""
+    @property
+    def position(self) -> int:
+        return self.ring.written
+
+    def start(self):
+        if self.stream is not None:
+            return
+        with get_resources().imports("cattura"):
+            import pyaudio
+        self.ring.closed = False
+        self._input_overflow = pyaudio.paInputOverflow
+        self._continue = pyaudio.paContinue
+        self.pa = pyaudio.PyAudio()
+        config = {
+            'format' : pyaudio.paInt16,
+            'channels' : 1,
+            'rate' : self.sample_rate,
+            'frames_per_buffer' : self.frames_per_buffer,
+            'input' : True,
+            'stream_callback' : self._callback
+        }
+        if self.device_index is not None:
+            config['input_device_index'] = self.device_index
+        self.stream = self.pa.open(**config)
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+        self.ring.close()
+
+    """ Crea un lettore che parte dalla posizione assoluta start (di default: adesso)."""
+    def reader(self, start: int = None) -> RingReader:
+        return RingReader(self.ring, start)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if not self._pinned:
+            self._pinned = True
+            RuntimeConfig.pin_current_thread(self.cpu)
+        if status & self._input_overflow:
+            self.overflows += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return (None, self._continue)
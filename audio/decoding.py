@@ -0,0 +1,114 @@
+import math
+import zlib
+import numpy as np
+
+
+class DecodingPolicy:
+    """ Politica di decodifica di whisper. Di default la decodifica è greedy e viene
+        ripetuta a temperature crescenti solo per i segmenti con log-probabilità media
+        troppo bassa o rapporto di compressione troppo alto (testo ripetitivo), come
+        nell'implementazione originale di whisper. max_new_tokens cresce con la durata
+        della clip invece di essere fisso a 443 e una guardia sulle ripetizioni ferma
+        la generazione appena il modello entra in un ciclo."""
+    def __init__(self,
+                 temperatures: tuple = (0.0, 0.2, 0.4, 0.6, 0.8),
+                 logprob_threshold: float = -1.0,
+                 compression_ratio_threshold: float = 2.4,
+                 num_beams: int = 1,
+                 tokens_per_second: float = 12.0,
+                 min_new_tokens: int = 24,
+                 max_new_tokens: int = 443,
+                 repeat_ngram: int = 4,
+                 repeat_span: int = 8):
+        self.temperatures = temperatures
+        self.logprob_threshold = logprob_threshold
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.num_beams = num_beams
+        self.tokens_per_second = tokens_per_second
+        self.min_new_tokens = min_new_tokens
+        self.max_new_tokens = max_new_tokens
+        self.repeat_ngram = repeat_ngram # n-grammi controllati dalla guardia, 0 la disattiva
+        self.repeat_span = repeat_span # token ripetuti consecutivi che fermano la generazione
+
+    """ Comportamento precedente: beam search a 3 fasci, 443 token, nessun fallback."""
+    @classmethod
+    def beam_search(cls):
+        return cls(temperatures=(0.0,), logprob_threshold=None, compression_ratio_threshold=None,
+                   num_beams=3, tokens_per_second=0, min_new_tokens=443, repeat_ngram=0)
+
+    def max_tokens(self, seconds: float) -> int:
+        return min(self.max_new_tokens, self.min_new_tokens + math.ceil(self.tokens_per_second * seconds))
+
+    def needs_fallback(self, avg_logprob: float, compression_ratio: float) -> bool:
+        if self.logprob_threshold is not None and avg_logprob < self.logprob_threshold:
+            return True
+        return self.compression_ratio_threshold is not None and compression_ratio > self.compression_ratio_threshold
+
+
+POLICIES = {
+    "greedy": DecodingPolicy,
+    "beam": DecodingPolicy.beam_search
+}
+
+
+def get_policy(name: str) -> DecodingPolicy:
+    if name not in POLICIES:
+        raise ValueError(f"Politica di decodifica sconosciuta: {name} (disponibili: {', '.join(POLICIES)})")
+    return POLICIES[name]()
+
+
+""" Rapporto tra la lunghezza del testo e quella compressa: le allucinazioni ripetitive
+    di whisper si comprimono molto e superano 2.4."""
+def compression_ratio(text: str) -> float:
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+""" Righe di ids (matrice batch x token generati finora) che terminano con lo stesso
+    n-gramma (n <= ngram) ripetuto fino a coprire span posizioni: ad esempio 8 volte lo
+    stesso token o 3 volte lo stesso trigramma. Le righe che contengono già eos sono
+    finite e il resto è riempimento con eos: non vengono mai segnalate, così in un batch
+    il riempimento non sembra una ripetizione."""
+def repeated_rows(ids: np.ndarray, ngram: int, span: int, eos_token_id: int = None) -> np.ndarray:
+    done = np.zeros(ids.shape[0], dtype=bool)
+    for n in range(1, ngram + 1):
+        repeats = max(3, math.ceil(span / n))
+        if ids.shape[1] < n * repeats:
+            break
+        tail = ids[:, -n * repeats:].reshape(ids.shape[0], repeats, n)
+        done |= (tail == tail[:, :1]).all(axis=2).all(axis=1)
+    if eos_token_id is not None:
+        done &= ~(ids == eos_token_id).any(axis=1)
+    return done
+
+
+""" Token di testo di una sequenza generata: solo quelli prima del primo eos e senza i
+    token speciali di whisper (prompt, timestamp), che hanno id >= eos."""
+def text_tokens(ids: list, eos_token_id: int) -> list:
+    if eos_token_id in ids:
+        ids = ids[:ids.index(eos_token_id)]
+    return [token for token in ids if token < eos_token_id]
+
+
+""" Divide il tempo di una chiamata a batch tra i segmenti in proporzione alla loro
+    durata: dare a ogni segmento il tempo dell'intero batch gonfierebbe il real-time
+    factor calcolato dalle statistiche di un fattore pari alla dimensione del batch."""
+def split_batch_time(durations: list, elapsed: float) -> list:
+    total = sum(durations)
+    if total <= 0:
+        return [elapsed / len(durations)] * len(durations) if durations else []
+    return [elapsed * seconds / total for seconds in durations]
+
+
+""" Toglie dalla coda dei token le ripetizioni lasciate dalla guardia, tenendo una sola
+    occorrenza dell'n-gramma ripetuto."""
+def trim_repeats(tokens: list, ngram: int) -> list:
+    trimmed = True
+    while trimmed:
+        trimmed = False
+        for n in range(1, ngram + 1):
+            if len(tokens) >= 2 * n and tokens[-n:] == tokens[-2 * n:-n]:
+                tokens = tokens[:-n]
+                trimmed = True
+                break
+    return tokens
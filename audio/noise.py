@@ -0,0 +1,139 @@
+import numpy as np
+
+
+class NoiseFloor:
+    """ Stima adattiva del rumore di fondo: un percentile mobile (percentile, di default
+        il 15°) dell'RMS per frame in dB, aggiornato con un passo per frame come un
+        quantile stocastico: sale di rate * p dB se il frame è sopra la stima e scende di
+        rate * (1 - p) dB se è sotto. All'equilibrio una quota p dei frame sta sotto la
+        stima, con costo e memoria O(1) per frame. Scende in fretta quando il rumore cala
+        e sale lentamente, così il parlato non alza il pavimento.
+
+        Le soglie del VAD stanno on_db e off_db sopra la stima, mai sotto min_on e
+        min_off: in una stanza silenziosa basta una voce sommessa, in una rumorosa il
+        rumore resta sotto la soglia e il turno si chiude."""
+    def __init__(self,
+                 percentile: float = 0.15,
+                 rate_db: float = 1.0,
+                 on_db: float = 8.0,
+                 off_db: float = 4.0,
+                 min_on: float = 0.004,
+                 min_off: float = 0.002,
+                 initial: float = None):
+        self.p = percentile
+        self.rate_db = rate_db
+        self.on_ratio = 10 ** (on_db / 20)
+        self.off_ratio = 10 ** (off_db / 20)
+        self.min_on = min_on
+        self.min_off = min_off
+        self.estimate_db = None if initial is None else 20 * np.log10(initial)
+        self.frames = 0
+
+    """ RMS del rumore di fondo (0-1), None prima del primo frame."""
+    @property
+    def level(self):
+        return None if self.estimate_db is None else 10 ** (self.estimate_db / 20)
+
+    """ Aggiorna la stima con l'RMS di ogni frame e restituisce le soglie di apertura e
+        chiusura valide per ciascun frame (la stima prima del frame stesso)."""
+    def track(self, rms: np.ndarray):
+        db = 20 * np.log10(np.maximum(rms, 1e-5))
+        floors = np.empty(len(db))
+        estimate = self.estimate_db
+        up, down = self.rate_db * self.p, self.rate_db * (1 - self.p)
+        for i, value in enumerate(db.tolist()):
+            if estimate is None:
+                estimate = value
+            floors[i] = estimate
+            estimate = estimate + up if value > estimate else estimate - down
+        self.estimate_db = estimate
+        self.frames += len(db)
+        floors = 10 ** (floors / 20)
+        return np.maximum(floors * self.on_ratio, self.min_on), np.maximum(floors * self.off_ratio, self.min_off)
+
+    """ Soglia di apertura attuale, usata per decidere se un segmento contiene parlato."""
+    def on_threshold(self) -> float:
+        level = self.level
+        return self.min_on if level is None else max(level * self.on_ratio, self.min_on)
+
+
+""" RMS di ogni frame da frame_length campioni (il resto finale è ignorato)."""
+def frame_rms(audio: np.ndarray, frame_length: int = 320) -> np.ndarray:
+    count = len(audio) // frame_length
+    if not count:
+        return np.sqrt(np.mean(np.square(audio), keepdims=True)) if len(audio) else np.zeros(1)
+    frames = audio[:count * frame_length].reshape(count, frame_length)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+class GainNormalizer:
+    """ Controllo automatico del guadagno dei segmenti mandati a whisper: porta il livello
+        del parlato (il percentile speech_percentile dell'RMS per frame, così le pause non
+        contano) a target_rms, con un guadagno tra -max_cut_db e +max_gain_db, e limita i
+        picchi a [-1, 1]. Una voce lontana o sommessa arriva al modello come una vicina."""
+    def __init__(self,
+                 target_rms: float = 0.08,
+                 max_gain_db: float = 20.0,
+                 max_cut_db: float = 12.0,
+                 speech_percentile: float = 90,
+                 frame_length: int = 320):
+        self.target_rms = target_rms
+        self.max_gain = 10 ** (max_gain_db / 20)
+        self.min_gain = 10 ** (-max_cut_db / 20)
+        self.speech_percentile = speech_percentile
+        self.frame_length = frame_length
+        self.last_gain = 1.0
+
+    def apply(self, audio: np.ndarray) -> np.ndarray:
+        level = float(np.percentile(frame_rms(audio, self.frame_length), self.speech_percentile))
+        if level <= 0:
+            return audio
+        self.last_gain = min(max(self.target_rms / level, self.min_gain), self.max_gain)
+        out = np.multiply(audio, np.float32(self.last_gain), dtype=np.float32)
+        return np.clip(out, -1.0, 1.0, out=out)
+
+
+class SpectralDenoiser:
+    """ Sottrazione spettrale facoltativa prima di whisper. Lo spettro del rumore è il
+        percentile noise_percentile del modulo di ogni bin su tutti i frame STFT del
+        segmento (statistica dei minimi: il parlato occupa ogni bin solo per una parte
+        del tempo), quindi non serve un profilo del rumore registrato a parte. Il modulo
+        viene ridotto di over_subtraction volte il rumore, senza scendere sotto floor
+        volte l'originale per limitare il rumore musicale, e il segnale viene ricostruito
+        con la fase originale. STFT e overlap-add sono vettoriali su tutti i frame:
+        finestra radice di Hann in analisi e sintesi con sovrapposizione del 50%, che
+        ricostruisce esattamente il segnale dove non si sottrae nulla."""
+    def __init__(self,
+                 n_fft: int = 512,
+                 noise_percentile: float = 20,
+                 over_subtraction: float = 1.5,
+                 floor: float = 0.1):
+        self.n_fft = n_fft
+        self.hop = n_fft // 2
+        self.noise_percentile = noise_percentile
+        self.over_subtraction = over_subtraction
+        self.floor = floor
+        self.window = np.sqrt(np.hanning(n_fft + 1)[:-1]).astype(np.float32) # Hann periodica
+
+    def apply(self, audio: np.ndarray) -> np.ndarray:
+        n, hop = len(audio), self.hop
+        count = -(-n // hop) + 1 # frame necessari a coprire il segnale con mezzo frame di bordo
+        if count < 4:
+            return audio # troppo corto per stimare il rumore
+        padded = np.zeros((count + 1) * hop, dtype=np.float32)
+        padded[hop:hop + n] = audio
+        # frame i = padded[i*hop : i*hop + n_fft], ottenuti affiancando le due metà
+        halves = padded.reshape(count + 1, hop)
+        frames = np.concatenate((halves[:-1], halves[1:]), axis=1) * self.window
+
+        spectrum = np.fft.rfft(frames, axis=1)
+        magnitude = np.abs(spectrum)
+        noise = np.percentile(magnitude, self.noise_percentile, axis=0)
+        cleaned = np.maximum(magnitude - self.over_subtraction * noise, self.floor * magnitude)
+        spectrum *= cleaned / np.maximum(magnitude, 1e-10)
+        frames = np.fft.irfft(spectrum, n=self.n_fft, axis=1).astype(np.float32) * self.window
+
+        out = np.zeros((count + 1) * hop, dtype=np.float32)
+        out[:count * hop] += frames[:, :hop].reshape(-1)
+        out[hop:] += frames[:, hop:].reshape(-1)
+        return out[hop:hop + n]
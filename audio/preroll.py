@@ -0,0 +1,52 @@
+import numpy as np
+
+
+class PreRollBuffer:
+    """ Buffer circolare preallocato che conserva sempre gli ultimi `seconds` secondi
+        di PCM a 16kHz. Viene riempito con i frame già ricampionati per porcupine, quindi
+        non costa nessun resampling aggiuntivo: al momento della rilevazione il suo
+        contenuto diventa il primo segmento passato alla trascrizione."""
+    def __init__(self, seconds: float = 0.5, sample_rate: int = 16000):
+        self.seconds = seconds
+        self.sample_rate = sample_rate
+        self.capacity = max(int(seconds * sample_rate), 0)
+        self.buffer = np.zeros(self.capacity, dtype=np.int16)
+        self.written = 0
+
+    """ Memoria occupata dal buffer, in byte."""
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes
+
+    def clear(self):
+        self.written = 0
+
+    def write(self, frame: np.ndarray):
+        if not self.capacity:
+            return
+        n = len(frame)
+        if n > self.capacity:
+            # dei frame più lunghi del buffer restano solo gli ultimi campioni, scritti
+            # come un frame normale così restano allineati a written
+            frame = frame[-self.capacity:]
+            self.written += n - self.capacity
+            n = self.capacity
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = frame[:first]
+        if first < n:
+            self.buffer[:n - first] = frame[first:]
+        self.written += n
+
+    """ Restituisce, in ordine cronologico, il contenuto del buffer convertito
+        in float32 normalizzato in [-1; 1] come si aspetta whisper."""
+    def snapshot(self) -> np.ndarray:
+        n = min(self.written, self.capacity)
+        if not n:
+            return np.zeros(0, dtype=np.float32)
+        end = self.written % self.capacity
+        if n < self.capacity:
+            ordered = self.buffer[:n]
+        else:
+            ordered = np.concatenate((self.buffer[end:], self.buffer[:end]))
+        return ordered.astype(np.float32) / 32768.0
@@ -0,0 +1,153 @@
+import numpy as np
+from math import gcd, ceil
+
+
+class StreamingResampler:
+    """ Resampler polifase con stato. Il filtro passa-basso viene progettato una
+        sola volta nel costruttore e la storia dei campioni di ingresso viene
+        mantenuta tra un blocco e l'altro, quindi i blocchi letti dal microfono
+        possono avere qualsiasi lunghezza senza introdurre discontinuità ai bordi."""
+    def __init__(self,
+                 orig_sr: int = 44100,
+                 target_sr: int = 16000,
+                 zero_crossings: int = 8,
+                 beta: float = 8.6):
+        g = gcd(orig_sr, target_sr)
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up = target_sr // g      # 160 per 44.1kHz -> 16kHz
+        self.down = orig_sr // g      # 441 per 44.1kHz -> 16kHz
+
+        # filtro sinc finestrato (Kaiser) alla frequenza sovracampionata orig_sr * up
+        cutoff = 0.5 / max(self.up, self.down)
+        self.taps = int(ceil(2 * zero_crossings * max(self.up, self.down) / self.up))
+        n = self.taps * self.up
+        t = np.arange(n) - (n - 1) / 2.0
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, beta)
+        h *= self.up / h.sum() # guadagno unitario per ogni fase
+
+        """ Scomposizione polifase: phases[p, k] = h[p + k*up]. Le colonne sono invertite
+            così che ogni uscita sia un prodotto scalare con una finestra crescente di ingresso."""
+        self._phases = np.ascontiguousarray(
+            h.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32
+        )
+        # buffer preallocati: storia + blocco corrente, e buffer di lavoro per gli indici,
+        # le finestre di ingresso, i coefficienti e l'uscita, riusati ad ogni blocco
+        self._buffer = np.zeros(self.taps - 1 + 4096, dtype=np.float32)
+        self._scratch(512)
+        self._t = 0 # posizione della prossima uscita, in unità sovracampionate, rispetto al blocco corrente
+
+    """ Latenza introdotta dal filtro, in campioni di uscita."""
+    @property
+    def delay(self):
+        return (self.taps * self.up - 1) / 2.0 / self.down
+
+    def reset(self):
+        self._buffer[:self.taps - 1] = 0.0
+        self._t = 0
+
+    def _scratch(self, count: int):
+        self._steps = self.down * np.arange(count, dtype=np.intp)
+        self._t_out = np.zeros(count, dtype=np.intp)
+        self._idx = np.zeros(count, dtype=np.intp)
+        self._phase = np.zeros(count, dtype=np.intp)
+        # offset delle finestre già ripetuti per riga: le operazioni con broadcasting allocano buffer
+        self._offsets = np.tile(np.arange(self.taps, dtype=np.intp), (count, 1))
+        self._gather = np.zeros((count, self.taps), dtype=np.intp)
+        self._window_out = np.zeros((count, self.taps), dtype=np.float32)
+        self._coeff_out = np.zeros((count, self.taps), dtype=np.float32)
+        self._out = np.zeros(count, dtype=np.float32)
+
+    """ Converte un blocco di campioni (float in [-1, 1] oppure int16) e restituisce
+        tutti i campioni di uscita che è possibile calcolare con l'ingresso ricevuto.
+        scale moltiplica l'ingresso mentre viene copiato nel buffer interno, così i
+        blocchi int16 del buffer di cattura diventano float in [-1, 1] senza array
+        intermedi. Con copy=False l'uscita è una vista su un buffer riusato, valida
+        fino alla prossima chiamata."""
+    def process(self, block: np.ndarray, scale: float = None, copy: bool = True) -> np.ndarray:
+        hist = self.taps - 1
+        n = len(block)
+        if hist + n > len(self._buffer):
+            grown = np.zeros(hist + n, dtype=np.float32)
+            grown[:hist] = self._buffer[:hist]
+            self._buffer = grown
+        buf = self._buffer
+        buf[hist:hist + n] = block
+        if scale is not None:
+            np.multiply(buf[hist:hist + n], np.float32(scale), out=buf[hist:hist + n])
+
+        limit = n * self.up
+        if self._t >= limit:
+            count = 0
+        else:
+            count = (limit - self._t + self.down - 1) // self.down
+
+        if count:
+            if count > len(self._out):
+                self._scratch(count)
+            t = np.add(self._steps[:count], self._t, out=self._t_out[:count])
+            idx = np.floor_divide(t, self.up, out=self._idx[:count])
+            phase = np.remainder(t, self.up, out=self._phase[:count])
+            # finestre di ingresso e coefficienti della fase di ogni uscita, senza nuove allocazioni
+            gather = self._gather[:count]
+            np.copyto(gather, idx[:, None])
+            np.add(gather, self._offsets[:count], out=gather)
+            windows = np.take(buf, gather, out=self._window_out[:count], mode="clip")
+            coeffs = np.take(self._phases, phase, axis=0, out=self._coeff_out[:count], mode="clip")
+            out = np.einsum("ij,ij->i", windows, coeffs, out=self._out[:count])
+            self._t = int(t[-1]) + self.down - limit
+        else:
+            out = self._out[:0]
+            self._t -= limit
+
+        # conserva gli ultimi taps-1 campioni come storia per il prossimo blocco
+        buf[:hist] = buf[n:n + hist]
+        return out.copy() if copy else out
+
+
+class FrameResampler(StreamingResampler):
+    """ Variante che accumula l'uscita e restituisce sempre frame di esattamente
+        frame_length campioni int16, come richiesto da porcupine.process."""
+    def __init__(self, frame_length: int = 512, **kwargs):
+        super().__init__(**kwargs)
+        self.frame_length = frame_length
+        self._pending = np.zeros(frame_length * 4, dtype=np.float32)
+        self._frames = np.zeros(frame_length * 4, dtype=np.int16)
+        self._filled = 0
+
+    def reset(self):
+        super().reset()
+        self._filled = 0
+
+    """ Quanti campioni di ingresso servono, in media, per produrre un frame."""
+    @property
+    def block_size(self):
+        return int(round(self.frame_length * self.down / self.up))
+
+    """ I frame restituiti sono viste su un buffer int16 riusato: valgono fino alla
+        prossima chiamata, chi li conserva deve copiarli."""
+    def frames(self, block: np.ndarray) -> list:
+        out = self.process(block, copy=False)
+        needed = self._filled + len(out)
+        if needed > len(self._pending):
+            grown = np.zeros(needed + self.frame_length, dtype=np.float32)
+            grown[:self._filled] = self._pending[:self._filled]
+            self._pending = grown
+            self._frames = np.zeros(len(grown), dtype=np.int16)
+        self._pending[self._filled:needed] = out
+        self._filled = needed
+
+        count = self._filled // self.frame_length
+        used = count * self.frame_length
+        if not count:
+            return []
+        # una sola conversione a int16 per tutti i frame pronti
+        pending = self._pending[:used]
+        np.clip(pending, -32767, 32767, out=pending)
+        np.copyto(self._frames[:used], pending, casting="unsafe")
+        frames = [self._frames[i:i + self.frame_length] for i in range(0, used, self.frame_length)]
+
+        rest = self._filled - used
+        self._pending[:rest] = self._pending[used:self._filled]
+        self._filled = rest
+        return frames
@@ -0,0 +1,115 @@
+import time
+import numpy as np
+from typing import Callable, Optional
+
+
+class StreamingTranscriber:
+    """ Trascrizione incrementale di un enunciato che cresce mentre l'utente parla.
+        Ogni step_seconds di audio nuovo whisper viene eseguito su una finestra scorrevole
+        dell'enunciato; le parole vengono confermate con il criterio di local agreement
+        (il prefisso comune di due ipotesi consecutive è stabile) e le ipotesi parziali e
+        finali vengono passate alla callback on_hypothesis(confermato, provvisorio, finale).
+
+        Whisper codifica sempre una finestra fissa di 30 secondi, quindi gli stati
+        dell'encoder non si possono riusare per audio solo parzialmente sovrapposto:
+        quando la finestra non è cambiata dall'ultimo passaggio viene riusata l'ipotesi
+        già calcolata e la trascrizione finale è immediata."""
+    def __init__(self,
+                 transcribe: Callable,
+                 sample_rate: int = 16000,
+                 step_seconds: float = 1.0,
+                 max_window_seconds: float = 20.0,
+                 on_hypothesis: Optional[Callable] = None):
+        self.transcribe = transcribe
+        self.sample_rate = sample_rate
+        self.step_samples = int(step_seconds * sample_rate)
+        self.max_window_samples = int(max_window_seconds * sample_rate)
+        self.on_hypothesis = on_hypothesis
+        self.reset()
+
+    def reset(self):
+        self._closed = [] # segmenti chiusi dal VAD ancora nella finestra
+        self._closed_length = 0
+        self._open = np.zeros(0, dtype=np.float32) # segmento ancora aperto
+        self.committed = [] # parole confermate in tutto l'enunciato
+        self._window_committed = 0 # parole confermate che appartengono alla finestra corrente
+        self._previous = [] # parte non confermata dell'ultima ipotesi
+        self._last_length = 0 # lunghezza della finestra all'ultimo passaggio
+        self._last_words = []
+        self.passes = 0
+        self.final_latency = None
+
+    @property
+    def window_length(self) -> int:
+        return self._closed_length + len(self._open)
+
+    """ Aggiunge un segmento chiuso dal VAD. Se la finestra supera la lunghezza massima
+        tutto il suo contenuto viene confermato e la finestra riparte da qui."""
+    def append(self, segment: np.ndarray):
+        self._closed.append(segment)
+        self._closed_length += len(segment)
+        self._open = np.zeros(0, dtype=np.float32)
+        if self._closed_length >= self.max_window_samples:
+            words = self._run(self._window(include_open=False))
+            self.committed.extend(words[self._window_committed:])
+            self._closed = []
+            self._closed_length = 0
+            self._window_committed = 0
+            self._previous = []
+            self._last_length = 0
+            self._notify(final=False)
+
+    """ Aggiorna l'audio del segmento ancora aperto (il parlato in corso)."""
+    def update(self, open_audio: np.ndarray):
+        self._open = open_audio
+
+    """ Esegue un passaggio se è arrivato abbastanza audio nuovo dall'ultimo."""
+    def step(self):
+        if self.window_length - self._last_length < self.step_samples:
+            return
+        words = self._run(self._window())
+        fresh = words[self._window_committed:]
+
+        # local agreement: conferma il prefisso comune con l'ipotesi precedente
+        agreed = 0
+        for a, b in zip(fresh, self._previous):
+            if a != b:
+                break
+            agreed += 1
+        self.committed.extend(fresh[:agreed])
+        self._window_committed += agreed
+        self._previous = fresh[agreed:]
+        self._notify(final=False)
+
+    """ Chiude l'enunciato e restituisce la trascrizione finale."""
+    def finish(self) -> str:
+        start = time.perf_counter()
+        if self.window_length:
+            if self.window_length == self._last_length:
+                words = self._last_words # finestra invariata: riusa l'ultima ipotesi
+            else:
+                words = self._run(self._window())
+            self.committed.extend(words[self._window_committed:])
+        self._previous = []
+        self.final_latency = time.perf_counter() - start
+        self._notify(final=True)
+        return " ".join(self.committed)
+
+    def _window(self, include_open: bool = True) -> np.ndarray:
+        parts = list(self._closed)
+        if include_open and len(self._open):
+            parts.append(self._open)
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts)
+
+    def _run(self, audio: np.ndarray) -> list:
+        self.passes += 1
+        self._last_length = len(audio)
+        text = self.transcribe(audio) if len(audio) else None
+        self._last_words = text.split() if text else []
+        return self._last_words
+
+    def _notify(self, final: bool):
+        if self.on_hypothesis:
+            self.on_hypothesis(" ".join(self.committed), " ".join(self._previous), final)
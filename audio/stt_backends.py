@@ -0,0 +1,223 @@
+import copy
+import threading
+import time
+import torch
+from transformers import WhisperProcessor, WhisperForConditionalGeneration, StoppingCriteria, StoppingCriteriaList
+from audio.decoding import DecodingPolicy, compression_ratio, repeated_rows, split_batch_time, text_tokens, trim_repeats
+
+
+class RepeatGuard(StoppingCriteria):
+    """ Ferma la generazione di una sequenza quando finisce con un n-gramma ripetuto (vedi
+        repeated_rows). Le righe del batch che hanno già generato eos vengono ignorate:
+        generate le riempie di eos e il riempimento conterebbe come ripetizione. Segna le
+        sequenze fermate in triggered."""
+    def __init__(self, ngram: int = 4, span: int = 8, eos_token_id: int = None):
+        self.ngram = ngram
+        self.span = span
+        self.eos_token_id = eos_token_id
+        self.triggered = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        rows = repeated_rows(input_ids.cpu().numpy(), self.ngram, self.span, self.eos_token_id)
+        done = torch.from_numpy(rows).to(input_ids.device)
+        self.triggered = done if self.triggered is None else (self.triggered | done)
+        return done
+
+
+class TransformersBackend:
+    """ Backend di trascrizione basato su HF transformers, in float32 su CPU.
+        È il comportamento originale di AerisEars e la base per gli altri backend:
+        le sottoclassi cambiano solo il modo in cui viene caricato il modello."""
+    name = "hf"
+
+    def __init__(self, model_name: str = "openai/whisper-base", policy: DecodingPolicy = None):
+        self.model_name = model_name
+        self.policy = policy or DecodingPolicy()
+        self.processor = None
+        self.model = None
+        self.generation_config = None
+
+        # statistiche dell'ultima chiamata, una per segmento
+        self.last_stats = []
+
+    def load(self):
+        self.processor = WhisperProcessor.from_pretrained(self.model_name)
+        self.model = self._load_model()
+
+        # lingua e task fissati una volta sola: niente rilevamento della lingua
+        # e niente ricostruzione del prompt del decoder ad ogni chiamata
+        self.generation_config = copy.deepcopy(self.model.generation_config)
+        self.generation_config.language = "italian"
+        self.generation_config.task = "transcribe"
+        self.generation_config.forced_decoder_ids = None
+        return self
+
+    """ Lo stesso modello già caricato con un'altra politica di decodifica: una copia
+        superficiale che condivide processor e pesi, con policy e last_stats propri."""
+    def with_policy(self, policy: DecodingPolicy):
+        view = copy.copy(self)
+        view.policy = policy
+        view.last_stats = []
+        return view
+
+    def _load_model(self):
+        model = WhisperForConditionalGeneration.from_pretrained(
+            self.model_name,
+            torch_dtype=torch.float32, # forza il modello ad usare float a 32 bit
+            low_cpu_mem_usage=True
+        )
+        model.to("cpu")
+        model.eval()
+        return model
+
+    def features(self, audio_data):
+        inputs = self.processor(audio_data, sampling_rate=16000, return_tensors="pt", return_attention_mask=True)
+        return inputs["input_features"]
+
+    """ Trascrive un segmento a 16kHz in float32 e restituisce il testo."""
+    def transcribe(self, audio_data) -> str:
+        return self.transcribe_batch([audio_data])[0]
+
+    """ Trascrive più segmenti con una sola chiamata a generate: il processor porta
+        ogni segmento alla finestra fissa di 30 s di whisper, quindi le feature hanno
+        già la stessa forma e formano un unico batch. I segmenti che non superano i
+        controlli della politica di decodifica vengono rigenerati alla temperatura
+        successiva; tempi e token di ogni segmento finiscono in last_stats."""
+    def transcribe_batch(self, segments: list) -> list:
+        if not segments:
+            return []
+        start = time.perf_counter()
+        features = self.features(list(segments))
+        durations = [len(audio) / 16000 for audio in segments]
+        max_tokens = self.policy.max_tokens(max(durations))
+
+        texts = [""] * len(segments)
+        stats = [None] * len(segments)
+        pending = list(range(len(segments)))
+        for attempt, temperature in enumerate(self.policy.temperatures):
+            results = self._generate(features[pending], max_tokens, temperature)
+            for i, (text, tokens, avg_logprob, repeat_stopped) in zip(pending, results):
+                texts[i] = text
+                stats[i] = {
+                    "audio_seconds": durations[i],
+                    "tokens": tokens,
+                    "max_new_tokens": max_tokens,
+                    "temperature": temperature,
+                    "fallbacks": attempt,
+                    "avg_logprob": avg_logprob,
+                    "compression_ratio": compression_ratio(text),
+                    "repeat_stopped": repeat_stopped
+                }
+            pending = [i for i in pending
+                       if self.policy.needs_fallback(stats[i]["avg_logprob"], stats[i]["compression_ratio"])]
+            if not pending:
+                break
+
+        # decode_seconds è la quota del segmento, batch_seconds il tempo dell'intera chiamata
+        elapsed = time.perf_counter() - start
+        for stat, seconds in zip(stats, split_batch_time(durations, elapsed)):
+            stat["decode_seconds"] = seconds
+            stat["batch_seconds"] = elapsed
+        self.last_stats = stats
+        return texts
+
+    """ Una passata di generate su un batch di feature. Restituisce per ogni segmento
+        testo, numero di token generati, log-probabilità media e se la guardia sulle
+        ripetizioni ha fermato la generazione."""
+    def _generate(self, features, max_tokens: int, temperature: float) -> list:
+        policy = self.policy
+        kwargs = {
+            "generation_config": self.generation_config,
+            "max_new_tokens": max_tokens,
+            "num_beams": policy.num_beams,
+            "return_dict_in_generate": True,
+            "output_scores": True
+        }
+        if temperature > 0:
+            kwargs.update(do_sample=True, temperature=temperature)
+        else:
+            kwargs["do_sample"] = False # generazione deterministica e non stocastica
+        guard = None
+        if policy.repeat_ngram:
+            guard = RepeatGuard(policy.repeat_ngram, policy.repeat_span, self.generation_config.eos_token_id)
+            kwargs["stopping_criteria"] = StoppingCriteriaList([guard])
+
+        with torch.no_grad():
+            output = self.model.generate(features, **kwargs)
+            if policy.num_beams > 1:
+                # beam search: punteggio della sequenza migliore già normalizzato sulla lunghezza
+                generated = output.sequences
+                logprobs = None
+            else:
+                logprobs = self.model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+                # le ultime len(scores) posizioni sono i token generati, il resto è il prompt
+                generated = output.sequences[:, -logprobs.shape[1]:]
+
+        # i token speciali di whisper (prompt, fine testo, timestamp) hanno id >= eos;
+        # dopo il primo eos c'è solo il riempimento delle righe già finite
+        eos = self.generation_config.eos_token_id
+        before_eos = torch.cumsum(generated == eos, dim=1) == 0
+        text_mask = (generated < eos) & before_eos
+        results = []
+        for row in range(generated.shape[0]):
+            tokens = text_tokens(generated[row].tolist(), eos)
+            if logprobs is not None:
+                valid = text_mask[row] & torch.isfinite(logprobs[row])
+                avg_logprob = float(logprobs[row][valid].sum()) / max(int(valid.sum()), 1)
+            else:
+                avg_logprob = float(output.sequences_scores[row])
+            # con il beam search le righe della guardia sono i fasci, non i segmenti
+            stopped = logprobs is not None and guard is not None and guard.triggered is not None and bool(guard.triggered[row])
+            if stopped:
+                tokens = trim_repeats(tokens, policy.repeat_ngram)
+            text = self.processor.decode(tokens, skip_special_tokens=True).strip()
+            results.append((text, len(tokens), avg_logprob, stopped))
+        return results
+
+
+class QuantizedBackend(TransformersBackend):
+    """ Stesso modello con i layer lineari quantizzati dinamicamente a int8.
+        Sulle CPU ARM riduce memoria e tempo di decodifica con una perdita minima di WER."""
+    name = "int8"
+
+    def _load_model(self):
+        model = super()._load_model()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(TransformersBackend):
+    """ Modello esportato in ONNX ed eseguito con onnxruntime tramite optimum.
+        Dipendenza opzionale: pip install optimum[onnxruntime]."""
+    name = "onnx"
+
+    def _load_model(self):
+        try:
+            from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        except ImportError as e:
+            raise ImportError("Il backend onnx richiede optimum[onnxruntime]") from e
+        return ORTModelForSpeechSeq2Seq.from_pretrained(self.model_name, export=True)
+
+
+BACKENDS = {
+    TransformersBackend.name: TransformersBackend,
+    QuantizedBackend.name: QuantizedBackend,
+    OnnxBackend.name: OnnxBackend
+}
+
+""" Backend già caricati nel processo, chiave (nome backend, nome modello)."""
+_BACKEND_CACHE = {}
+_BACKEND_CACHE_LOCK = threading.Lock()
+
+
+""" Restituisce il backend richiesto caricandolo una sola volta per processo. Con policy
+    il chiamante riceve una vista sullo stesso modello con la sua politica: il backend
+    condiviso non cambia, così chi usa un'altra politica non altera la decodifica degli altri."""
+def get_backend(name: str, model_name: str, policy: DecodingPolicy = None):
+    if name not in BACKENDS:
+        raise ValueError(f"Backend STT sconosciuto: {name} (disponibili: {', '.join(BACKENDS)})")
+    key = (name, model_name)
+    with _BACKEND_CACHE_LOCK:
+        if key not in _BACKEND_CACHE:
+            _BACKEND_CACHE[key] = BACKENDS[name](model_name).load()
+        backend = _BACKEND_CACHE[key]
+    return backend.with_policy(policy) if policy is not None else backend
@@ -0,0 +1,245 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from audio.decoding import DecodingPolicy
+
+
+class SharedAudioRing:
+    """ Buffer circolare float32 in memoria condivisa tra il processo di Aeris e il worker
+        di trascrizione. Come AudioRing usa posizioni assolute e un solo scrittore (il
+        processo principale): le richieste al worker contengono solo posizione e lunghezza
+        dei segmenti, l'audio non passa dalla pipe. Il processo che crea il buffer lo
+        distrugge in close(), gli altri si limitano a staccarsi."""
+    def __init__(self, capacity: int, name: str = None):
+        self.capacity = capacity
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=capacity * 4)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.buffer = np.ndarray(capacity, dtype=np.float32, buffer=self.shm.buf)
+        self.written = 0
+
+    """ Copia i campioni nel buffer e restituisce la loro posizione assoluta."""
+    def write(self, samples: np.ndarray) -> int:
+        n = len(samples)
+        start = self.written
+        begin = start % self.capacity
+        first = min(n, self.capacity - begin)
+        self.buffer[begin:begin + first] = samples[:first]
+        if first < n:
+            self.buffer[:n - first] = samples[first:]
+        self.written += n
+        return start
+
+    def read(self, start: int, n: int) -> np.ndarray:
+        begin = start % self.capacity
+        first = min(n, self.capacity - begin)
+        if first == n:
+            return self.buffer[begin:begin + n].copy()
+        return np.concatenate((self.buffer[begin:], self.buffer[:n - first]))
+
+    def close(self):
+        # la vista numpy tiene un riferimento alla memoria: va rilasciata prima di chiudere
+        self.buffer = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+""" Corpo del processo di trascrizione: fissa thread e CPU di torch, carica il backend
+    una volta e risponde alle richieste finché non riceve "stop" o la pipe si chiude.
+    Gli errori di trascrizione tornano al processo principale, non terminano il worker.
+    Con il caricamento riporta il tempo speso negli import di torch e transformers."""
+def _worker_main(conn, ring_name: str, capacity: int, backend: str, model_name: str,
+                 policy: DecodingPolicy, threads: int, cpus: tuple, interop_threads: int = 1):
+    # Ctrl+C arriva a tutto il gruppo di processi: il worker viene fermato da Aeris
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    ring = SharedAudioRing(capacity, name=ring_name)
+    try:
+        start = time.perf_counter()
+        try:
+            import torch
+            from audio.stt_backends import get_backend
+            import_time = time.perf_counter() - start
+            if threads:
+                torch.set_num_threads(threads)
+            if interop_threads:
+                torch.set_num_interop_threads(interop_threads)
+            stt = get_backend(backend, model_name, policy=policy)
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+            return
+        conn.send(("ready", time.perf_counter() - start, import_time))
+
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+            segments = [ring.read(*item) if isinstance(item, tuple) else item for item in message[1]]
+            try:
+                texts = stt.transcribe_batch(segments)
+                conn.send(("ok", texts, stt.last_stats))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    except EOFError:
+        pass # il processo principale è terminato
+    finally:
+        ring.close()
+
+
+class SttWorker:
+    """ Esegue il backend di trascrizione in un processo separato, così generate di
+        whisper non contende il GIL con la callback di cattura, il loop della wakeword e
+        il VAD. Offre la stessa interfaccia dei backend (transcribe, transcribe_batch,
+        last_stats) e AerisEars lo usa al loro posto.
+
+        I segmenti viaggiano nel buffer condiviso e solo le loro posizioni passano dalla
+        pipe; le trascrizioni tornano dalla pipe. Se il worker termina o non risponde
+        entro timeout secondi viene riavviato e la richiesta ripetuta una volta.
+        threads e interop_threads fissano i thread di torch nel worker, cpus i core su
+        cui può girare. main è il corpo del processo: i test lo sostituiscono con uno
+        scritto a mano, senza torch."""
+    name = "worker"
+    main = staticmethod(_worker_main)
+
+    def __init__(self,
+                 backend: str = "hf",
+                 model_name: str = "openai/whisper-base",
+                 policy: DecodingPolicy = None,
+                 threads: int = None,
+                 cpus: tuple = None,
+                 interop_threads: int = 1,
+                 buffer_seconds: float = 60.0,
+                 timeout: float = 120.0,
+                 load_timeout: float = 600.0):
+        self.backend_name = backend
+        self.model_name = model_name
+        self.policy = policy or DecodingPolicy()
+        self.threads = threads
+        self.cpus = tuple(cpus) if cpus else None
+        self.interop_threads = interop_threads
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+
+        # il modello vive nel worker: qui restano solo il nome e le statistiche
+        self.processor = None
+        self.model = model_name
+        self.last_stats = []
+        self.load_time = None
+        self.import_time = None # secondi di import di torch e transformers nel worker
+        self.restarts = 0
+
+        self.ring = SharedAudioRing(int(16000 * buffer_seconds))
+        self.process = None
+        self.conn = None
+        self._lock = threading.Lock() # una richiesta alla volta: il buffer viene riusato
+
+    @property
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    """ pid del processo attuale del worker, None se non è in esecuzione."""
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    """ Avvia il worker e aspetta che il modello sia caricato. Il processo viene creato
+        con spawn: un fork dopo l'avvio dei thread di PyAudio e torch non è sicuro."""
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        conn, child = context.Pipe()
+        self.process = context.Process(
+            target=self.main,
+            args=(child, self.ring.name, self.ring.capacity, self.backend_name,
+                  self.model_name, self.policy, self.threads, self.cpus, self.interop_threads),
+            name="aeris-stt",
+            daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.conn = conn
+        try:
+            if not conn.poll(self.load_timeout):
+                raise TimeoutError(f"modello non caricato in {self.load_timeout:.0f}s")
+            reply = conn.recv()
+        except (EOFError, OSError, TimeoutError) as e:
+            self._failed()
+            raise RuntimeError(f"Worker STT non avviato: {e}") from e
+        if reply[0] != "ready":
+            self._failed()
+            raise RuntimeError(f"Worker STT non avviato: {reply[1]}")
+        self.load_time, self.import_time = reply[1], reply[2]
+        return self
+
+    def transcribe(self, audio_data) -> str:
+        return self.transcribe_batch([audio_data])[0]
+
+    def transcribe_batch(self, segments: list) -> list:
+        if not segments:
+            return []
+        with self._lock:
+            for attempt in range(2):
+                if not self.is_alive:
+                    self._restart()
+                try:
+                    return self._request(segments)
+                except (EOFError, OSError, TimeoutError) as e:
+                    print(f"[STT] worker terminato o bloccato ({e or type(e).__name__}), riavvio")
+                    self._kill()
+            raise RuntimeError("worker STT non disponibile")
+
+    def _request(self, segments: list) -> list:
+        segments = [np.asarray(audio, dtype=np.float32) for audio in segments]
+        # un batch più lungo del buffer condiviso passa dalla pipe invece di sovrascriversi
+        shared = sum(len(audio) for audio in segments) <= self.ring.capacity
+        items = [(self.ring.write(audio), len(audio)) if shared else audio for audio in segments]
+        self.conn.send(("batch", items))
+        if not self.conn.poll(self.timeout):
+            raise TimeoutError(f"nessuna risposta in {self.timeout:.0f}s")
+        reply = self.conn.recv()
+        if reply[0] == "error":
+            raise RuntimeError(reply[1])
+        _, texts, self.last_stats = reply
+        return texts
+
+    def _restart(self):
+        self._kill()
+        self.restarts += 1
+        self.start()
+        print(f"[STT] worker riavviato ({self.restarts}), modello caricato in {self.load_time:.2f}s")
+
+    def _failed(self):
+        self._kill()
+        # al primo avvio nessuno chiamerà close(): il buffer condiviso va liberato subito
+        if self.load_time is None:
+            self.ring.close()
+
+    def _kill(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def close(self):
+        with self._lock:
+            if self.is_alive:
+                try:
+                    self.conn.send(("stop",))
+                    self.process.join(timeout=5)
+                except OSError:
+                    pass
+            self._kill()
+            if self.ring.buffer is not None:
+                self.ring.close()
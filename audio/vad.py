@@ -0,0 +1,156 @@
+import time
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """ VAD a livello di frame basato su energia (RMS) e zero crossing rate.
+        Le feature vengono calcolate in modo vettoriale su tutti i frame di un blocco,
+        la macchina a stati applica isteresi (soglia di apertura più alta di quella di
+        chiusura), un numero minimo di frame per aprire e un hangover prima di chiudere.
+        Restituisce segmenti di parlato di lunghezza variabile che terminano sulle pause
+        naturali e segnala la fine del turno dopo end_silence secondi di silenzio.
+        Con noise_floor le soglie di apertura e chiusura seguono il rumore di fondo
+        stimato frame per frame al posto di on_threshold e off_threshold."""
+    def __init__(self,
+                 sample_rate: int = 16000,
+                 frame_ms: int = 20,
+                 on_threshold: float = 0.015,
+                 off_threshold: float = 0.008,
+                 zcr_threshold: float = 0.3,
+                 start_frames: int = 3,
+                 hangover_ms: int = 300,
+                 padding_ms: int = 100,
+                 end_silence: float = 1.0,
+                 no_speech_timeout: float = 3.0,
+                 max_segment_seconds: float = 15.0,
+                 noise_floor=None):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.frame_seconds = self.frame_length / sample_rate
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.zcr_threshold = zcr_threshold
+        self.start_frames = start_frames
+        self.hangover_frames = max(int(hangover_ms / frame_ms), 1)
+        self.padding_frames = int(padding_ms / frame_ms)
+        self.end_silence_frames = int(end_silence * 1000 / frame_ms)
+        self.no_speech_timeout = no_speech_timeout
+        self.max_segment_frames = int(max_segment_seconds * 1000 / frame_ms)
+        # NoiseFloor condiviso tra i turni: il rumore della stanza non cambia ad ogni wakeword
+        self.noise_floor = noise_floor
+
+        # ultima misura di latenza di fine parlato, in secondi
+        self.end_of_speech_latency = None
+        self.reset()
+
+    """ Azzera lo stato per un nuovo turno. no_speech_timeout sostituisce per questo turno
+        l'attesa massima del parlato, ad esempio per la finestra di follow-up."""
+    def reset(self, no_speech_timeout: float = None):
+        timeout = self.no_speech_timeout if no_speech_timeout is None else no_speech_timeout
+        self.no_speech_frames = int(timeout * 1000 / self.frame_ms)
+        self._leftover = np.zeros(0, dtype=np.float32)
+        self._recent = [] # ultimi frame di silenzio, usati come padding prima del parlato
+        self._segment = []
+        self.in_speech = False
+        self.heard_speech = False
+        self.turn_ended = False
+        self._candidate = 0 # frame consecutivi sopra la soglia di apertura
+        self._silence = 0 # frame consecutivi di silenzio
+        self._last_speech_time = None
+
+    """ Calcola RMS e zero crossing rate per ogni frame del blocco in una sola passata."""
+    def features(self, frames: np.ndarray):
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_length - 1)
+        return rms, zcr
+
+    """ Classifica i frame: il parlato sonoro ha energia sopra la soglia e ZCR bassa;
+        con il parlato già in corso bastano la soglia di chiusura o una ZCR alta
+        (consonanti fricative), così le code delle parole non vengono tagliate."""
+    def classify(self, rms, zcr):
+        if self.noise_floor is not None:
+            on, off = self.noise_floor.track(rms)
+        else:
+            on, off = self.on_threshold, self.off_threshold
+        voiced = (rms >= on) & (zcr < self.zcr_threshold)
+        sustained = (rms >= off) | ((zcr >= self.zcr_threshold) & (rms >= off / 2))
+        return voiced, sustained
+
+    """ Elabora un blocco a 16kHz e restituisce la lista dei segmenti di parlato completati."""
+    def process(self, audio: np.ndarray) -> list:
+        received = time.monotonic()
+        # i frame finiscono nei segmenti: il blocco viene sempre copiato perché il chiamante
+        # può passare una vista su un buffer riusato (ad esempio l'uscita del resampler)
+        data = np.concatenate((self._leftover, audio))
+        count = len(data) // self.frame_length
+        self._leftover = data[count * self.frame_length:].astype(np.float32, copy=True)
+        if not count or self.turn_ended:
+            return []
+
+        frames = data[:count * self.frame_length].reshape(count, self.frame_length)
+        rms, zcr = self.features(frames)
+        voiced, sustained = self.classify(rms, zcr)
+
+        segments = []
+        for i in range(count):
+            frame = frames[i]
+            if self.in_speech:
+                self._segment.append(frame)
+                if sustained[i]:
+                    self._silence = 0
+                    self._mark_speech(received, count, i)
+                else:
+                    self._silence += 1
+                if self._silence >= self.hangover_frames or len(self._segment) >= self.max_segment_frames:
+                    segments.append(self._close_segment())
+            else:
+                self._silence += 1
+                self._candidate = self._candidate + 1 if voiced[i] else 0
+                self._recent.append(frame)
+                if len(self._recent) > self.padding_frames + self.start_frames:
+                    self._recent.pop(0)
+                if self._candidate >= self.start_frames:
+                    # apertura: il segmento include il padding e i frame di conferma
+                    self.in_speech = True
+                    self.heard_speech = True
+                    self._segment = list(self._recent)
+                    self._recent = []
+                    self._candidate = 0
+                    self._silence = 0
+                    self._mark_speech(received, count, i)
+
+            limit = self.end_silence_frames if self.heard_speech else self.no_speech_frames
+            if not self.in_speech and self._silence >= limit:
+                self.turn_ended = True
+                if self.heard_speech and self._last_speech_time is not None:
+                    self.end_of_speech_latency = time.monotonic() - self._last_speech_time
+                break
+        return segments
+
+    """ Audio del segmento di parlato ancora aperto, usato dalla trascrizione in streaming."""
+    def open_segment(self) -> np.ndarray:
+        frames = list(self._segment)
+        if not self.in_speech or not frames:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(frames)
+
+    """ Chiude il turno restituendo l'eventuale segmento ancora aperto."""
+    def flush(self):
+        if self.in_speech and self._segment:
+            return self._close_segment()
+        return None
+
+    def _close_segment(self):
+        # il segmento si chiude sulla pausa: l'hangover di silenzio finale viene scartato
+        keep = len(self._segment) - max(self._silence - self.padding_frames, 0)
+        segment = np.concatenate(self._segment[:max(keep, 1)])
+        self._segment = []
+        self.in_speech = False
+        return segment
+
+    """ Stima l'istante di cattura della fine del frame i a partire dall'istante in cui
+        il blocco è stato ricevuto: i campioni successivi nel blocco sono arrivati dopo."""
+    def _mark_speech(self, received: float, count: int, i: int):
+        self._last_speech_time = received - (count - 1 - i) * self.frame_seconds
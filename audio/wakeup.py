@@ -1,54 +1,59 @@
-import pvporcupine
-import pyaudio
 import struct
 import threading
 from typing import Callable, Optional
 import os
-import librosa
 import time
 import numpy as np
+from audio.resampler import FrameResampler
+from audio.capture import CaptureEngine
+from audio.preroll import PreRollBuffer
+from metrics.resources import get_resources
 
 class Porcupine:
     def __init__(self,
                  sensitivity : float = 0.5,
-                 callback: Callable = None):
+                 callback: Callable = None,
+                 capture: Optional[CaptureEngine] = None,
+                 preroll_seconds: float = 0.5,
+                 engine = None):
         self.access_key = os.getenv("PICOVOICE_ACCESS_KEY")
         self.keyword = "/home/aeris/aeris/audio/eris.ppn"
         self.sensitivity = sensitivity
         self.callback = callback
         
         self.porcupine = None
-        self.audio_stream = None
-        self.pa = None
+        # motore di rilevazione già pronto al posto di pvporcupine (replay e benchmark):
+        # deve offrire process(frame), frame_length, sample_rate e delete()
+        self.engine = engine
         self.is_listening = False
         self.thread = None
         
-        # buffer
-        self.resample_buffer = np.array([], dtype=np.int16)
+        # resampler 44.1kHz -> 16kHz con stato, creato quando è noto il frame_length
+        self.resampler = None
+        
+        """ Motore di cattura condiviso con AerisEars. Se non viene passato ne viene
+            creato uno di proprietà di questo oggetto."""
+        self.capture = capture
+        self._owns_capture = capture is None
+        self.reader = None
+        self.dropped = 0 # campioni persi dal loop di ascolto perché in ritardo sulla cattura
+        
+        # posizione assoluta nel buffer di cattura in cui è stata rilevata la wakeword
+        self.detected_at = None
+        
+        # ultimi preroll_seconds di audio a 16kHz, consegnati alla trascrizione alla rilevazione
+        self.preroll = PreRollBuffer(seconds=preroll_seconds, sample_rate=16000)
+        self.preroll_audio = None
         
     def start(self, timeout: int):
         if self.is_listening:
             return False
         
         try:
-            keyword_path = self.keyword
+            self.open()
             
-            # definisci l'ggetto porcupine di rilevazione della parola
-            self.porcupine = pvporcupine.create(
-                access_key=self.access_key,
-                keyword_paths=[keyword_path],
-                sensitivities=[self.sensitivity] # sensitività di rilevamento della parola
-            )
-            
-            self.pa = pyaudio.PyAudio()
-            self.audio_stream = self.pa.open(
-                rate=44100,
-                channels=1,
-                format=pyaudio.paInt16,
-                input=True,
-                frames_per_buffer=self.porcupine.frame_length,
-                input_device_index=1
-            )
+            # il lettore parte dall'ultimo campione catturato, lo stream resta aperto tra i cicli
+            self.reader = self.capture.reader()
             
             # avvia thread di ascolto per la parola
             self.is_listening = True
@@ -57,29 +62,73 @@ class Porcupine:
             print(f"In ascolto per la keyword \"Hey Eris\"")
             
             try:
-                while self.is_listening:
-                    time.sleep(1)
-                time.sleep(1)
-                self.stop()
+                # il thread termina dopo la rilevazione (e la callback) o al timeout
+                self.thread.join()
             except KeyboardInterrupt:
                 self.stop()
+            self._count_dropped()
             
         except Exception as e:
             print(f"Errore all'avvio: {e}")
             return False
+    
+    """ Crea il motore porcupine e il resampler senza avviare il thread di ascolto.
+        Il motore resta aperto tra un ciclo e l'altro e viene chiuso da stop()."""
+    def open(self):
+        if self.porcupine is None and self.engine is not None:
+            self.porcupine = self.engine
+        if self.porcupine is None:
+            with get_resources().imports("wakeword"):
+                import pvporcupine
+            # definisci l'ggetto porcupine di rilevazione della parola
+            self.porcupine = pvporcupine.create(
+                access_key=self.access_key,
+                keyword_paths=[self.keyword],
+                sensitivities=[self.sensitivity] # sensitività di rilevamento della parola
+            )
+        if self.capture is None:
+            self.capture = CaptureEngine(device_index=1, sample_rate=44100)
+        self.capture.start()
+        
+        if self.resampler is None:
+            self.resampler = FrameResampler(
+                frame_length=self.porcupine.frame_length,
+                orig_sr=self.capture.sample_rate,
+                target_sr=self.porcupine.sample_rate
+            )
+        self.reset()
+    
+    """ Azzera lo stato tra una rilevazione e l'altra."""
+    def reset(self):
+        self.resampler.reset()
+        self.detected_at = None
+        self.preroll.clear()
+        self.preroll_audio = None
+    
+    """ Elabora un blocco di campioni int16 alla frequenza di cattura e restituisce True
+        se contiene la wakeword. position è la posizione assoluta del blocco nel buffer
+        di cattura, da cui potrà ripartire la registrazione."""
+    def detect(self, pcm, position: int = None) -> bool:
+        for frame in self.resampler.frames(pcm):
+            self.preroll.write(frame)
+            if self.porcupine.process(frame) >= 0:
+                self.detected_at = position
+                self.preroll_audio = self.preroll.snapshot()
+                return True
+        return False
         
     def stop(self):
-        if self.thread:
+        self.is_listening = False
+        if self.thread and self.thread is not threading.current_thread():
             self.thread.join()
             
-        if self.audio_stream:
-            self.audio_stream.close()
-        
-        if self.pa:
-            self.pa.terminate()
-            
         if self.porcupine:
             self.porcupine.delete()
+            self.porcupine = None
+        
+        # il motore condiviso viene chiuso da chi lo ha creato
+        if self._owns_capture and self.capture:
+            self.capture.stop()
             
     def listen_loop(self, timeout: int):
         print("Ascoltando...")
@@ -89,25 +138,20 @@ class Porcupine:
                 """
                 In questo caso leggiamo uno stream audio ad una frequenza di 44.1kHz
                 ma porcupine opera ad una frequenza di 16kHz ad un frame_rate di 512...
-                Si esegue la proporzione x * (16000/44100) = 512 e ricaviamo:
-                            x ~= 1411
-                frame rate necessario per far funzionare correttamente porcupine
-                """   
-                pcm_bytes = self.audio_stream.read(
-                    1411,
-                    exception_on_overflow=False
-                )
-                pcm = np.frombuffer(pcm_bytes, dtype=np.int16)
-                pcm = librosa.resample(pcm.astype(np.float32), orig_sr=44100, target_sr=16000)
-                pcm = np.clip(pcm, -32767, 32767).astype(np.int16)
-                # normalizzi un valore a 16 bit [-32767, 32767] dopo la conversione 
-                # float32 ---> int16
-                                             
-                keyboard_index = self.porcupine.process(pcm)
-                
-                if keyboard_index >= 0:
-                    self.audio_stream.close()
-                    self.pa.terminate()
+                Il resampler polifase mantiene la storia tra un blocco e l'altro e accumula
+                l'uscita, quindi restituisce sempre frame di esattamente frame_length campioni
+                anche se 1411 campioni non corrispondono esattamente a 512.
+                I campioni sono una vista sul buffer di cattura e i frame una vista sul buffer
+                int16 del resampler: nessuna copia per frame.
+                """
+                pcm = self.reader.view(self.resampler.block_size, timeout=1)
+                if pcm is None:
+                    if self.reader.ring.closed:
+                        break
+                    continue
+                if self.detect(pcm, self.reader.position):
+                    # la callback esegue l'intero turno, che riporta i campioni persi
+                    self._count_dropped()
                     if self.callback:
                         self.callback()
                     self.is_listening = False
@@ -118,4 +162,8 @@ class Porcupine:
         self.is_listening = False
         print(f"Timeout raggiunto ({timeout}s). Ascolto terminato.")
         return False
-                
\ No newline at end of file
+
+    def _count_dropped(self):
+        if self.reader is not None:
+            self.dropped += self.reader.dropped
+            self.reader.dropped = 0
@@ -0,0 +1,131 @@
+""" Allocazioni del percorso di cattura: memoria allocata per secondo di audio e tempo di
+    CPU dei due consumatori del buffer circolare, prima e dopo il percorso senza copie.
+
+    - ears: blocchi da 1024 campioni -> float in [-1, 1] -> resampling a 16kHz
+    - wakeword: blocchi da 1411 campioni -> frame int16 da 512 campioni per porcupine
+
+    Il percorso "prima" copia ogni blocco fuori dal buffer (read), lo converte con
+    astype / 32768, ricampiona con gather e uscita nuovi ad ogni blocco e converte ogni
+    frame con clip + astype. Il percorso "dopo" legge una vista int16 (view), normalizza
+    mentre copia nel buffer del resampler e restituisce viste sui buffer preallocati.
+    La memoria è la somma dei picchi di tracemalloc per blocco: un limite inferiore dei
+    byte allocati, che conta anche i temporanei liberati subito. Il VAD è escluso perché
+    uguale nei due percorsi.
+
+    Uso: python -m benchmark.alloc_bench [secondi]"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from audio.capture import AudioRing, RingReader
+from audio.resampler import FrameResampler, StreamingResampler
+from benchmark.resample_bench import make_signal
+
+RATE = 44100
+WRITE_BLOCK = 1024 # frames_per_buffer della callback di cattura
+
+
+""" Resampling come prima di questo cambiamento: indici, finestre e uscita allocati ad ogni blocco."""
+def legacy_process(resampler: StreamingResampler, block: np.ndarray) -> np.ndarray:
+    hist = resampler.taps - 1
+    n = len(block)
+    buf = resampler._buffer
+    buf[hist:hist + n] = block
+    limit = n * resampler.up
+    count = 0 if resampler._t >= limit else (limit - resampler._t + resampler.down - 1) // resampler.down
+    if count:
+        t = resampler._t + resampler.down * np.arange(count)
+        idx = t // resampler.up
+        phase = t % resampler.up
+        windows = buf[idx[:, None] + np.arange(resampler.taps)]
+        out = np.einsum("ij,ij->i", windows, resampler._phases[phase])
+        resampler._t = int(t[-1]) + resampler.down - limit
+    else:
+        out = np.zeros(0, dtype=np.float32)
+        resampler._t -= limit
+    buf[:hist] = buf[n:n + hist]
+    return out
+
+
+def legacy_frames(resampler: FrameResampler, block: np.ndarray) -> list:
+    out = legacy_process(resampler, block)
+    needed = resampler._filled + len(out)
+    resampler._pending[resampler._filled:needed] = out
+    resampler._filled = needed
+    frames, start = [], 0
+    while resampler._filled - start >= resampler.frame_length:
+        frame = resampler._pending[start:start + resampler.frame_length]
+        frames.append(np.clip(frame, -32767, 32767).astype(np.int16))
+        start += resampler.frame_length
+    if start:
+        rest = resampler._filled - start
+        resampler._pending[:rest] = resampler._pending[start:resampler._filled]
+        resampler._filled = rest
+    return frames
+
+
+def ears_before(reader, resampler, n):
+    chunk = reader.read(n, timeout=0)
+    return legacy_process(resampler, chunk.astype(np.float32) / 32768.0)
+
+
+def ears_after(reader, resampler, n):
+    chunk = reader.view(n, timeout=0)
+    return resampler.process(chunk, scale=1 / 32768, copy=False)
+
+
+def wake_before(reader, resampler, n):
+    return legacy_frames(resampler, reader.read(n, timeout=0))
+
+
+def wake_after(reader, resampler, n):
+    return resampler.frames(reader.view(n, timeout=0))
+
+
+""" Scrive il segnale nel buffer circolare a blocchi come la callback e dopo ogni scrittura
+    consuma tutti i blocchi disponibili. Restituisce byte allocati e secondi di CPU."""
+def run(pcm, consume, resampler, block: int, traced: bool):
+    ring = AudioRing(RATE * 10)
+    reader = RingReader(ring)
+    allocated = 0
+    start = time.process_time()
+    for offset in range(0, len(pcm) - WRITE_BLOCK + 1, WRITE_BLOCK):
+        ring.write(pcm[offset:offset + WRITE_BLOCK])
+        while reader.available >= block:
+            if traced:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                consume(reader, resampler, block)
+                allocated += tracemalloc.get_traced_memory()[1] - base
+            else:
+                consume(reader, resampler, block)
+    return allocated, time.process_time() - start
+
+
+def bench(name, pcm, consume, make_resampler, block):
+    seconds = len(pcm) / RATE
+    _, cpu = run(pcm, consume, make_resampler(), block, traced=False)
+    tracemalloc.start()
+    try:
+        allocated, _ = run(pcm, consume, make_resampler(), block, traced=True)
+    finally:
+        tracemalloc.stop()
+    print(f"{name:>16}: {allocated / seconds / 1024:9.1f} KiB allocati per secondo di audio, "
+          f"{cpu / seconds * 1000:6.2f} ms CPU per secondo")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    pcm = make_signal(seconds, RATE)
+    ears = lambda: StreamingResampler(orig_sr=RATE, target_sr=16000)
+    wake = lambda: FrameResampler(frame_length=512)
+    wake_block = wake().block_size
+
+    bench("ears prima", pcm, ears_before, ears, WRITE_BLOCK)
+    bench("ears dopo", pcm, ears_after, ears, WRITE_BLOCK)
+    bench("wakeword prima", pcm, wake_before, wake, wake_block)
+    bench("wakeword dopo", pcm, wake_after, wake, wake_block)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+""" Trascrizione seriale contro trascrizione a batch di una coda di segmenti.
+    Per ogni dimensione della coda (1-8 segmenti presi dalle clip di benchmark/clips,
+    tagliati a 3 s come i segmenti del VAD) tutti i segmenti sono in coda all'istante
+    zero: la latenza di un segmento è il tempo fino a quando la sua trascrizione è
+    pronta. Riporta throughput (segmenti/s), p50 e massimo della latenza.
+
+    Uso: python -m benchmark.batch_bench [--backend hf] [--max-batch 8]"""
+import argparse
+import time
+import numpy as np
+from benchmark.stt_bench import DEFAULT_VOICE, load_clips, prepare_clips
+
+
+def serial(backend, segments) -> list:
+    start = time.perf_counter()
+    latencies = []
+    for audio in segments:
+        backend.transcribe(audio)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def batched(backend, segments, max_batch: int) -> list:
+    start = time.perf_counter()
+    latencies = []
+    for i in range(0, len(segments), max_batch):
+        batch = segments[i:i + max_batch]
+        backend.transcribe_batch(batch)
+        latencies += [time.perf_counter() - start] * len(batch)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="hf")
+    parser.add_argument("--model", default="openai/whisper-base")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--voice", default=DEFAULT_VOICE)
+    args = parser.parse_args()
+
+    from audio.stt_backends import get_backend
+    prepare_clips(args.voice)
+    clips = [audio[:3 * 16000] for _, audio, _ in load_clips()]
+    if not clips:
+        print("Nessuna clip in benchmark/clips")
+        return
+    backend = get_backend(args.backend, args.model)
+    backend.transcribe(np.zeros(16000, dtype=np.float32)) # warm-up
+
+    print(f"{'coda':>4} {'modo':>8} {'seg/s':>7} {'p50 ms':>8} {'max ms':>8}")
+    for size in range(1, 9):
+        segments = [clips[i % len(clips)] for i in range(size)]
+        for mode, run in (("seriale", lambda: serial(backend, segments)),
+                          ("batch", lambda: batched(backend, segments, args.max_batch))):
+            latencies = run()
+            print(f"{size:>4} {mode:>8} {size / latencies[-1]:>7.2f} "
+                  f"{np.percentile(latencies, 50) * 1000:>8.0f} {max(latencies) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
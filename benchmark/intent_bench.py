@@ -0,0 +1,94 @@
+""" Motore degli intent: quota di domande risolte senza modello e tempo di
+    riconoscimento. Le domande sono le frasi di benchmark/clips/frasi.txt più una
+    serie di varianti dei comandi (come le scrive whisper, con maiuscole, punteggiatura
+    e parole di cortesia), ciascuna con l'intent atteso.
+
+    Per ogni frase riporta l'intent riconosciuto; in fondo la quota risolta in locale,
+    i comandi attesi non riconosciuti, le frasi per il modello prese per comandi e il
+    tempo di match + risposta (p50/p95/max in µs, ripetuto per stabilità). La latenza
+    dei due percorsi nel flusso completo è nella colonna "locali" di replay_suite e
+    nelle statistiche stampate da Aeris a fine turno.
+
+    Uso: python -m benchmark.intent_bench [--repeat 200]"""
+import argparse
+import time
+from datetime import datetime
+from benchmark.llm_backends_bench import load_prompts
+from metrics.tracing import percentile
+from model.intents import IntentEngine
+
+COMMANDS = [
+    ("Che ore sono?", "time"),
+    ("Aeris, mi dici che ora è?", "time"),
+    ("Che giorno è oggi?", "date"),
+    ("Quanti ne abbiamo oggi?", "date"),
+    ("Imposta un timer di 5 minuti.", "timer"),
+    ("Metti un timer di venticinque secondi", "timer"),
+    ("Timer di mezz'ora, per favore.", "timer"),
+    ("Quanto manca al timer?", "timer_left"),
+    ("Annulla il timer.", "timer_cancel"),
+    ("Alza il volume.", "volume_up"),
+    ("Abbassa un po' il volume", "volume_down"),
+    ("Volume al 40%", "volume_set"),
+    ("Stop.", "stop"),
+    ("Basta così, grazie.", "stop"),
+    ("Puoi ripetere?", "repeat"),
+    ("Cosa hai detto?", "repeat"),
+    ("Che tempo farà domani a Milano?", None),
+    ("Raccontami una barzelletta sugli orologi.", None),
+    ("A che ora apre il supermercato?", None)
+]
+
+
+class BenchPlayer:
+    volume = 1.0
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+
+    def stop(self):
+        pass
+
+
+class BenchVoice:
+    player = BenchPlayer()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = IntentEngine(voice=BenchVoice(), announce=lambda text: None,
+                          clock=lambda: datetime(2026, 10, 18, 10, 15))
+    phrases = [(phrase, None) for phrase in load_prompts()] + COMMANDS
+    expected = {phrase: intent for phrase, intent in COMMANDS}
+    local, misses, false_hits = 0, [], []
+    for phrase, _ in phrases:
+        reply = engine.handle(phrase)
+        if reply is not None:
+            local += 1
+        print(f"{phrase[:45]:<45} -> {engine.last_intent or 'modello':<13} {reply or ''}")
+        if phrase in expected and engine.last_intent != expected[phrase]:
+            (misses if expected[phrase] else false_hits).append(phrase)
+    engine.close()
+
+    timings = []
+    for _ in range(args.repeat):
+        for phrase, _ in phrases:
+            start = time.perf_counter()
+            found = engine.match(phrase)
+            if found is not None and found[0].name not in ("timer", "timer_cancel"):
+                found[0].handler(found[1])
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+
+    print(f"\nrisolte in locale: {local}/{len(phrases)} ({local / len(phrases):.0%})")
+    print(f"comandi non riconosciuti: {misses or 'nessuno'}")
+    print(f"domande per il modello prese per comandi: {false_hits or 'nessuna'}")
+    print(f"match e risposta: p50 {percentile(timings, 50):.1f} µs, p95 {percentile(timings, 95):.1f} µs, "
+          f"max {timings[-1]:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+""" Tempo al primo token e token al secondo dei backend del modello di AerisMind sulla
+    CPU del dispositivo, con le frasi di benchmark/clips/frasi.txt come domande.
+
+    - openai: API Responses attraverso LLMTransport (richiede OPENAI_API_KEY)
+    - local: modello locale, server compatibile con OpenAI (--local-url o
+      AERIS_LOCAL_LLM_URL) oppure GGUF in processo con llama-cpp-python (--local-path o
+      AERIS_LOCAL_LLM_PATH)
+
+    Il primo token misura l'attesa dell'utente prima che parta la voce; i token al
+    secondo sono quelli della generazione dopo il primo, contati dall'uso riportato dal
+    backend o stimati. La prima richiesta di ogni backend (connessione, caricamento del
+    modello) è a parte e non entra nei percentili. Stampa anche le decisioni del router
+    sulle stesse frasi.
+
+    Uso: python -m benchmark.llm_backends_bench [--backends openai,local] [--repeat 2]
+    [--max-tokens 120] [--local-url http://127.0.0.1:11434/v1] [--local-path modello.gguf]
+    [--local-model nome] [--threads 4]"""
+import argparse
+import os
+import platform
+import time
+from benchmark.stt_bench import CLIPS_DIR
+from metrics.tracing import percentile
+from model.conversation import count_tokens
+from model.llm_backends import LLMRouter, LocalBackend, RemoteBackend
+from model.transport import LLMTransport
+
+INSTRUCTIONS = "Sei un assistente AI di nome Aeris. Rispondi in maniera simpatica e concisa senza usare emoji."
+
+
+""" Modello della CPU e numero di core, per confrontare i risultati tra dispositivi."""
+def cpu_info() -> str:
+    model = platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("model name", "Model"):
+                    model = value.strip()
+    except OSError:
+        pass
+    return f"{model}, {os.cpu_count()} core"
+
+
+def load_prompts() -> list:
+    with open(os.path.join(CLIPS_DIR, "frasi.txt")) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+""" Una domanda in streaming: secondi al primo token, secondi totali e token generati."""
+def measure(backend, prompt: str, max_tokens: int) -> dict:
+    start = time.perf_counter()
+    first = None
+    parts = []
+    usage = None
+    stream = backend.stream([{"role": "user", "content": prompt}], max_output_tokens=max_tokens,
+                            instructions=INSTRUCTIONS)
+    for event in stream:
+        if event.type == "response.output_text.delta":
+            if first is None:
+                first = time.perf_counter() - start
+            parts.append(event.delta)
+        elif event.type == "response.completed":
+            usage = event.response.usage
+        elif event.type == "error":
+            raise RuntimeError(event.message)
+    total = time.perf_counter() - start
+    tokens = getattr(usage, "output_tokens", None) or count_tokens("".join(parts))
+    return {"ttft": first, "total": total, "tokens": tokens}
+
+
+def run_backend(backend, prompts: list, repeat: int, max_tokens: int):
+    try:
+        cold = measure(backend, prompts[0], max_tokens)
+    except Exception as e:
+        print(f"{backend.name}: non disponibile ({type(e).__name__}: {e})")
+        return None
+    ttfts, rates, failures = [], [], 0
+    for _ in range(repeat):
+        for prompt in prompts:
+            try:
+                result = measure(backend, prompt, max_tokens)
+            except Exception as e:
+                failures += 1
+                print(f"{backend.name}: '{prompt}' fallita: {e}")
+                continue
+            if result["ttft"] is None:
+                failures += 1
+                continue
+            ttfts.append(result["ttft"] * 1000)
+            generation = result["total"] - result["ttft"]
+            if result["tokens"] > 1 and generation > 0:
+                rates.append((result["tokens"] - 1) / generation)
+    ttfts.sort()
+    rates.sort()
+    return {
+        "cold_ms": (cold["ttft"] or cold["total"]) * 1000,
+        "p50_ms": percentile(ttfts, 50) if ttfts else None,
+        "p95_ms": percentile(ttfts, 95) if ttfts else None,
+        "tokens_s": percentile(rates, 50) if rates else None,
+        "failures": failures
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="openai,local")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=120)
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    parser.add_argument("--local-url", default=os.getenv("AERIS_LOCAL_LLM_URL"))
+    parser.add_argument("--local-path", default=os.getenv("AERIS_LOCAL_LLM_PATH"))
+    parser.add_argument("--local-model", default=os.getenv("AERIS_LOCAL_LLM_MODEL"))
+    parser.add_argument("--threads", type=int, default=None, help="thread di llama.cpp in processo")
+    args = parser.parse_args()
+
+    prompts = load_prompts()
+    print(f"CPU: {cpu_info()}, {len(prompts)} domande x {args.repeat}, max {args.max_tokens} token")
+
+    backends = {}
+    for name in args.backends.split(","):
+        try:
+            if name == "openai":
+                backends[name] = RemoteBackend(LLMTransport(api_key=os.getenv("OPENAI_API_KEY")), model=args.model)
+            elif name == "local":
+                kwargs = {"model": args.local_model} if args.local_model else {}
+                backends[name] = LocalBackend(base_url=args.local_url, model_path=args.local_path,
+                                              threads=args.threads, **kwargs).load()
+                print(f"local: pronto in {backends[name].load_time:.2f}s")
+            else:
+                print(f"Backend sconosciuto: {name}")
+        except Exception as e:
+            print(f"{name}: non disponibile ({type(e).__name__}: {e})")
+
+    print(f"{'backend':<8} {'freddo ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'token/s':>8} {'falliti':>8}")
+    for name, backend in backends.items():
+        result = run_backend(backend, prompts, args.repeat, args.max_tokens)
+        backend.close()
+        if result is None:
+            continue
+        print(f"{name:<8} {result['cold_ms']:>10.0f} {result['p50_ms'] or 0:>8.0f} {result['p95_ms'] or 0:>8.0f} "
+              f"{result['tokens_s'] or 0:>8.1f} {result['failures']:>8}")
+
+    router = LLMRouter(RemoteBackend(None), LocalBackend())
+    local = [prompt for prompt in prompts if router.route(prompt)[0] is router.local]
+    print(f"Router: {len(local)}/{len(prompts)} domande al modello locale ({', '.join(local)})")
+
+
+if __name__ == "__main__":
+    main()
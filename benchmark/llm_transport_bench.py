@@ -0,0 +1,229 @@
+""" Latenza al primo token di AerisMind contro un server locale che imita l'API Responses
+    di OpenAI e inietta latenza: handshake secondi di attesa su ogni nuova connessione
+    (al posto di DNS, TCP e TLS), first_token secondi prima del primo delta, una quota
+    slow_share di richieste più lente di slow secondi e una quota stall_share che non
+    risponde mai. Il server chiude le connessioni inattive da più di idle_close secondi,
+    come fanno i server reali tra un turno e l'altro di un assistente vocale.
+
+    Ogni turno aspetta idle secondi, simula la wakeword, aspetta speech secondi (l'utente
+    che parla) e poi chiede una risposta in streaming. Confronta:
+    - client: il client OpenAI di default, senza tempi massimi né preconnessione
+    - pool: LLMTransport senza preconnessione
+    - preconnect: connessione aperta alla wakeword
+    - hedge: preconnessione e copia della richiesta dopo il p95 delle latenze
+
+    Con --stall-share la configurazione client resta bloccata fino al timeout di default
+    del client OpenAI (10 minuti): per confrontare solo i tempi massimi usa --configs.
+
+    Richiede openai e httpx. Uso: python -m benchmark.llm_transport_bench [--turns 20]
+    [--handshake 0.15] [--slow-share 0.1] [--stall-share 0] [--configs client,pool,preconnect,hedge]"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics.tracing import percentile
+from model.transport import LLMTransport
+
+WORDS = "Sono le dieci e un quarto, vuoi che imposti un promemoria?".split(" ")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive come l'API reale
+
+    def setup(self):
+        super().setup()
+        self.connection.settimeout(self.server.idle_close)
+        self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.heads += 1
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        delay = server.first_token
+        roll = server.rng.random()
+        if server.delays:
+            delay = server.delays.popleft()
+        elif roll < server.stall_share:
+            delay = 3600 # mai: il client deve arrendersi da solo
+        elif roll < server.stall_share + server.slow_share:
+            delay += server.slow
+        response = {
+            "id": "resp_stub", "object": "response", "created_at": int(time.time()),
+            "model": body.get("model", "stub"), "status": "completed",
+            "output": [{"id": "msg_stub", "type": "message", "role": "assistant", "status": "completed",
+                        "content": [{"type": "output_text", "text": " ".join(WORDS), "annotations": []}]}],
+            "usage": {"input_tokens": 40, "output_tokens": len(WORDS), "total_tokens": 40 + len(WORDS)},
+            "parallel_tool_calls": True, "tool_choice": "auto", "tools": []
+        }
+        if not body.get("stream"):
+            if server.closed.wait(delay):
+                return
+            data = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        # come l'API reale: intestazioni e response.created subito, il testo dopo delay secondi
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [{"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}]
+        events += [{"type": "response.output_text.delta", "item_id": "msg_stub", "output_index": 0,
+                    "content_index": 0, "delta": word + " "} for word in WORDS]
+        events.append({"type": "response.completed", "response": response})
+        try:
+            for i, event in enumerate(events):
+                if i == 1 and server.closed.wait(delay):
+                    return
+                if i > 1:
+                    time.sleep(server.token_interval)
+                event["sequence_number"] = i
+                chunk = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # il client ha chiuso lo stream (copia perdente dell'hedging, barge-in)
+            server.aborted += 1
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    """ delays fissa, nell'ordine, i secondi al primo delta delle prime richieste al
+        posto delle quote casuali (3600 = mai): lo usano i test di LLMTransport."""
+    def __init__(self, handshake: float, first_token: float, token_interval: float, slow_share: float,
+                 slow: float, stall_share: float, idle_close: float, seed: int = 0, delays: list = None):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.handshake = handshake
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.slow_share = slow_share
+        self.slow = slow
+        self.stall_share = stall_share
+        self.idle_close = idle_close
+        self.rng = random.Random(seed)
+        self.delays = deque(delays or ())
+        self.connections = 0
+        self.heads = 0
+        self.aborted = 0
+        self.closed = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.closed.set()
+        self.shutdown()
+        self.server_close()
+
+
+""" Primo delta di testo di uno stream della Responses API, in secondi da start."""
+def first_delta(stream, start: float):
+    latency = None
+    for event in stream:
+        if latency is None and event.type == "response.output_text.delta":
+            latency = time.perf_counter() - start
+    return latency
+
+
+def run_config(name: str, server: StubServer, args) -> dict:
+    transport = None
+    if name == "client":
+        from openai import OpenAI
+        client = OpenAI(api_key="stub", base_url=server.base_url)
+    else:
+        transport = LLMTransport(api_key="stub", base_url=server.base_url, hedge=name == "hedge",
+                                 first_token_timeout=args.deadline, read_timeout=args.deadline,
+                                 warm_seconds=args.idle_close / 2)
+        client = transport.client
+    connections = server.connections
+    latencies, failures = [], 0
+    for turn in range(args.turns):
+        time.sleep(args.idle)
+        if transport is not None and name != "pool":
+            transport.preconnect() # la wakeword è appena stata rilevata
+        time.sleep(args.speech)
+        start = time.perf_counter()
+        request = dict(model="stub", input=[{"role": "user", "content": "che ore sono?"}], max_output_tokens=400)
+        try:
+            if transport is None:
+                stream = client.responses.create(stream=True, **request)
+            else:
+                stream = transport.stream(**request)
+            latency = first_delta(stream, start)
+        except Exception as e:
+            latency = None
+            print(f"{name}: turno {turn} fallito dopo {time.perf_counter() - start:.1f}s: {e}")
+        if latency is None:
+            failures += 1
+        else:
+            latencies.append(latency * 1000)
+    latencies.sort()
+    result = {
+        "config": name,
+        "p50_ms": percentile(latencies, 50) if latencies else None,
+        "p95_ms": percentile(latencies, 95) if latencies else None,
+        "max_ms": latencies[-1] if latencies else None,
+        "failures": failures,
+        "connections": server.connections - connections,
+        "hedges": transport.hedges if transport else 0
+    }
+    if transport is not None:
+        transport.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--handshake", type=float, default=0.15, help="secondi di attesa su ogni nuova connessione")
+    parser.add_argument("--first-token", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--slow-share", type=float, default=0.1)
+    parser.add_argument("--slow", type=float, default=2.0)
+    parser.add_argument("--stall-share", type=float, default=0.0)
+    parser.add_argument("--idle-close", type=float, default=2.0, help="il server chiude le connessioni inattive")
+    parser.add_argument("--idle", type=float, default=3.0, help="secondi tra la fine di un turno e la wakeword")
+    parser.add_argument("--speech", type=float, default=1.0, help="secondi tra la wakeword e la richiesta")
+    parser.add_argument("--deadline", type=float, default=8.0, help="tempo massimo al primo token del trasporto")
+    parser.add_argument("--configs", default="client,pool,preconnect,hedge")
+    args = parser.parse_args()
+
+    print(f"{'config':<11} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'falliti':>8} {'conness.':>9} {'hedge':>6}")
+    for name in args.configs.split(","):
+        # server nuovo per ogni configurazione: stessa sequenza di richieste lente
+        server = StubServer(args.handshake, args.first_token, args.token_interval, args.slow_share,
+                            args.slow, args.stall_share, args.idle_close).start()
+        try:
+            result = run_config(name, server, args)
+        finally:
+            server.stop()
+        print(f"{name:<11} {result['p50_ms'] or 0:>8.0f} {result['p95_ms'] or 0:>8.0f} {result['max_ms'] or 0:>8.0f} "
+              f"{result['failures']:>8} {result['connections']:>9} {result['hedges']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+""" Soglie fisse contro rumore di fondo adattivo nel VAD e nel controllo del silenzio di
+    AerisEars, su turni sintetici a 16kHz: mezzo secondo di rumore (il preroll), una
+    frase di parlato simulato (armoniche di una fondamentale modulate a sillabe, con
+    pause tra le parole) e poi solo rumore finché il VAD non chiude il turno. Senza
+    fine del turno la registrazione si ferma dopo --max-turn secondi (timeout).
+
+    Scenari: stanza silenziosa, voce sommessa in stanza silenziosa, stanza rumorosa e
+    molto rumorosa (rumore a bassa frequenza come ventole ed elettrodomestici). Ogni
+    scenario esegue --turns turni consecutivi: la stima del rumore resta tra un turno e
+    l'altro come in AerisEars.
+
+    Per ogni modalità riporta la durata media del turno, i secondi medi di audio mandati
+    a whisper, i turni finiti per timeout e quelli in cui il parlato è andato perso.
+    In fondo il costo della stima del rumore e della sottrazione spettrale per secondo
+    di audio e il miglioramento del rapporto segnale/rumore della sottrazione.
+
+    Uso: python -m benchmark.noise_bench [--turns 3] [--max-turn 15]"""
+import argparse
+import time
+import numpy as np
+from audio.noise import GainNormalizer, NoiseFloor, SpectralDenoiser, frame_rms
+from audio.vad import VoiceActivityDetector
+
+RATE = 16000
+BLOCK = 480 # ~30 ms, come i blocchi ricampionati di AerisEars
+SILENCE_THRESHOLD = 0.05 # picco minimo fisso di AerisEars
+
+SCENARIOS = [
+    # nome, RMS del rumore, RMS del parlato
+    ("silenziosa", 0.0005, 0.1),
+    ("voce sommessa", 0.0005, 0.01),
+    ("rumorosa", 0.03, 0.12),
+    ("molto rumorosa", 0.06, 0.2)
+]
+
+
+""" Rumore a bassa frequenza: rumore bianco filtrato passa-basso (media mobile)."""
+def make_noise(seconds: float, rms: float, rng) -> np.ndarray:
+    white = rng.standard_normal(int(seconds * RATE) + 16)
+    noise = np.convolve(white, np.ones(16) / 16, mode="valid")[:int(seconds * RATE)]
+    return (noise / np.sqrt(np.mean(noise ** 2)) * rms).astype(np.float32)
+
+
+""" Parlato simulato: parole da 2-4 sillabe a ~5 sillabe al secondo separate da pause,
+    armoniche di una fondamentale che varia lentamente."""
+def make_speech(rms: float, rng, words: int = 6) -> np.ndarray:
+    parts = []
+    for _ in range(words):
+        syllables = rng.integers(2, 5)
+        n = int(syllables * 0.2 * RATE)
+        t = np.arange(n) / RATE
+        f0 = 120 + 30 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, 6))
+        phase = 2 * np.pi * np.cumsum(f0) / RATE
+        voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+        envelope = np.sin(np.pi * ((t * 5) % 1)) ** 2
+        parts.append(voice * envelope)
+        parts.append(np.zeros(int(rng.uniform(0.08, 0.2) * RATE)))
+    speech = np.concatenate(parts)
+    active = speech[np.abs(speech) > 0]
+    return (speech / np.sqrt(np.mean(active ** 2)) * rms).astype(np.float32)
+
+
+def is_silent(segment: np.ndarray, floor: NoiseFloor, frame_length: int) -> bool:
+    if floor is None:
+        return np.max(np.abs(segment)) < SILENCE_THRESHOLD
+    return np.max(frame_rms(segment, frame_length)) < floor.on_threshold()
+
+
+""" Un turno: restituisce secondi registrati, secondi mandati a whisper, timeout e
+    parlato trovato."""
+def run_turn(vad: VoiceActivityDetector, floor, speech, noise_rms, max_turn, rng):
+    lead = make_noise(0.5, noise_rms, rng)
+    tail = make_noise(max_turn, noise_rms, rng)
+    audio = np.concatenate((lead, speech + make_noise(len(speech) / RATE, noise_rms, rng), tail))
+    limit = int(max_turn * RATE)
+    vad.reset()
+    segments = []
+    position = 0
+    while position < limit and not vad.turn_ended:
+        segments += vad.process(audio[position:position + BLOCK])
+        position += BLOCK
+    segment = vad.flush()
+    if segment is not None:
+        segments.append(segment)
+    sent = [s for s in segments if not is_silent(s, floor, vad.frame_length)]
+    return position / RATE, sum(len(s) for s in sent) / RATE, not vad.turn_ended, bool(sent)
+
+
+def run_scenario(name, noise_rms, speech_rms, adaptive, args):
+    rng = np.random.default_rng(1)
+    floor = NoiseFloor() if adaptive else None
+    vad = VoiceActivityDetector(sample_rate=RATE, end_silence=1.0, noise_floor=floor)
+    lengths, sent, timeouts, lost = [], [], 0, 0
+    for _ in range(args.turns):
+        speech = make_speech(speech_rms, rng)
+        length, seconds, timeout, heard = run_turn(vad, floor, speech, noise_rms, args.max_turn, rng)
+        lengths.append(length)
+        sent.append(seconds)
+        timeouts += timeout
+        lost += not heard
+    return np.mean(lengths), np.mean(sent), timeouts, lost
+
+
+""" Rapporto segnale/rumore in dB di noisy rispetto al parlato pulito."""
+def snr(clean: np.ndarray, noisy: np.ndarray) -> float:
+    noise = noisy - clean
+    return 10 * np.log10(np.sum(clean ** 2) / max(np.sum(noise ** 2), 1e-12))
+
+
+def costs(args):
+    rng = np.random.default_rng(2)
+    seconds = 10.0
+    audio = make_noise(seconds, 0.03, rng)
+    frames = audio[:len(audio) // 320 * 320].reshape(-1, 320)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    floor = NoiseFloor()
+    start = time.perf_counter()
+    for i in range(0, len(rms), 2): # ~2 frame per blocco da 30 ms
+        floor.track(rms[i:i + 2])
+    track_ms = (time.perf_counter() - start) * 1000 / seconds
+
+    speech = make_speech(0.12, rng)
+    noisy = speech + make_noise(len(speech) / RATE, 0.03, rng)
+    denoiser = SpectralDenoiser()
+    start = time.perf_counter()
+    for _ in range(10):
+        cleaned = denoiser.apply(noisy)
+    denoise_ms = (time.perf_counter() - start) * 100 / (len(noisy) / RATE)
+    gain = GainNormalizer()
+    soft = gain.apply(make_speech(0.01, rng))
+
+    print(f"\nstima del rumore: {track_ms:.2f} ms CPU per secondo di audio")
+    print(f"sottrazione spettrale: {denoise_ms:.2f} ms CPU per secondo di audio, "
+          f"SNR {snr(speech, noisy):.1f} dB -> {snr(speech, cleaned):.1f} dB")
+    print(f"guadagno su voce sommessa (RMS 0.01): x{gain.last_gain:.1f}, "
+          f"livello del parlato {np.percentile(frame_rms(soft), 90):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--max-turn", type=float, default=15.0, help="secondi dopo cui la registrazione si ferma")
+    args = parser.parse_args()
+
+    print(f"{'stanza':<15} {'soglie':<9} {'turno s':>8} {'a whisper s':>12} {'timeout':>8} {'persi':>6}")
+    totals = {}
+    for name, noise_rms, speech_rms in SCENARIOS:
+        for adaptive in (False, True):
+            mode = "adattive" if adaptive else "fisse"
+            length, sent, timeouts, lost = run_scenario(name, noise_rms, speech_rms, adaptive, args)
+            totals.setdefault(mode, []).append(sent)
+            print(f"{name:<15} {mode:<9} {length:>8.2f} {sent:>12.2f} {timeouts:>5}/{args.turns:<2} {lost:>3}/{args.turns:<2}")
+    fixed, adaptive = np.mean(totals["fisse"]), np.mean(totals["adattive"])
+    print(f"\naudio medio a whisper per turno: {fixed:.2f}s con soglie fisse, {adaptive:.2f}s adattive "
+          f"({(1 - adaptive / fixed) * 100 if fixed else 0:.0f}% in meno)")
+    costs(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+""" Latenza end-to-end dell'orchestratore asyncio guidato da file WAV registrati.
+    Il microfono è sostituito da FileCapture del replay, che scrive il WAV nel buffer di
+    cattura in tempo reale; wakeword, whisper, modello e voce sono sostituiti da finti backend con
+    tempi fissi, così il risultato misura solo l'orchestrazione.
+
+    Con --barge-in la stessa frase viene ripetuta mentre l'assistente risponde e viene
+    misurato il tempo tra l'interruzione e il silenzio dell'altoparlante.
+
+    Senza file usa le sessioni di tests/fixtures; il test di regressione con limiti sulla
+    latenza è tests/test_replay_latency.py.
+
+    Uso: python -m benchmark.pipeline_latency [--barge-in] [file.wav ...]"""
+import asyncio
+import glob
+import math
+import os
+import sys
+import threading
+import time
+import types
+import numpy as np
+from audio.bargein import BargeInMonitor
+from audio.resampler import StreamingResampler
+from audio.vad import VoiceActivityDetector
+from benchmark.stt_bench import load_wav
+from pipeline import AerisPipeline
+from replay.source import FileCapture
+
+RATE = 44100
+# sessioni usate senza argomenti, le stesse di tests/test_replay_latency.py
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+
+
+class FakeWakeword:
+    def __init__(self, at: int):
+        self.at = at
+        self.preroll_audio = None
+
+    def reset(self):
+        pass
+
+    def detect(self, block, position):
+        return position >= self.at
+
+
+class FakeEars:
+    def __init__(self):
+        self.target_rate = 16000
+        self.stream_step_seconds = 1.0
+        self.resampler = StreamingResampler(orig_sr=RATE, target_sr=16000)
+        self.vad = VoiceActivityDetector(end_silence=1.0)
+
+    def transcribe_audio(self, audio):
+        time.sleep(0.05 + 0.1 * len(audio) / 16000)
+        return "frase di prova"
+
+
+class FakeMind:
+    def __init__(self):
+        self.response = None
+
+    def preconnect(self):
+        pass
+
+    def begin_turn(self):
+        pass
+
+    def stream_response(self, prompt):
+        time.sleep(0.15) # tempo al primo token
+        words = "Certo. Questa è una risposta di prova, divisa in due frasi.".split(" ")
+        for word in words:
+            time.sleep(0.02)
+            yield word + " "
+        self.response = " ".join(words)
+
+
+class FakePlayer:
+    """ Simula il callback di PcmPlayer: un buffer ogni period secondi."""
+    def __init__(self, period: float = 512 / 22050):
+        self.period = period
+        self.done = threading.Event()
+        self.begin_time = None
+        self.first_sample_latency = None
+        self.end_time = 0.0
+        self.stopped = False
+        self.silenced = threading.Event()
+        self.silence_time = None
+        self.output_latency = period
+
+    def begin(self):
+        self.begin_time = time.perf_counter()
+        self.first_sample_latency = None
+        self.end_time = self.begin_time
+        self.stopped = False
+        self.done.clear()
+
+    def reference_level(self) -> float:
+        return 0.0 # nessuna eco: il microfono riceve solo il file
+
+    def duck(self, gain: float):
+        pass
+
+    def stop(self):
+        now = time.perf_counter()
+        self.stopped = True
+        self.end_time = now
+        # il silenzio parte dal prossimo callback
+        self.silence_time = self.begin_time + math.ceil((now - self.begin_time) / self.period) * self.period
+        self.silenced.set()
+        self.done.set()
+
+    def write(self, seconds: float):
+        if self.stopped:
+            return
+        now = time.perf_counter()
+        if self.first_sample_latency is None:
+            self.first_sample_latency = now - self.begin_time
+        self.end_time = max(self.end_time, now) + seconds
+
+    def end(self):
+        pass
+
+    def wait(self):
+        self.done.wait(max(self.end_time - time.perf_counter(), 0))
+
+
+class FakeVoice:
+    def __init__(self):
+        self.player = FakePlayer()
+
+    def feed(self, sentence: str):
+        time.sleep(0.03) # sintesi
+        self.player.write(len(sentence) * 0.06)
+
+
+def session(path: str, barge_in: bool = False):
+    speech = load_wav(path)
+    up = StreamingResampler(orig_sr=16000, target_sr=RATE)
+    speech = up.process(np.concatenate((speech, np.zeros(up.taps * 3, dtype=np.float32))))
+    silence = np.zeros(RATE, dtype=np.float32)
+    parts = [silence, speech, silence, silence, silence]
+    if barge_in:
+        # la domanda viene ripetuta 2 s dopo la fine del parlato, mentre l'assistente risponde
+        parts[4:] = [speech] + [silence] * 6
+    audio = np.concatenate(parts)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16), len(silence)
+
+
+async def run(path: str, barge_in: bool = False):
+    audio, wake_at = session(path, barge_in)
+    capture = FileCapture(audio)
+    wakeword = FakeWakeword(wake_at)
+    voice = FakeVoice()
+    aeris = types.SimpleNamespace(
+        capture=capture, wakeword=wakeword, ears=FakeEars(), mind=FakeMind(), voice=voice,
+        barge_in=BargeInMonitor(wakeword, capture, voice.player, trigger="vad") if barge_in else None
+    )
+    pipeline = AerisPipeline(aeris, max_turns=2 if barge_in else 1)
+    capture.start()
+    return await asyncio.wait_for(pipeline.run(), timeout=len(audio) / RATE + 10)
+
+
+def main():
+    barge_in = "--barge-in" in sys.argv
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(FIXTURES, "*.wav")))
+    for path in paths:
+        turns = asyncio.run(run(path, barge_in))
+        if not turns:
+            print(f"{path}: nessun turno completato")
+            continue
+        turn = turns[0]
+        if barge_in:
+            if "barge_in" not in turn:
+                print(f"{path}: la risposta non è stata interrotta")
+                continue
+            print(f"{path}: interruzione -> silenzio {(turn['silence'] - turn['barge_in']) * 1000:.0f} ms, "
+                  f"turni completati {len(turns)}")
+            continue
+        eos = turn.get("end_of_speech", turn["wake"])
+        report = ", ".join(f"{name} {(turn[name] - eos) * 1000:+.0f} ms"
+                           for name in ("stt_done", "llm_first_token", "tts_first_sample", "playback_done")
+                           if name in turn)
+        print(f"{path}: rispetto alla fine del parlato -> {report}")
+
+
+if __name__ == "__main__":
+    main()
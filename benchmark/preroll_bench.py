@@ -0,0 +1,37 @@
+""" Misura il costo del buffer di preroll: memoria occupata, tempo aggiunto ad ogni
+    frame del loop della wakeword e tempo di snapshot al momento della rilevazione.
+
+    Uso: python -m benchmark.preroll_bench [secondi_preroll ...]"""
+import sys
+import time
+import numpy as np
+from audio.preroll import PreRollBuffer
+
+
+def bench(seconds: float, frame_length: int = 512, frames: int = 20000):
+    buffer = PreRollBuffer(seconds=seconds)
+    frame = np.zeros(frame_length, dtype=np.int16)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        buffer.write(frame)
+    write_us = (time.perf_counter() - start) / frames * 1e6
+
+    start = time.perf_counter()
+    for _ in range(100):
+        buffer.snapshot()
+    snapshot_ms = (time.perf_counter() - start) / 100 * 1000
+
+    print(f"preroll {seconds:4.1f}s: {buffer.nbytes / 1024:7.1f} KiB, "
+          f"{write_us:6.2f} us per frame da {frame_length} campioni, "
+          f"{snapshot_ms:6.3f} ms di snapshot alla rilevazione")
+
+
+def main():
+    lengths = [float(a) for a in sys.argv[1:]] or [0.5, 1.0, 2.0, 5.0]
+    for seconds in lengths:
+        bench(seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+""" Benchmark di Aeris su sessioni registrate, senza microfono, chiavi né altoparlante.
+    Ogni sessione (WAV o PCM grezzo, con accanto un JSON facoltativo: vedi replay/harness.py)
+    viene riprodotta da FileCapture in un processo separato, così RSS e CPU non si sommano
+    tra sessioni. pvporcupine è sostituito dagli istanti annotati, OpenAI da un client con
+    tempi fissi e l'altoparlante da un player senza dispositivo; whisper è quello vero.
+
+    Per sessione riporta latenza wakeword -> primo campione della risposta (p50/p95),
+    fine del parlato -> primo campione, real-time factor di whisper, overflow della
+    cattura (blocchi scritti in ritardo), millisecondi di audio persi dai lettori, CPU
+    media e RSS. --stt-process worker esegue whisper in un processo separato, both
+    riproduce ogni sessione in entrambi i modi per confrontarli.
+    Senza sessioni indicate usa benchmark/sessions, o se manca ne compone una con le clip
+    di benchmark/clips (sintetizzate con Piper alla prima esecuzione).
+
+    --speed 0 riproduce il file alla velocità dei lettori invece che in tempo reale (solo
+    --mode threaded): la latenza dalla wakeword viene omessa perché anche il parlato è
+    accelerato e --max-p95-ms si applica a quella dalla fine del parlato. --tts piper usa la voce vera al posto di quella finta. Il processo
+    termina con errore se una sessione fallisce e, con --max-p95-ms, se supera la soglia
+    o non completa turni, per l'uso in CI.
+
+    Uso: python -m benchmark.replay_suite [--mode threaded|async] [--speed 1] [--stt hf]
+         [--stt-process inproc|worker|both] [--tts fake|piper] [--json report.json] [--max-p95-ms 3000] [sessione.wav | cartella ...]"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import wave
+import numpy as np
+
+SESSIONS_DIR = os.path.join(os.path.dirname(__file__), "sessions")
+AUDIO_EXTENSIONS = (".wav", ".raw", ".pcm")
+
+
+def find_sessions(paths: list) -> list:
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path):
+            sessions += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.lower().endswith(AUDIO_EXTENSIONS)]
+        else:
+            sessions.append(path)
+    return sessions
+
+
+""" Compone una sessione dalle clip del benchmark STT: ogni clip è preceduta da
+    lead secondi di silenzio e seguita da gap secondi per la risposta; la wakeword
+    è annotata all'inizio di ogni clip."""
+def compose_session(directory: str, voice: str, lead: float = 1.5, gap: float = 8.0) -> str:
+    from benchmark.stt_bench import load_clips, prepare_clips
+    prepare_clips(voice)
+    clips = load_clips()
+    if not clips:
+        return None
+    parts, wake, position = [], [], 0.0
+    for _, audio, _ in clips:
+        parts += [np.zeros(int(lead * 16000), dtype=np.float32), audio, np.zeros(int(gap * 16000), dtype=np.float32)]
+        wake.append(round(position + lead, 3))
+        position += lead + len(audio) / 16000 + gap
+    audio = (np.clip(np.concatenate(parts), -1, 1) * 32767).astype(np.int16)
+    path = os.path.join(directory, "clip.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(audio.tobytes())
+    with open(os.path.join(directory, "clip.json"), "w", encoding="utf-8") as f:
+        json.dump({"wake": wake}, f)
+    return path
+
+
+""" Eseguito nel processo figlio: una sessione, risultato in JSON sull'ultima riga."""
+def run_child(path: str, args):
+    from replay.harness import Session, run_session
+    result = run_session(Session(path), mode=args.mode, speed=args.speed, stt_backend=args.stt,
+                         tts=args.tts, voice_path=args.voice if args.tts == "piper" else None,
+                         streaming_stt=True if args.streaming else None, stt_worker=args.stt_process == "worker")
+    print(json.dumps(result))
+
+
+def run_isolated(path: str, args, stt_process: str) -> dict:
+    command = [sys.executable, "-m", "benchmark.replay_suite", "--child", path, "--stt-process", stt_process,
+               "--mode", args.mode, "--speed", str(args.speed), "--tts", args.tts, "--voice", args.voice]
+    if args.stt:
+        command += ["--stt", args.stt]
+    if args.streaming:
+        command.append("--streaming")
+    timeout = max(os.path.getsize(path) / 32000, 1) * 4 + 300
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"session": path, "stt_process": stt_process, "error": f"timeout dopo {timeout:.0f}s"}
+    lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+    if output.returncode != 0 or not lines:
+        return {"session": path, "stt_process": stt_process, "error": "".join(output.stderr.strip().splitlines()[-1:]) or "nessun risultato"}
+    return json.loads(lines[-1])
+
+
+def fmt(value, spec: str = ".0f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sessions", nargs="*")
+    parser.add_argument("--mode", choices=("threaded", "async"), default="threaded")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--stt", default=None, help="backend STT (hf, int8, onnx); di default AERIS_STT_BACKEND")
+    parser.add_argument("--tts", choices=("fake", "piper"), default="fake")
+    parser.add_argument("--voice", default="/home/aeris/aeris/speech/it_IT-paola-medium.onnx")
+    parser.add_argument("--stt-process", choices=("inproc", "worker", "both"), default="inproc",
+                        help="whisper nel processo di Aeris, in un worker separato o entrambi")
+    parser.add_argument("--streaming", action="store_true",
+                        help="trascrizione in streaming invece che a batch; di default AERIS_STREAMING_STT")
+    parser.add_argument("--json", default=None, help="salva i risultati in questo file")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--child", default=None)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = find_sessions(args.sessions or ([SESSIONS_DIR] if os.path.isdir(SESSIONS_DIR) else []))
+        if not paths:
+            composed = compose_session(directory, args.voice)
+            paths = [composed] if composed else []
+        if not paths:
+            print("Nessuna sessione: indica file o cartelle, oppure aggiungi clip in benchmark/clips")
+            sys.exit(1)
+        processes = ("inproc", "worker") if args.stt_process == "both" else (args.stt_process,)
+        results = [run_isolated(path, args, process) for path in paths for process in processes]
+
+    print(f"{'sessione':<20} {'stt':<7} {'turni':>7} {'wake p50':>9} {'wake p95':>9} {'parl p50':>9} "
+          f"{'RTF stt':>8} {'overflow':>8} {'persi ms':>8} {'locali':>7} {'CPU %':>6} {'RSS MB':>7}")
+    failed = False
+    for result in results:
+        if "error" in result:
+            failed = True
+            print(f"{os.path.basename(result['session']):<20} {result['stt_process']:<7} errore: {result['error']}")
+            continue
+        print(f"{result['session'][:20]:<20} {result['stt_process']:<7} {result['answered']:>3}/{result['wakes']:<3} "
+              f"{fmt(result['wake_to_response_p50_ms']):>9} {fmt(result['wake_to_response_p95_ms']):>9} "
+              f"{fmt(result['speech_to_response_p50_ms']):>9} {fmt(result['stt_rtf'], '.3f'):>8} "
+              f"{result['overflows']:>8} {fmt(result['dropped_ms']):>8} {result['intent_turns']:>7} "
+              f"{fmt(result['cpu_percent']):>6} {fmt(result['rss_peak_mb']):>7}")
+        # fuori dal tempo reale la soglia vale per la latenza dalla fine del parlato
+        p95 = result["wake_to_response_p95_ms"]
+        if p95 is None:
+            p95 = result["speech_to_response_p95_ms"]
+        if args.max_p95_ms is not None and (not result["answered"] or p95 > args.max_p95_ms):
+            failed = True
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
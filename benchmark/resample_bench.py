@@ -0,0 +1,56 @@
+""" Microbenchmark del resampling 44.1kHz -> 16kHz usato nel loop della wakeword.
+    Confronta il tempo di CPU per secondo di audio tra librosa.resample chiamato
+    su ogni blocco da 1411 campioni e il resampler polifase con stato.
+
+    Uso: python -m benchmark.resample_bench [secondi]"""
+import sys
+import time
+import numpy as np
+from audio.resampler import FrameResampler
+
+
+def make_signal(seconds: float, sr: int = 44100):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))
+    return (tone * 32767).astype(np.int16)
+
+
+""" Percorso originale: ogni blocco viene ricampionato da solo, il filtro viene
+    riprogettato ad ogni chiamata e l'uscita viene troncata/allungata a 512 campioni."""
+def bench_librosa(pcm, block: int = 1411):
+    import librosa
+    start = time.process_time()
+    for i in range(0, len(pcm) - block + 1, block):
+        frame = pcm[i:i + block].astype(np.float32)
+        frame = librosa.resample(frame, orig_sr=44100, target_sr=16000)
+        np.clip(frame, -32767, 32767).astype(np.int16)
+    return time.process_time() - start
+
+
+def bench_streaming(pcm, frame_length: int = 512):
+    resampler = FrameResampler(frame_length=frame_length)
+    block = resampler.block_size
+    start = time.process_time()
+    for i in range(0, len(pcm) - block + 1, block):
+        resampler.frames(pcm[i:i + block])
+    return time.process_time() - start
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    pcm = make_signal(seconds)
+
+    results = {"streaming": bench_streaming(pcm)}
+    try:
+        results["librosa"] = bench_librosa(pcm)
+    except ImportError:
+        print("librosa non installato, salto il confronto")
+
+    for name, cpu in results.items():
+        print(f"{name:>10}: {cpu / seconds * 1000:8.2f} ms CPU per secondo di audio "
+              f"({cpu / seconds * 100:.2f}% di un core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+""" Costo di avvio e contesa dei core dei componenti di Aeris.
+
+    Import: per ogni modulo pesante (torch e transformers per whisper, onnxruntime e
+    piper per la voce, openai e httpx per il modello, pyaudio, pvporcupine, librosa)
+    riporta il tempo di import e l'RSS aggiunto, ognuno in un processo nuovo così
+    moduli già caricati non falsano la misura. L'ultima riga importa Aeris: con gli
+    import pigri il costo resta quello di numpy e dei moduli di Aeris, torch non viene
+    caricato finché non serve la trascrizione nel processo.
+
+    Contesa: un thread che si sveglia ogni 23 ms come la callback di cattura (1024
+    campioni a 44.1kHz) mentre un carico di calcolo (matmul di torch, o di numpy se
+    torch manca) gira con 1, 2, ... thread. Riporta il ritardo p50/p99 e massimo del
+    risveglio e il throughput del carico: con tutti i core occupati il thread di
+    cattura arriva in ritardo, lasciandone uno libero no.
+
+    Uso: python -m benchmark.startup_bench [--skip-imports] [--threads 1,2,3,4] [--seconds 3]"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from metrics.resources import rss_mb
+from metrics.tracing import percentile
+
+MODULES = [
+    # componente, modulo
+    ("base", "numpy"),
+    ("stt", "torch"),
+    ("stt", "transformers"),
+    ("stt", "audio.stt_backends"),
+    ("tts", "onnxruntime"),
+    ("tts", "piper"),
+    ("llm", "httpx"),
+    ("llm", "openai"),
+    ("cattura", "pyaudio"),
+    ("wakeword", "pvporcupine"),
+    ("(non più usato)", "librosa"),
+    ("aeris", "Aeris")
+]
+HEAVY = ("torch", "transformers", "onnxruntime", "piper", "openai", "httpx", "pyaudio", "librosa")
+
+
+def child_import(module: str) -> dict:
+    before = rss_mb()
+    start = time.perf_counter()
+    try:
+        __import__(module)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "seconds": time.perf_counter() - start,
+        "rss_mb": rss_mb() - before,
+        "heavy": [name for name in HEAVY if name in sys.modules]
+    }
+
+
+""" Thread a risveglio periodico (come la callback di cattura) contro un carico di
+    matmul con threads thread: ritardi del risveglio in ms e operazioni al secondo."""
+def child_contention(threads: int, seconds: float) -> dict:
+    import threading
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        a = torch.randn(384, 384)
+        work, engine = (lambda: a @ a), "torch"
+    except ImportError:
+        import numpy as np # OPENBLAS_NUM_THREADS impostata dal processo padre
+        a = np.random.default_rng(0).standard_normal((384, 384), dtype=np.float32)
+        work, engine = (lambda: a @ a), "numpy"
+
+    period = 1024 / 44100
+    delays = []
+    stop = threading.Event()
+
+    def capture():
+        deadline = time.perf_counter() + period
+        while not stop.is_set():
+            time.sleep(max(0.0, deadline - time.perf_counter()))
+            delays.append((time.perf_counter() - deadline) * 1000)
+            deadline += period
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+    ops = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        work()
+        ops += 1
+    stop.set()
+    thread.join()
+    delays.sort()
+    return {"engine": engine, "p50_ms": percentile(delays, 50), "p99_ms": percentile(delays, 99),
+            "max_ms": delays[-1], "ops_s": ops / seconds}
+
+
+def run_child(args: list, env: dict = None) -> dict:
+    result = subprocess.run([sys.executable, "-m", "benchmark.startup_bench", *args],
+                            capture_output=True, text=True, env=env)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "processo fallito"}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skip-imports", action="store_true")
+    parser.add_argument("--threads", default=None, help="thread del carico, di default 1..core")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, _, value = args.child.partition(":")
+        if kind == "import":
+            print(json.dumps(child_import(value)))
+        else:
+            print(json.dumps(child_contention(int(value), args.seconds)))
+        return
+
+    cores = len(os.sched_getaffinity(0))
+    if not args.skip_imports:
+        print(f"{'componente':<16} {'modulo':<20} {'import s':>9} {'RSS MB':>8}  moduli pesanti caricati")
+        for component, module in MODULES:
+            result = run_child(["--child", f"import:{module}"])
+            if "error" in result:
+                print(f"{component:<16} {module:<20} {'-':>9} {'-':>8}  non disponibile ({result['error']})")
+                continue
+            heavy = ", ".join(result["heavy"]) or "nessuno"
+            print(f"{component:<16} {module:<20} {result['seconds']:>9.2f} {result['rss_mb']:>8.0f}  {heavy}")
+
+    threads = [int(t) for t in args.threads.split(",")] if args.threads else list(range(1, cores + 1))
+    print(f"\nCattura ogni 23 ms contro un carico di calcolo ({cores} core)")
+    print(f"{'thread':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'op/s':>8}")
+    for count in threads:
+        env = dict(os.environ, OMP_NUM_THREADS=str(count), OPENBLAS_NUM_THREADS=str(count),
+                   MKL_NUM_THREADS=str(count))
+        result = run_child(["--child", f"contention:{count}", "--seconds", str(args.seconds)], env=env)
+        if "error" in result:
+            print(f"{count:>7} non disponibile ({result['error']})")
+            continue
+        print(f"{count:>7} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['max_ms']:>8.2f} "
+              f"{result['ops_s']:>8.0f}  ({result['engine']})")
+
+
+if __name__ == "__main__":
+    main()
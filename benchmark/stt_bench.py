@@ -0,0 +1,180 @@
+""" Benchmark dei backend di trascrizione di AerisEars (hf, int8, onnx).
+    Per ogni backend riporta real-time factor, picco di RSS e WER sulle clip italiane
+    in benchmark/clips. Ogni clip è una coppia nome.wav / nome.txt; le frasi di
+    frasi.txt senza wav vengono sintetizzate con Piper alla prima esecuzione.
+    Ogni backend gira in un processo separato così il picco di RSS non si somma.
+
+    Le clip sintetizzate (frase_NN.wav) sono audio TTS pulito: niente rumore, eco,
+    riverbero né accenti, quindi il WER che ne risulta è un limite inferiore e serve a
+    confrontare i backend tra loro, non a stimare la precisione sul microfono della
+    scheda. Per quello --clips indica una cartella di registrazioni vere, con la stessa
+    struttura nome.wav / nome.txt (trascrizione di riferimento); con --clips non viene
+    sintetizzato nulla.
+
+    Con --decoding si sceglie la politica di decodifica (greedy o beam).
+
+    Uso: python -m benchmark.stt_bench [--backends hf,int8,onnx] [--decoding greedy] [--voice modello.onnx]
+         [--clips cartella]"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+import wave
+import numpy as np
+from audio.resampler import StreamingResampler
+
+CLIPS_DIR = os.path.join(os.path.dirname(__file__), "clips")
+DEFAULT_VOICE = "/home/aeris/aeris/speech/it_IT-paola-medium.onnx"
+
+
+def normalize(text: str) -> list:
+    text = re.sub(r"[^\w\s']", " ", text.lower())
+    return text.split()
+
+
+""" Word error rate tramite distanza di Levenshtein sulle parole."""
+def wer(reference: str, hypothesis: str) -> float:
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    if not ref:
+        return float(bool(hyp))
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+""" Legge un wav mono int16 e lo restituisce in float32 a 16kHz."""
+def load_wav(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as wav:
+        rate = wav.getframerate()
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        if wav.getnchannels() > 1:
+            audio = audio.reshape(-1, wav.getnchannels())[:, 0]
+    audio = audio.astype(np.float32) / 32768.0
+    if rate != 16000:
+        resampler = StreamingResampler(orig_sr=rate, target_sr=16000)
+        audio = np.concatenate((resampler.process(audio), resampler.process(np.zeros(resampler.taps, dtype=np.float32))))
+    return audio
+
+
+""" Sintetizza con Piper le frasi di frasi.txt che non hanno ancora un wav."""
+def prepare_clips(voice: str):
+    phrases_path = os.path.join(CLIPS_DIR, "frasi.txt")
+    if not os.path.exists(phrases_path):
+        return
+    with open(phrases_path, encoding="utf-8") as f:
+        phrases = [line.strip() for line in f if line.strip()]
+
+    missing = [(i, p) for i, p in enumerate(phrases)
+               if not os.path.exists(os.path.join(CLIPS_DIR, f"frase_{i:02d}.wav"))]
+    if not missing:
+        return
+    from piper import PiperVoice
+    tts = PiperVoice.load(voice)
+    for i, phrase in missing:
+        base = os.path.join(CLIPS_DIR, f"frase_{i:02d}")
+        with wave.open(base + ".wav", "wb") as wav:
+            tts.synthesize_wav(phrase, wav)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(phrase + "\n")
+
+
+""" True per le clip che prepare_clips ha sintetizzato con Piper."""
+def is_synthetic(clips_dir: str, name: str) -> bool:
+    return os.path.abspath(clips_dir) == os.path.abspath(CLIPS_DIR) and re.fullmatch(r"frase_\d+\.wav", name) is not None
+
+
+def load_clips(clips_dir: str = CLIPS_DIR) -> list:
+    clips = []
+    for name in sorted(os.listdir(clips_dir)):
+        if not name.endswith(".wav"):
+            continue
+        base = os.path.join(clips_dir, name[:-4])
+        if not os.path.exists(base + ".txt"):
+            continue
+        with open(base + ".txt", encoding="utf-8") as f:
+            clips.append((name, load_wav(base + ".wav"), f.read().strip()))
+    return clips
+
+
+""" Eseguito nel processo figlio: carica un backend e trascrive tutte le clip."""
+def run_backend(name: str, model: str, decoding: str = "greedy", clips_dir: str = CLIPS_DIR) -> dict:
+    from audio.decoding import get_policy
+    from audio.stt_backends import get_backend
+    clips = load_clips(clips_dir)
+
+    start = time.perf_counter()
+    backend = get_backend(name, model, policy=get_policy(decoding))
+    load_time = time.perf_counter() - start
+    backend.transcribe(np.zeros(16000, dtype=np.float32)) # warm-up
+
+    audio_seconds = processing = errors = 0.0
+    tokens = fallbacks = 0
+    for _, audio, reference in clips:
+        start = time.perf_counter()
+        hypothesis = backend.transcribe(audio)
+        processing += time.perf_counter() - start
+        audio_seconds += len(audio) / 16000
+        errors += wer(reference, hypothesis)
+        tokens += backend.last_stats[0]["tokens"]
+        fallbacks += backend.last_stats[0]["fallbacks"]
+
+    return {
+        "backend": name,
+        "clips": len(clips),
+        "synthetic": sum(is_synthetic(clips_dir, clip) for clip, _, _ in clips),
+        "load_s": load_time,
+        "rtf": processing / audio_seconds if audio_seconds else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "wer": errors / len(clips) if clips else 0.0,
+        "tokens": tokens,
+        "fallbacks": fallbacks
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="hf,int8,onnx")
+    parser.add_argument("--model", default="openai/whisper-base")
+    parser.add_argument("--voice", default=DEFAULT_VOICE)
+    parser.add_argument("--decoding", default="greedy")
+    parser.add_argument("--clips", default=CLIPS_DIR, help="cartella di registrazioni nome.wav / nome.txt")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.model, args.decoding, args.clips)))
+        return
+
+    if os.path.abspath(args.clips) == os.path.abspath(CLIPS_DIR):
+        prepare_clips(args.voice)
+    synthetic = None
+    print(f"{'backend':>8} {'clip':>5} {'carico':>8} {'RTF':>7} {'RSS MB':>8} {'WER':>6} {'token':>6} {'fallback':>8}")
+    for name in args.backends.split(","):
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmark.stt_bench", "--child", name, "--model", args.model,
+             "--decoding", args.decoding, "--clips", args.clips],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{name:>8} errore: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{r['backend']:>8} {r['clips']:>5} {r['load_s']:>7.1f}s {r['rtf']:>7.3f} "
+              f"{r['peak_rss_mb']:>8.0f} {r['wer']:>6.1%} {r['tokens']:>6} {r['fallbacks']:>8}")
+        synthetic = (r["synthetic"], r["clips"])
+
+    if synthetic and synthetic[0]:
+        print(f"\nAttenzione: {synthetic[0]} clip su {synthetic[1]} sono sintetizzate con Piper (audio TTS "
+              f"pulito): il WER non rappresenta il parlato registrato dal microfono. "
+              f"Per quello usa --clips con registrazioni vere.")
+
+
+if __name__ == "__main__":
+    main()
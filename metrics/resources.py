@@ -0,0 +1,126 @@
+import contextlib
+import os
+import resource
+import sys
+import threading
+import time
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+""" RSS attuale in MB di un processo (di default questo), letto da /proc/<pid>/statm.
+    None se il processo non esiste più."""
+def rss_mb(pid="self") -> float:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB su Linux
+
+
+class ResourceReport:
+    """ Costo di avvio e memoria di ogni componente (stt, tts, llm, cattura, wakeword).
+        imports() misura il tempo speso negli import pesanti fatti solo quando servono
+        (torch e transformers, piper, openai e httpx, pyaudio, pvporcupine) e quanti
+        moduli hanno aggiunto; component() misura caricamento e RSS aggiunto dal
+        componente. Con i componenti caricati in parallelo l'RSS aggiunto da uno contiene
+        anche quello degli altri: per attribuirlo bene si carica in sequenza
+        (AERIS_PROFILE_STARTUP=1). I componenti in un altro processo (il worker di
+        trascrizione) riportano l'RSS di quel processo con set_process()."""
+    def __init__(self):
+        self.components = {}
+        self.started_rss = rss_mb()
+        self._lock = threading.Lock()
+
+    def _entry(self, name: str) -> dict:
+        return self.components.setdefault(name, {"import_s": 0.0, "modules": 0, "load_s": None,
+                                                 "rss_mb": None, "process": None})
+
+    """ Misura gli import fatti nel blocco: tempo e moduli nuovi in sys.modules."""
+    @contextlib.contextmanager
+    def imports(self, name: str):
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self._entry(name)
+                entry["import_s"] += elapsed
+                entry["modules"] += max(0, len(sys.modules) - modules)
+
+    """ Misura caricamento (import compresi) e RSS aggiunto dal componente."""
+    @contextlib.contextmanager
+    def component(self, name: str):
+        before = rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            after = rss_mb()
+            with self._lock:
+                entry = self._entry(name)
+                entry["load_s"] = elapsed
+                if entry["process"] is None and before is not None and after is not None:
+                    entry["rss_mb"] = after - before
+
+    """ Il componente gira in un altro processo: process è un oggetto con l'attributo pid
+        (letto ad ogni report, così un worker riavviato resta seguito) e il suo RSS è
+        quello del processo. import_s è il tempo di import misurato nel processo stesso."""
+    def set_process(self, name: str, process, import_s: float = None):
+        with self._lock:
+            entry = self._entry(name)
+            entry["process"] = process
+            if import_s is not None:
+                entry["import_s"] = import_s
+
+    def summary(self) -> dict:
+        with self._lock:
+            components = {}
+            for name, entry in self.components.items():
+                entry = dict(entry)
+                process = entry.pop("process")
+                entry["pid"] = getattr(process, "pid", None)
+                if process is not None:
+                    entry["rss_mb"] = rss_mb(entry["pid"]) if entry["pid"] else None
+                components[name] = entry
+        return {"components": components, "rss_mb": rss_mb(), "rss_start_mb": self.started_rss,
+                "rss_peak_mb": peak_rss_mb()}
+
+    """ Stampa una riga per componente con prefisso label: all'avvio ([AVVIO]) e alla
+        chiusura, quando l'RSS del processo è quello a regime dopo i turni."""
+    def print_report(self, label: str = "[AVVIO]"):
+        summary = self.summary()
+        for name, entry in summary["components"].items():
+            modules = f" ({entry['modules']} moduli)" if entry["modules"] else ""
+            parts = [f"import {entry['import_s']:.2f}s{modules}"]
+            if entry["load_s"] is not None:
+                parts.append(f"caricamento {entry['load_s']:.2f}s")
+            if entry["rss_mb"] is not None:
+                where = f" (processo {entry['pid']})" if entry["pid"] is not None else ""
+                sign = "" if entry["pid"] is not None else "+"
+                parts.append(f"RSS {sign}{entry['rss_mb']:.0f} MB{where}")
+            print(f"{label} {name}: {', '.join(parts)}")
+        if summary["rss_mb"] is not None:
+            print(f"{label} RSS del processo {summary['rss_mb']:.0f} MB "
+                  f"(picco {summary['rss_peak_mb']:.0f} MB, {summary['rss_start_mb'] or 0:.0f} MB all'import)")
+
+
+_RESOURCES = None
+_RESOURCES_LOCK = threading.Lock()
+
+
+""" Report condiviso dal processo, creato al primo uso."""
+def get_resources() -> ResourceReport:
+    global _RESOURCES
+    if _RESOURCES is None:
+        with _RESOURCES_LOCK:
+            if _RESOURCES is None:
+                _RESOURCES = ResourceReport()
+    return _RESOURCES
@@ -0,0 +1,199 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+""" Istanti di un turno nell'ordine in cui avvengono."""
+TURN_MARKS = (
+    "wake",
+    "first_audio",
+    "end_of_speech",
+    "stt_done",
+    "llm_first_token",
+    "llm_done",
+    "tts_first_sample",
+    "playback_done"
+)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Tracer:
+    """ Traccia dei turni dell'assistente. Ogni turno raccoglie gli istanti principali
+        (time.perf_counter, monotono), il tempo di CPU e di orologio speso in ogni stadio
+        e la profondità massima delle code. A fine turno il record viene scritto come
+        riga JSON in path (se indicato) e aggiunto a finestre mobili da cui summary()
+        calcola p50/p95/p99 per stadio.
+
+        Si usa un turno alla volta: i componenti chiamano mark/stage/queue_depth sul
+        turno corrente senza doverselo passare. Da disattivato ogni metodo esce alla
+        prima riga e stage() restituisce un context manager vuoto condiviso."""
+    def __init__(self, path: str = None, enabled: bool = True, window: int = 200):
+        self.enabled = enabled
+        self.path = path
+        self.window = window
+        self.current = None
+        self.turns = 0
+        self._series = {} # nome -> deque dei valori in ms degli ultimi window turni
+        self._lock = threading.Lock()
+        self._file = None
+        if enabled and path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    """ Apre un nuovo turno: l'istante di inizio è la rilevazione della wakeword."""
+    def begin(self, **info):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self.current = {"marks": {"wake": now}, "cpu": {}, "wall": {}, "queues": {}, "info": info}
+
+    """ Registra un istante del turno corrente; vale solo la prima occorrenza."""
+    def mark(self, name: str, at: float = None):
+        if not self.enabled:
+            return
+        turn = self.current
+        if turn is not None and name not in turn["marks"]:
+            turn["marks"][name] = time.perf_counter() if at is None else at
+
+    """ Context manager che somma al turno corrente tempo di CPU del thread e tempo
+        di orologio del blocco."""
+    def stage(self, name: str):
+        if not self.enabled or self.current is None:
+            return _NULL_STAGE
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name: str):
+        turn = self.current
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            with self._lock:
+                turn["cpu"][name] = turn["cpu"].get(name, 0.0) + cpu
+                turn["wall"][name] = turn["wall"].get(name, 0.0) + wall
+
+    """ Registra la profondità di una coda; nel turno resta il massimo osservato."""
+    def queue_depth(self, name: str, depth: int):
+        if not self.enabled:
+            return
+        turn = self.current
+        if turn is not None and depth > turn["queues"].get(name, -1):
+            turn["queues"][name] = depth
+
+    """ Chiude il turno corrente. marks permette di aggiungere istanti raccolti altrove
+        (ad esempio dall'orchestratore asyncio) senza sovrascrivere quelli già presenti."""
+    def end(self, marks: dict = None, **info):
+        if not self.enabled:
+            return None
+        with self._lock:
+            turn, self.current = self.current, None
+        if turn is None:
+            return None
+        for name, at in (marks or {}).items():
+            if isinstance(at, float):
+                turn["marks"].setdefault(name, at)
+        turn["marks"].setdefault("playback_done", time.perf_counter())
+        turn["info"].update(info)
+
+        wake = turn["marks"]["wake"]
+        record = {
+            "turn": self.turns,
+            "time": time.time(),
+            "marks_ms": {name: (at - wake) * 1000 for name, at in sorted(turn["marks"].items(), key=lambda m: m[1])},
+            "cpu_ms": {name: value * 1000 for name, value in turn["cpu"].items()},
+            "wall_ms": {name: value * 1000 for name, value in turn["wall"].items()},
+            "queues": turn["queues"],
+            **turn["info"]
+        }
+        with self._lock:
+            self.turns += 1
+            for name, value in record["marks_ms"].items():
+                if name != "wake":
+                    self._add(name, value)
+            for name, value in record["cpu_ms"].items():
+                self._add(f"cpu:{name}", value)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+        return record
+
+    def _add(self, name: str, value: float):
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = deque(maxlen=self.window)
+        series.append(value)
+
+    """ Percentili p50/p95/p99 (ms dalla wakeword, o ms di CPU per "cpu:stadio")
+        sugli ultimi window turni."""
+    def summary(self) -> dict:
+        with self._lock:
+            series = {name: sorted(values) for name, values in self._series.items()}
+        return {name: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99)
+        } for name, values in series.items() if values}
+
+    def print_summary(self):
+        if not self.enabled or not self.turns:
+            return
+        summary = self.summary()
+        print(f"[TRACCIA] ultimi {min(self.turns, self.window)} turni (ms)")
+        names = [name for name in TURN_MARKS if name in summary] + \
+                sorted(name for name in summary if name not in TURN_MARKS)
+        for name in names:
+            s = summary[name]
+            print(f"  {name:>18}: p50 {s['p50']:8.0f}  p95 {s['p95']:8.0f}  p99 {s['p99']:8.0f}  (n={s['count']})")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+""" Percentile con interpolazione lineare su valori già ordinati."""
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * q / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+
+""" Tracer condiviso dal processo. È attivo solo se AERIS_TRACE è impostata: con un
+    percorso la traccia viene scritta in quel file JSONL, con "1" in ~/.cache/aeris/trace.jsonl."""
+def get_tracer() -> Tracer:
+    global _TRACER
+    if _TRACER is None:
+        with _TRACER_LOCK:
+            if _TRACER is None:
+                setting = os.getenv("AERIS_TRACE", "")
+                if not setting or setting == "0":
+                    _TRACER = Tracer(enabled=False)
+                else:
+                    path = setting
+                    if setting.lower() in ("1", "true", "yes"):
+                        path = os.path.join(os.path.expanduser("~"), ".cache", "aeris", "trace.jsonl")
+                    _TRACER = Tracer(path=path)
+    return _TRACER
+
+
+""" Sostituisce il tracer condiviso, ad esempio con uno che scrive in un file per
+    ogni sessione del replay. Va chiamata prima di creare i componenti."""
+def set_tracer(tracer: Tracer):
+    global _TRACER
+    with _TRACER_LOCK:
+        _TRACER = tracer
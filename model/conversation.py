@@ -0,0 +1,150 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+_ENCODING = None
+
+
+""" Numero di token del testo. Usa tiktoken se è installato, altrimenti la stima
+    di circa 4 caratteri per token."""
+def count_tokens(text: str) -> int:
+    global _ENCODING
+    if not text:
+        return 0
+    if _ENCODING is None:
+        try:
+            import tiktoken
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODING = False
+    if _ENCODING:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+class ConversationSession:
+    """ Storico della conversazione inviato al modello insieme alla nuova domanda.
+        I turni (domanda, risposta) restano in una deque finché il totale dei token non
+        supera max_tokens; i turni più vecchi escono dalla finestra e vengono compattati
+        in un riassunto di al massimo summary_tokens. Ogni turno entra ed esce una volta
+        sola e il conteggio dei token è incrementale, quindi il taglio è O(1) ammortizzato
+        e il contesto inviato è limitato a max_tokens + summary_tokens.
+
+        summarize(riassunto, turni) -> str, se indicato, produce il nuovo riassunto in un
+        thread separato per non rallentare il turno; altrimenti, o se fallisce, il
+        riassunto è estrattivo (domanda e prima frase della risposta). Dopo idle_timeout
+        secondi senza turni la conversazione ricomincia da capo."""
+    def __init__(self,
+                 max_tokens: int = 1200,
+                 summary_tokens: int = 200,
+                 idle_timeout: float = 300.0,
+                 summarize: Callable = None):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.idle_timeout = idle_timeout
+        self.summarize = summarize
+
+        self.turns = deque() # (domanda, risposta, token)
+        self.tokens = 0
+        self.summary = ""
+        self.last_activity = None
+        self._evicted = [] # turni usciti dalla finestra e non ancora riassunti
+        self._compacting = False
+        self._generation = 0 # cresce ad ogni clear(): i riassunti in corso diventano vecchi
+        self._lock = threading.Lock()
+
+    def is_empty(self) -> bool:
+        self._expire()
+        return not self.turns and not self.summary
+
+    """ Ricomincia la conversazione. Un riassunto in corso in un altro thread appartiene
+        alla conversazione precedente e viene scartato quando termina."""
+    def clear(self):
+        with self._lock:
+            self.turns.clear()
+            self.tokens = 0
+            self.summary = ""
+            self._evicted = []
+            self._generation += 1
+            self._compacting = False
+
+    """ Aggiunge un turno completato e fa uscire dalla finestra i turni più vecchi
+        finché il budget di token è rispettato. L'ultimo turno resta sempre."""
+    def add(self, user: str, assistant: str):
+        self._expire()
+        tokens = count_tokens(user) + count_tokens(assistant)
+        with self._lock:
+            self.turns.append((user, assistant, tokens))
+            self.tokens += tokens
+            while self.tokens > self.max_tokens and len(self.turns) > 1:
+                old = self.turns.popleft()
+                self.tokens -= old[2]
+                self._evicted.append(old)
+            self.last_activity = time.monotonic()
+            compact = self._evicted and not self._compacting
+            if compact:
+                self._compacting = True
+        if compact:
+            if self.summarize:
+                threading.Thread(target=self._compact, daemon=True).start()
+            else:
+                self._compact()
+
+    """ Messaggi dello storico nel formato dell'API Responses: il riassunto come
+        messaggio developer seguito dai turni ancora nella finestra."""
+    def messages(self) -> list:
+        self._expire()
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({
+                    "role": "developer",
+                    "content": f"Riassunto della conversazione precedente: {self.summary}"
+                })
+            for user, assistant, _ in self.turns:
+                messages.append({"role": "user", "content": user})
+                messages.append({"role": "assistant", "content": assistant})
+            return messages
+
+    def _expire(self):
+        if self.last_activity is not None and time.monotonic() - self.last_activity > self.idle_timeout:
+            self.last_activity = None
+            self.clear()
+
+    def _compact(self):
+        while True:
+            with self._lock:
+                evicted, self._evicted = self._evicted, []
+                summary = self.summary
+                generation = self._generation
+                if not evicted:
+                    self._compacting = False
+                    return
+            new_summary = None
+            if self.summarize:
+                try:
+                    new_summary = self.summarize(summary, [(user, assistant) for user, assistant, _ in evicted])
+                except Exception as e:
+                    print(f"Errore nel riassunto della conversazione: {e}")
+            if not new_summary:
+                new_summary = self._extract(summary, evicted)
+            with self._lock:
+                if generation != self._generation:
+                    return # clear() durante il riassunto: la nuova sessione resta vuota
+                self.summary = self._truncate(new_summary.strip())
+
+    def _extract(self, summary: str, turns) -> str:
+        parts = [summary] if summary else []
+        for user, assistant, _ in turns:
+            first = re.split(r"(?<=[.!?])\s", assistant.strip(), maxsplit=1)[0]
+            parts.append(f"L'utente ha chiesto: {user.strip()} Aeris ha risposto: {first}")
+        return " ".join(parts)
+
+    """ Tiene la parte più recente del riassunto entro summary_tokens."""
+    def _truncate(self, summary: str) -> str:
+        while count_tokens(summary) > self.summary_tokens:
+            words = summary.split()
+            summary = " ".join(words[max(len(words) // 10, 1):])
+        return summary
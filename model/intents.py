@@ -0,0 +1,319 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from datetime import datetime
+from typing import Callable
+from metrics.tracing import percentile
+
+WEEKDAYS = ["lunedì", "martedì", "mercoledì", "giovedì", "venerdì", "sabato", "domenica"]
+MONTHS = ["gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno", "luglio",
+          "agosto", "settembre", "ottobre", "novembre", "dicembre"]
+
+UNITS = {"un": 1, "uno": 1, "una": 1, "due": 2, "tre": 3, "quattro": 4, "cinque": 5, "sei": 6,
+         "sette": 7, "otto": 8, "nove": 9, "dieci": 10, "undici": 11, "dodici": 12, "tredici": 13,
+         "quattordici": 14, "quindici": 15, "sedici": 16, "diciassette": 17, "diciotto": 18,
+         "diciannove": 19}
+TENS = {"venti": 20, "trenta": 30, "quaranta": 40, "cinquanta": 50, "sessanta": 60,
+        "settanta": 70, "ottanta": 80, "novanta": 90}
+
+# parole di cortesia e di richiamo che non cambiano il comando
+_LEADING = re.compile(r"^(?:(?:ehi|ok|okay|aeris|eris|allora|senti|scusa|per favore|mi|puoi|potresti|"
+                      r"dimmi|dici|sai|vorrei sapere|fammi sapere)\s+)+")
+_TRAILING = re.compile(r"(?:\s+(?:per favore|grazie|aeris|eris))+$")
+_SYMBOLS = re.compile(r"[^\w%]+")
+
+
+""" Testo in minuscolo senza accenti, apostrofi e punteggiatura, senza le parole di
+    cortesia all'inizio e alla fine: "Aeris, mi dici che ore sono?" -> "che ore sono"."""
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _SYMBOLS.sub(" ", text).strip()
+    text = _LEADING.sub("", text)
+    return _TRAILING.sub("", text)
+
+
+""" Numero scritto in cifre o in lettere ("5", "cinque", "venticinque", "ventotto"),
+    None se la parola non è un numero."""
+def parse_number(word: str):
+    if word.isdigit():
+        return int(word)
+    if word in UNITS:
+        return UNITS[word]
+    if word in TENS:
+        return TENS[word]
+    for tens, value in TENS.items():
+        # ventuno e ventotto perdono la vocale finale della decina
+        for stem in (tens, tens[:-1]):
+            if word.startswith(stem) and word[len(stem):] in UNITS:
+                return value + UNITS[word[len(stem):]]
+    return None
+
+
+class Intent:
+    """ Comando riconosciuto senza modello: pattern viene confrontato per intero con il
+        testo normalizzato, keywords sono le parole di cui almeno una deve comparire
+        perché il pattern venga provato, handler(match) restituisce la risposta da
+        pronunciare ("" per non dire nulla)."""
+    def __init__(self, name: str, pattern: str, keywords: tuple, handler: Callable):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.keywords = keywords
+        self.handler = handler
+
+
+class IntentEngine:
+    """ Risponde in locale ai comandi fissi (ora, data, timer, volume, stop, ripeti)
+        tra la trascrizione e il modello: solo il testo che non corrisponde a nessun
+        comando arriva ad AerisMind.
+
+        I pattern sono compilati una volta e indicizzati per parola chiave: il testo
+        normalizzato viene diviso in parole, l'indice dà gli intent candidati e solo i
+        loro pattern vengono provati, in ordine di registrazione. Un comando si
+        riconosce in pochi microsecondi.
+
+        voice serve a volume e stop, announce(testo) pronuncia gli avvisi dei timer
+        (di default li stampa), clock dà l'ora corrente. stats() riporta la quota di
+        turni serviti in locale e la latenza di ogni percorso registrata con record()."""
+    def __init__(self, voice=None, announce: Callable = None, clock: Callable = datetime.now,
+                 volume_step: float = 0.2, window: int = 200):
+        self.voice = voice
+        self.announce = announce or print
+        self.clock = clock
+        self.volume_step = volume_step
+
+        self.intents = []
+        self._index = {} # parola chiave -> intent che la usano
+        self.last_intent = None
+        self.last_response = ""
+
+        self.timers = [] # (scadenza time.monotonic, descrizione, threading.Timer)
+        self._timers_lock = threading.Lock()
+
+        self.turns = {"intent": 0, "llm": 0}
+        self._latencies = {"intent": deque(maxlen=window), "llm": deque(maxlen=window)}
+        self._match_times = deque(maxlen=window)
+
+        self.add("time", r"(?:che )?or[ae] (?:sono|e|fai|abbiamo)(?: adesso| ora)?|l ora(?: esatta)?",
+                 ("ora", "ore"), self.tell_time)
+        self.add("date", r"(?:che|qual e la) (?:giorno|data)(?: della settimana)? (?:e|abbiamo|e oggi)(?: oggi)?"
+                         r"|oggi che giorno e|quanti ne abbiamo(?: oggi)?|la data(?: di oggi)?",
+                 ("giorno", "data", "quanti"), self.tell_date)
+        self.add("timer_cancel", r"(?:annulla|cancella|ferma|togli|elimina|spegni)(?: il| i| tutti i)? timer",
+                 ("timer",), self.cancel_timers)
+        self.add("timer_left", r"quanto manca(?: al timer)?|(?:quanto|che) tempo (?:manca|resta)(?: al timer)?",
+                 ("manca", "resta"), self.timer_left)
+        self.add("timer", r"(?:(?:imposta|metti|avvia|fai partire|fissa|parti con) )?(?:un )?"
+                          r"(?:timer|conto alla rovescia)(?: (?:di|da|per|a))? (?P<amount>[a-z0-9]+)"
+                          r"(?: (?P<unit>second[io]|minut[io]|or[ae]))?(?P<half> e mezzo)?",
+                 ("timer", "rovescia"), self.start_timer)
+        self.add("volume_up", r"(?:alza|aumenta)(?: un po)?(?: il)? volume(?: della musica)?|volume piu alto|(?:parla )?piu forte",
+                 ("alza", "aumenta", "alto", "forte"), lambda match: self.change_volume(self.volume_step))
+        self.add("volume_down", r"(?:abbassa|diminuisci|riduci)(?: un po)?(?: il)? volume(?: della musica)?|volume piu basso"
+                                r"|(?:parla )?piu piano",
+                 ("abbassa", "diminuisci", "riduci", "basso", "piano"),
+                 lambda match: self.change_volume(-self.volume_step))
+        self.add("volume_set", r"(?:(?:imposta|metti) )?(?:il )?volume (?:al |a )?"
+                               r"(?P<level>[a-z0-9]+)(?: per cento| ?%)?",
+                 ("volume",), self.set_volume)
+        self.add("stop", r"stop|basta(?: cosi)?|fermati|ferma|zitt[oa]|silenzio|smettila|annulla"
+                         r"|lascia (?:stare|perdere)|niente",
+                 ("stop", "basta", "fermati", "ferma", "zitto", "zitta", "silenzio", "smettila",
+                  "annulla", "lascia", "niente"), self.stop)
+        self.add("repeat", r"ripeti(?:mi)?(?: per favore)?(?: l ultima risposta| quello che hai detto)?"
+                           r"|ripetere|(?:come|cosa) hai detto|non ho capito",
+                 ("ripeti", "ripetimi", "ripetere", "detto", "capito"), self.repeat)
+
+    """ Registra un comando; i comandi aggiunti dopo vengono provati dopo."""
+    def add(self, name: str, pattern: str, keywords: tuple, handler: Callable):
+        intent = Intent(name, pattern, keywords, handler)
+        self.intents.append(intent)
+        for keyword in keywords:
+            self._index.setdefault(keyword, []).append(intent)
+        return intent
+
+    """ Intent e match del testo, None se nessun comando corrisponde."""
+    def match(self, text: str):
+        start = time.perf_counter()
+        normalized = normalize(text)
+        candidates = set()
+        for word in normalized.split():
+            candidates.update(self._index.get(word, ()))
+        result = None
+        if candidates:
+            for intent in self.intents:
+                if intent in candidates:
+                    match = intent.pattern.fullmatch(normalized)
+                    if match:
+                        result = (intent, match)
+                        break
+        self._match_times.append(time.perf_counter() - start)
+        return result
+
+    """ Risposta del comando contenuto nel testo, None se il testo va passato al modello.
+        Un handler che fallisce (ad esempio un numero non riconosciuto) lascia il testo
+        al modello."""
+    def handle(self, text: str):
+        found = self.match(text)
+        if found is None:
+            self.last_intent = None
+            return None
+        intent, match = found
+        try:
+            reply = intent.handler(match)
+        except Exception as e:
+            print(f"[INTENT] {intent.name} fallito: {e}")
+            self.last_intent = None
+            return None
+        self.last_intent = intent.name
+        if reply and intent.name != "repeat":
+            self.last_response = reply
+        return reply
+
+    """ Ultima risposta del modello, per il comando "ripeti"."""
+    def remember(self, response: str):
+        if response:
+            self.last_response = response
+
+    """ Registra la latenza di un turno dalla fine della trascrizione alla prima voce
+        (o alla risposta, se non c'è nulla da dire), per percorso: "intent" o "llm"."""
+    def record(self, path: str, seconds: float):
+        self.turns[path] += 1
+        self._latencies[path].append(seconds * 1000)
+
+    def stats(self) -> dict:
+        total = sum(self.turns.values())
+        match_times = sorted(t * 1e6 for t in self._match_times)
+        result = {
+            "turns": total,
+            "local_share": self.turns["intent"] / total if total else 0.0,
+            "match_p50_us": percentile(match_times, 50),
+            "match_p95_us": percentile(match_times, 95)
+        }
+        for path, values in self._latencies.items():
+            values = sorted(values)
+            result[f"{path}_p50_ms"] = percentile(values, 50) if values else None
+            result[f"{path}_p95_ms"] = percentile(values, 95) if values else None
+        return result
+
+    def print_stats(self):
+        stats = self.stats()
+        if not stats["turns"]:
+            return
+        paths = ", ".join(f"{name} p50 {stats[f'{path}_p50_ms']:.0f} ms"
+                          for path, name in (("intent", "locale"), ("llm", "modello"))
+                          if stats[f"{path}_p50_ms"] is not None)
+        print(f"Comandi locali: {stats['local_share']:.0%} dei turni, match in {stats['match_p50_us']:.0f} µs, "
+              f"risposta dopo la trascrizione {paths}")
+
+    def tell_time(self, match) -> str:
+        now = self.clock()
+        hour, minute = now.hour, now.minute
+        if hour == 0 and minute == 0:
+            return "È mezzanotte."
+        if hour == 12 and minute == 0:
+            return "È mezzogiorno."
+        text = "È l'una" if hour in (1, 13) else f"Sono le {hour}"
+        if minute == 0:
+            return f"{text} in punto."
+        if minute == 15:
+            return f"{text} e un quarto."
+        if minute == 30:
+            return f"{text} e mezza."
+        return f"{text} e {minute}."
+
+    def tell_date(self, match) -> str:
+        today = self.clock()
+        day = "primo" if today.day == 1 else str(today.day)
+        return f"Oggi è {WEEKDAYS[today.weekday()]} {day} {MONTHS[today.month - 1]} {today.year}."
+
+    def start_timer(self, match) -> str:
+        amount, unit = match.group("amount"), match.group("unit")
+        if amount == "mezz" and unit in ("ora", "ore"):
+            seconds = 1800
+        else:
+            value = parse_number(amount)
+            if value is None:
+                raise ValueError(f"durata non riconosciuta: {amount}")
+            unit = unit or "minuti"
+            seconds = value * {"s": 1, "m": 60, "o": 3600}[unit[0]]
+            if match.group("half"):
+                seconds += {"s": 0, "m": 30, "o": 1800}[unit[0]]
+        label = describe_duration(seconds)
+        timer = threading.Timer(seconds, self._ring)
+        timer.daemon = True
+        entry = (time.monotonic() + seconds, label, timer)
+        timer.args = (entry,)
+        with self._timers_lock:
+            self.timers.append(entry)
+        timer.start()
+        return f"Timer di {label} avviato."
+
+    def _ring(self, entry: tuple):
+        with self._timers_lock:
+            if entry not in self.timers:
+                return # annullato mentre scadeva
+            self.timers.remove(entry)
+        self.announce(f"Il timer di {entry[1]} è scaduto.")
+
+    def cancel_timers(self, match) -> str:
+        with self._timers_lock:
+            timers, self.timers = self.timers, []
+        for _, _, timer in timers:
+            timer.cancel()
+        if not timers:
+            return "Non ci sono timer attivi."
+        return "Timer annullato." if len(timers) == 1 else f"{len(timers)} timer annullati."
+
+    def timer_left(self, match) -> str:
+        now = time.monotonic()
+        with self._timers_lock:
+            pending = sorted(entry[0] for entry in self.timers if entry[0] > now)
+        if not pending:
+            return "Non ci sono timer attivi."
+        return f"Mancano {describe_duration(int(pending[0] - now + 0.5))}."
+
+    def change_volume(self, step: float) -> str:
+        player = self.voice.player
+        player.set_volume(player.volume + step)
+        return "Fatto."
+
+    def set_volume(self, match) -> str:
+        level = match.group("level")
+        if level == "massimo":
+            value = 100
+        elif level == "minimo":
+            value = 10
+        else:
+            value = parse_number(level)
+            if value is None:
+                raise ValueError(f"volume non riconosciuto: {level}")
+            value = value * 10 if value <= 10 else value # "volume a 7" vuol dire 70%
+        self.voice.player.set_volume(value / 100)
+        return "Fatto."
+
+    def stop(self, match) -> str:
+        if self.voice is not None:
+            self.voice.player.stop()
+        return ""
+
+    def repeat(self, match) -> str:
+        return self.last_response or "Non ho ancora detto nulla."
+
+    def close(self):
+        self.cancel_timers(None)
+
+
+""" Durata in parole: 90 -> "1 minuto e 30 secondi"."""
+def describe_duration(seconds: int) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    parts = []
+    for value, one, many in ((hours, "ora", "ore"), (minutes, "minuto", "minuti"), (secs, "secondo", "secondi")):
+        if value:
+            parts.append(f"{value} {one if value == 1 else many}")
+    if not parts:
+        return "0 secondi"
+    return parts[0] if len(parts) == 1 else ", ".join(parts[:-1]) + " e " + parts[-1]
@@ -0,0 +1,265 @@
+import os
+import re
+import threading
+import time
+import types
+from collections import deque
+from metrics.tracing import percentile
+from model.conversation import count_tokens
+from model.transport import LLMTransport
+
+
+class RemoteBackend:
+    """ Backend originale: API Responses di OpenAI attraverso LLMTransport (pool di
+        connessioni, tempi massimi, hedging). options passa parametri propri dell'API
+        Responses, ad esempio text={"verbosity": "medium"}."""
+    name = "openai"
+
+    def __init__(self, transport: LLMTransport, model: str = "gpt-4.1-mini"):
+        self.transport = transport
+        self.model = model
+
+    def create(self, input, max_output_tokens: int, instructions: str = None, **options):
+        if instructions:
+            options["instructions"] = instructions
+        return self.transport.create(model=self.model, input=input, max_output_tokens=max_output_tokens, **options)
+
+    def stream(self, input, max_output_tokens: int, instructions: str = None, cancel=None, **options):
+        if instructions:
+            options["instructions"] = instructions
+        return self.transport.stream(model=self.model, input=input, max_output_tokens=max_output_tokens,
+                                     cancel=cancel, **options)
+
+    def preconnect(self):
+        self.transport.preconnect()
+
+    def close(self):
+        self.transport.close()
+
+
+""" Campo di una risposta di chat completions: dizionario con llama-cpp-python,
+    oggetto con il client OpenAI."""
+def _field(obj, name: str):
+    if obj is None:
+        return None
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _usage(input_tokens: int, output_tokens: int):
+    return types.SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+class ChatStream:
+    """ Adatta i chunk in streaming di chat completions agli eventi dell'API Responses
+        letti da AerisMind: un response.output_text.delta per chunk di testo e alla fine
+        response.completed con l'uso dei token (stimato se il server non lo riporta)."""
+    def __init__(self, chunks, input_tokens: int):
+        self.chunks = chunks
+        self.input_tokens = input_tokens
+        self.closed = False
+
+    def __iter__(self):
+        parts = []
+        usage = None
+        for chunk in self.chunks:
+            if self.closed:
+                return
+            choices = _field(chunk, "choices") or []
+            delta = _field(_field(choices[0], "delta"), "content") if choices else None
+            if _field(chunk, "usage") is not None:
+                usage = _field(chunk, "usage")
+            if delta:
+                parts.append(delta)
+                yield types.SimpleNamespace(type="response.output_text.delta", delta=delta)
+        output_tokens = _field(usage, "completion_tokens") or count_tokens("".join(parts))
+        input_tokens = _field(usage, "prompt_tokens") or self.input_tokens
+        yield types.SimpleNamespace(type="response.completed",
+                                    response=types.SimpleNamespace(usage=_usage(input_tokens, output_tokens)))
+
+    def close(self):
+        self.closed = True
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                pass # generatore di llama-cpp in esecuzione: si ferma al prossimo chunk
+
+
+class LocalBackend:
+    """ Modello piccolo e quantizzato sulla CPU del dispositivo, in uno dei due modi:
+        - server locale compatibile con OpenAI (llama.cpp server, Ollama, llama-cpp-python)
+          all'indirizzo base_url, tramite l'API chat completions;
+        - in processo con llama-cpp-python se model_path indica un file GGUF
+          (dipendenza opzionale: pip install llama-cpp-python).
+        Le risposte vengono convertite nel formato dell'API Responses usato da AerisMind.
+        threads fissa i thread di llama.cpp in processo."""
+    name = "local"
+
+    def __init__(self,
+                 model: str = "qwen2.5:1.5b-instruct-q4_K_M",
+                 base_url: str = None,
+                 model_path: str = None,
+                 threads: int = None,
+                 context: int = 2048,
+                 timeout: float = 30.0):
+        self.model = model
+        self.base_url = base_url or "http://127.0.0.1:11434/v1"
+        self.model_path = model_path
+        self.threads = threads
+        self.context = context
+        self.timeout = timeout
+        self.llama = None
+        self.client = None
+        self.load_time = None
+        self._lock = threading.Lock()
+
+    """ Backend configurato dalle variabili d'ambiente, None se il modello locale non è
+        attivo: AERIS_LOCAL_LLM_PATH (GGUF in processo) oppure AERIS_LOCAL_LLM_URL (server),
+        con AERIS_LOCAL_LLM_MODEL e AERIS_LOCAL_LLM_THREADS facoltativi."""
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("AERIS_LOCAL_LLM_PATH")
+        url = os.getenv("AERIS_LOCAL_LLM_URL")
+        if not path and not url:
+            return None
+        kwargs = {"base_url": url, "model_path": path,
+                  "threads": int(os.getenv("AERIS_LOCAL_LLM_THREADS", "0")) or None}
+        if os.getenv("AERIS_LOCAL_LLM_MODEL"):
+            kwargs["model"] = os.getenv("AERIS_LOCAL_LLM_MODEL")
+        return cls(**kwargs)
+
+    def load(self):
+        with self._lock:
+            if self.llama is not None or self.client is not None:
+                return self
+            start = time.perf_counter()
+            if self.model_path:
+                try:
+                    from llama_cpp import Llama
+                except ImportError as e:
+                    raise ImportError("Il modello locale in processo richiede llama-cpp-python") from e
+                self.llama = Llama(model_path=self.model_path, n_ctx=self.context,
+                                   n_threads=self.threads or os.cpu_count(), verbose=False)
+            else:
+                import httpx
+                from openai import OpenAI
+                # server sulla stessa macchina: nessun retry, se non risponde decide il router
+                self.client = OpenAI(api_key="local", base_url=self.base_url, max_retries=0,
+                                     timeout=httpx.Timeout(self.timeout, connect=1.0))
+            self.load_time = time.perf_counter() - start
+            return self
+
+    """ Alla wakeword: carica il modello in processo mentre l'utente parla."""
+    def preconnect(self):
+        if self.llama is None and self.client is None:
+            threading.Thread(target=self.load, daemon=True).start()
+
+    """ Messaggi di chat completions dall'input dell'API Responses: il ruolo developer
+        diventa system, che i modelli locali conoscono."""
+    @staticmethod
+    def messages(input, instructions: str = None) -> list:
+        if isinstance(input, str):
+            input = [{"role": "user", "content": input}]
+        messages = [{"role": "system", "content": instructions}] if instructions else []
+        for message in input:
+            role = "system" if message["role"] == "developer" else message["role"]
+            messages.append({"role": role, "content": message["content"]})
+        return messages
+
+    def _complete(self, messages: list, max_tokens: int, stream: bool):
+        self.load()
+        if self.llama is not None:
+            return self.llama.create_chat_completion(messages=messages, max_tokens=max_tokens, stream=stream)
+        return self.client.chat.completions.create(model=self.model, messages=messages,
+                                                   max_tokens=max_tokens, stream=stream)
+
+    def create(self, input, max_output_tokens: int, instructions: str = None, **options):
+        messages = self.messages(input, instructions)
+        response = self._complete(messages, max_output_tokens, stream=False)
+        text = (_field(_field(_field(response, "choices")[0], "message"), "content") or "").strip()
+        usage = _field(response, "usage")
+        input_tokens = _field(usage, "prompt_tokens") or sum(count_tokens(m["content"]) for m in messages)
+        output_tokens = _field(usage, "completion_tokens") or count_tokens(text)
+        return types.SimpleNamespace(output_text=text, usage=_usage(input_tokens, output_tokens))
+
+    def stream(self, input, max_output_tokens: int, instructions: str = None, cancel=None, **options):
+        messages = self.messages(input, instructions)
+        chunks = self._complete(messages, max_output_tokens, stream=True)
+        return ChatStream(chunks, sum(count_tokens(m["content"]) for m in messages))
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+
+class LLMRouter:
+    """ Sceglie l'ordine dei backend per ogni domanda. Il modello locale va per primo
+        con le frasi fatte solo di saluti, conferme e ringraziamenti (tutta la frase, non
+        solo l'inizio: "ciao, mi spieghi come funziona un motore a reazione?" va al
+        remoto; anche le domande brevi come "chi ha scritto l'Odissea?" vanno al remoto),
+        quando il p95 del tempo al primo token del remoto negli ultimi window_seconds
+        supera budget secondi e per cooldown secondi dopo un errore del remoto. L'altro
+        backend resta come riserva: se il primo fallisce prima di aver prodotto testo
+        AerisMind passa al successivo, così senza rete risponde il locale. Senza backend
+        locale l'ordine è sempre il solo remoto."""
+    SIMPLE = re.compile(r"(?:(?:ciao|grazie(?: mille)?|buongiorno|buonasera|buonanotte|salve|ok|okay|va bene|"
+                        r"perfetto|sì|si|no|come stai|chi sei|come ti chiami|aeris)[\s,.!?]*)+", re.IGNORECASE)
+
+    def __init__(self,
+                 remote: RemoteBackend,
+                 local: LocalBackend = None,
+                 budget: float = 1.5,
+                 window_seconds: float = 300.0,
+                 min_samples: int = 5,
+                 cooldown: float = 60.0):
+        self.remote = remote
+        self.local = local
+        self.budget = budget
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.remote_failed_at = None
+        self.last_reason = None
+        self._latencies = {} # nome del backend -> deque di (istante, secondi al primo token)
+        self._lock = threading.Lock()
+
+    def route(self, prompt: str) -> list:
+        if self.local is None:
+            return [self.remote]
+        self.last_reason = self.local_reason(prompt)
+        return [self.local, self.remote] if self.last_reason else [self.remote, self.local]
+
+    """ Motivo per cui la domanda va al modello locale, None se va al remoto."""
+    def local_reason(self, prompt: str):
+        text = prompt.strip()
+        if self.SIMPLE.fullmatch(text):
+            return "saluto"
+        if self.remote_failed_at is not None and time.monotonic() - self.remote_failed_at < self.cooldown:
+            return "remoto non raggiungibile"
+        p95 = self.p95(self.remote.name)
+        if p95 is not None and p95 > self.budget:
+            return f"p95 remoto {p95:.2f}s"
+        return None
+
+    """ p95 del tempo al primo token del backend negli ultimi window_seconds, None con
+        meno di min_samples misure: le misure scadono, così il remoto torna in gioco."""
+    def p95(self, name: str):
+        now = time.monotonic()
+        with self._lock:
+            samples = sorted(value for at, value in self._latencies.get(name, ())
+                             if now - at <= self.window_seconds)
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def record(self, backend, seconds: float):
+        with self._lock:
+            series = self._latencies.setdefault(backend.name, deque(maxlen=100))
+            series.append((time.monotonic(), seconds))
+        if backend is self.remote:
+            self.remote_failed_at = None
+
+    def record_failure(self, backend):
+        if backend is self.remote:
+            self.remote_failed_at = time.monotonic()
@@ -0,0 +1,181 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+""" Richieste la cui risposta dipende dal momento in cui vengono fatte: non passano mai
+    dalla cache. Il testo è già normalizzato (minuscole, senza accenti e punteggiatura),
+    quindi "che ora è" diventa "che ora e". Si cercano espressioni, non parole singole
+    come "ora", "anno" o "temperatura", che compaiono anche in domande senza tempo
+    ("e ora raccontami una storia", "la temperatura di ebollizione dell'acqua")."""
+TIME_SENSITIVE = re.compile(
+    r"\b(che ore sono|che ora e|che ora sono|ora esatta|orario attuale|oggi|domani|ieri|adesso|"
+    r"in questo momento|stasera|stamattina|stanotte|che giorno e|che giorno sara|che data|"
+    r"(questa|prossima|scorsa) settimana|(questo|prossimo|scorso) mese|(quest|prossimo|scorso) anno|"
+    r"meteo|che tempo fa|che tempo fara|previsioni|piove|piovera|temperatura (fuori|esterna|in casa)|"
+    r"notizie|news|timer|sveglia|ricordami|promemoria)\b"
+)
+
+""" Parole che cambiano il senso di una domanda senza cambiarne quasi i caratteri: due
+    trascrizioni simili con negazioni o numeri diversi non sono la stessa domanda."""
+NEGATIONS = {"non", "no", "mai", "niente", "nulla", "nessuno", "nessuna", "senza", "ne", "neanche", "nemmeno"}
+NUMBER_WORDS = {"zero", "due", "tre", "quattro", "cinque", "sei", "sette", "otto", "nove",
+                "dieci", "undici", "dodici", "venti", "trenta", "cento", "mille", "milione", "milioni",
+                "primo", "prima", "secondo", "seconda", "terzo", "terza", "mezzo", "mezza", "doppio", "meta"}
+
+
+class ResponseCache:
+    """ Cache delle risposte di AerisMind. La chiave è il testo trascritto normalizzato
+        insieme al modello e alle istruzioni. Le voci scadono dopo ttl secondi e la
+        memoria viene limitata con una LRU; opzionalmente un database SQLite conserva
+        le risposte tra un riavvio e l'altro e un livello fuzzy (disattivato di default,
+        si attiva con fuzzy_threshold) riconosce trascrizioni quasi identiche
+        confrontando gli n-grammi di caratteri. Una voce simile viene scartata se
+        negazioni o numeri sono diversi: "come non funziona" non è "come funziona"."""
+    def __init__(self,
+                 ttl: float = 24 * 3600,
+                 max_entries: int = 256,
+                 db_path: str = None,
+                 fuzzy_threshold: float = None,
+                 ngram: int = 3):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.fuzzy_threshold = fuzzy_threshold
+        self.ngram = ngram
+
+        self._memory = OrderedDict() # chiave -> (scope, testo, n-grammi, risposta, creata, latenza, segno)
+        self._lock = threading.Lock()
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, scope TEXT, text TEXT, response TEXT, created REAL, latency REAL)"
+            )
+            self.db.commit()
+
+        # contatori
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+    @staticmethod
+    def is_time_sensitive(text: str) -> bool:
+        return TIME_SENSITIVE.search(ResponseCache.normalize(text)) is not None
+
+    @staticmethod
+    def scope(model: str, instructions: str) -> str:
+        return hashlib.sha256(f"{model}\n{instructions}".encode("utf-8")).hexdigest()
+
+    def key(self, text: str, scope: str) -> str:
+        return hashlib.sha256(f"{scope}\n{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def stats(self) -> dict:
+        total = self.hits + self.fuzzy_hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": (total - self.misses) / total if total else 0.0,
+            "saved_seconds": self.saved_seconds
+        }
+
+    """ Restituisce la risposta in cache oppure None. Le richieste legate al momento
+        (ora, data, meteo...) vengono sempre inoltrate al modello."""
+    def get(self, text: str, model: str, instructions: str):
+        if self.is_time_sensitive(text):
+            self.bypassed += 1
+            return None
+        scope = self.scope(model, instructions)
+        key = self.key(text, scope)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[4] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[5]
+                return entry[3]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT response, created, latency FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self._remember(key, scope, text, row[0], row[1], row[2])
+                    self.disk_hits += 1
+                    self.saved_seconds += row[2]
+                    return row[0]
+
+            if self.fuzzy_threshold:
+                match = self._fuzzy(text, scope, now)
+                if match is not None:
+                    self.fuzzy_hits += 1
+                    self.saved_seconds += match[5]
+                    return match[3]
+
+            self.misses += 1
+        return None
+
+    def put(self, text: str, model: str, instructions: str, response: str, latency: float):
+        if not response or self.is_time_sensitive(text):
+            return
+        scope = self.scope(model, instructions)
+        key = self.key(text, scope)
+        created = time.time()
+        with self._lock:
+            self._remember(key, scope, text, response, created, latency)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, scope, self.normalize(text), response, created, latency)
+                )
+                self.db.execute("DELETE FROM responses WHERE created < ?", (created - self.ttl,))
+                self.db.commit()
+
+    def ngrams(self, text: str) -> set:
+        padded = f" {self.normalize(text)} "
+        return {padded[i:i + self.ngram] for i in range(max(len(padded) - self.ngram + 1, 1))}
+
+    """ Negazioni e numeri della domanda, nell'ordine: devono coincidere perché una voce
+        simile valga come la stessa domanda."""
+    def signature(self, text: str) -> tuple:
+        return tuple(word for word in self.normalize(text).split()
+                     if word in NEGATIONS or word in NUMBER_WORDS or any(c.isdigit() for c in word))
+
+    """ Cerca la voce più simile con lo stesso modello e istruzioni (indice di Jaccard
+        sugli n-grammi di caratteri) e le stesse negazioni e numeri."""
+    def _fuzzy(self, text: str, scope: str, now: float):
+        grams = self.ngrams(text)
+        signature = self.signature(text)
+        best, best_score = None, self.fuzzy_threshold
+        for entry in self._memory.values():
+            if entry[0] != scope or now - entry[4] > self.ttl or entry[6] != signature:
+                continue
+            score = len(grams & entry[2]) / len(grams | entry[2])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _remember(self, key, scope, text, response, created, latency):
+        self._memory[key] = (scope, text, self.ngrams(text), response, created, latency, self.signature(text))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -1,48 +1,263 @@
-from openai import OpenAI
-from audio.audio_local import AerisEars
+from model.transport import LLMTransport
+from model.llm_backends import LLMRouter, LocalBackend, RemoteBackend
+from model.response_cache import ResponseCache
+from model.conversation import ConversationSession, count_tokens
+from metrics.tracing import get_tracer
 import os
+import threading
+import time
 
 class AerisMind:
-    def __init__(self, model="gpt-4.1-mini"):
+    def __init__(self, model="gpt-4.1-mini", cache: ResponseCache = None, session: ConversationSession = None, client=None,
+                 transport: LLMTransport = None, local: LocalBackend = None, router: LLMRouter = None):
         self.model = model
         self.api_key = os.getenv("OPENAI_API_KEY")
         
         # array di pezzi di trascrizione ottenuti dal modello whisper di trascrizione
         self.input_transcription = []
         
-        # instanzia il client di OpenAI
-        self.client = OpenAI(api_key=self.api_key)
+        # client di OpenAI con pool di connessioni, tempi massimi e hedging (AERIS_LLM_HEDGE=1);
+        # client permette di passarne uno con la stessa interfaccia
+        self.transport = transport or LLMTransport(client=client, api_key=self.api_key,
+                                                   hedge=os.getenv("AERIS_LLM_HEDGE") == "1")
+        self.client = self.transport.client
+        
+        """ Backend del modello: OpenAI e, se configurato (AERIS_LOCAL_LLM_URL o
+            AERIS_LOCAL_LLM_PATH), un modello locale sulla CPU. Il router sceglie per ogni
+            domanda quale provare per primo; AERIS_LLM_BUDGET è il p95 massimo in secondi
+            del tempo al primo token del remoto prima di passare al locale."""
+        self.remote = RemoteBackend(self.transport, model=model)
+        self.local = local or LocalBackend.from_env()
+        self.router = router or LLMRouter(self.remote, self.local,
+                                          budget=float(os.getenv("AERIS_LLM_BUDGET", "1.5")))
+        # backend che ha prodotto l'ultima risposta ("cache" se non è servito il modello)
+        self.last_backend = None
+        
         self.istructions = "Sei un assistente AI di nome Aeris. Rispondi in maniera simpatica e concisa senza usare emoji."
         self.response = None
         
-    def create_response(self, prompt: str):
-        
-        try:
-            response = self.client.responses.create(
-                model=self.model,
-                input=[
-                    {
-                        "role": "developer",
-                        "content": self.istructions
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
+        """ Cache delle risposte: di default solo in memoria, con AERIS_RESPONSE_CACHE_DB
+            viene conservata anche su SQLite e sopravvive ai riavvii. Il confronto fuzzy
+            tra trascrizioni simili è disattivato: AERIS_RESPONSE_CACHE_FUZZY=0.9 lo
+            attiva con quella soglia di somiglianza."""
+        fuzzy = os.getenv("AERIS_RESPONSE_CACHE_FUZZY", "")
+        self.cache = cache or ResponseCache(
+            db_path=os.getenv("AERIS_RESPONSE_CACHE_DB"),
+            fuzzy_threshold=float(fuzzy) if fuzzy.strip() else None
+        )
+        
+        # storico della conversazione: i turni più vecchi vengono riassunti dal modello
+        self.session = session or ConversationSession(summarize=self.summarize)
+        
+        # token di prompt per turno: stima locale e valore riportato dall'API
+        self.prompt_tokens = []
+        
+        # impostato da cancel() per interrompere la risposta in streaming (barge-in);
+        # begin_turn() ne crea uno nuovo per ogni turno
+        self.cancelled = threading.Event()
+        self._stream = None
+        
+        self.tracer = get_tracer()
+        
+    def create_response(self, prompt: str, use_cache: bool = True):
+        
+        # con uno storico la risposta dipende dal contesto: la cache vale solo a inizio conversazione
+        use_cache = use_cache and self.session.is_empty()
+        cached = self.cache.get(prompt, self.model, self.istructions) if use_cache else None
+        if cached is not None:
+            self.response = cached
+            self.session.add(prompt, cached)
+            self.last_backend = "cache"
+            self.tracer.mark("llm_first_token")
+            self.tracer.mark("llm_done")
+            return self.response
+        
+        self.last_backend = None
+        messages = self.build_input(prompt)
+        for backend in self.router.route(prompt):
+            try:
+                start = time.perf_counter()
+                response = backend.create(
+                    messages,
+                    max_output_tokens=400,
+                    text={
+                        "verbosity": "medium"
                     }
-                ],
-                max_output_tokens=400,
-                text={
-                    "verbosity": "medium"
-                }
-            )
+                )
+            except Exception as e:
+                # il prossimo backend risponde al posto di quello che ha fallito
+                self.router.record_failure(backend)
+                print(f"Errore nella creazione della risposta ({backend.name}): {e}")
+                continue
             
+            self.router.record(backend, time.perf_counter() - start)
+            self.last_backend = backend.name
             self.response = response.output_text
+            self.tracer.mark("llm_first_token")
+            self.tracer.mark("llm_done")
+            self.report_tokens(messages, response.usage)
+            # in cache solo le risposte del modello remoto, quelle locali sono più povere
+            if use_cache and backend is self.remote:
+                self.cache.put(prompt, self.model, self.istructions, self.response, time.perf_counter() - start)
+            self.session.add(prompt, self.response)
             
             return self.response
-            
-        except Exception as e:
-            print(f"Errore nella creazione della risposta: {e}")
-            return        
-        
+        return None
+    
+    """ Versione in streaming di create_response: restituisce i delta di testo man mano
+        che il modello li genera. Alla fine dello stream la risposta completa è in self.response.
+        Una risposta in cache viene restituita in un solo delta. Lo stream si ferma
+        appena viene chiamato cancel() e la risposta parziale non finisce in cache.
+        L'evento di cancellazione del turno viene preso subito, non al primo next() del
+        generatore: un cancel() arrivato prima della prima iterazione resta valido."""
+    def stream_response(self, prompt: str, use_cache: bool = True):
+        return self._stream_response(prompt, use_cache, self.cancelled)
+    
+    def _stream_response(self, prompt: str, use_cache: bool, cancelled: threading.Event):
+        if cancelled.is_set():
+            self.response = ""
+            return
+        use_cache = use_cache and self.session.is_empty()
+        cached = self.cache.get(prompt, self.model, self.istructions) if use_cache else None
+        if cached is not None:
+            self.response = cached
+            self.session.add(prompt, cached)
+            self.last_backend = "cache"
+            self.tracer.mark("llm_first_token")
+            yield cached
+            self.tracer.mark("llm_done")
+            return
         
-        
\ No newline at end of file
+        parts = []
+        usage = None
+        backend = None
+        start = time.perf_counter()
+        messages = self.build_input(prompt)
+        for backend in self.router.route(prompt):
+            failed = False
+            begin = time.perf_counter()
+            try:
+                # cancel interrompe anche l'attesa del primo token, prima che lo stream esista
+                stream = backend.stream(
+                    messages,
+                    max_output_tokens=400,
+                    cancel=cancelled,
+                    text={
+                        "verbosity": "medium"
+                    }
+                )
+                self._stream = stream
+                
+                for event in stream:
+                    if cancelled.is_set():
+                        break
+                    if event.type == "response.output_text.delta":
+                        if not parts:
+                            self.tracer.mark("llm_first_token")
+                            self.router.record(backend, time.perf_counter() - begin)
+                        parts.append(event.delta)
+                        yield event.delta
+                    elif event.type == "error":
+                        failed = True
+                        print(f"Errore nello stream della risposta ({backend.name}): {event.message}")
+                    elif event.type == "response.completed":
+                        usage = event.response.usage
+                        # solo le risposte complete del modello remoto finiscono in cache
+                        if use_cache and backend is self.remote:
+                            self.cache.put(prompt, self.model, self.istructions, "".join(parts), time.perf_counter() - start)
+                
+            except Exception as e:
+                # chiudere lo stream da cancel() fa fallire la lettura in corso
+                if not cancelled.is_set():
+                    failed = True
+                    print(f"Errore nella creazione della risposta ({backend.name}): {e}")
+            finally:
+                self._stream = None
+            # si passa al backend successivo solo se l'utente non ha ancora sentito nulla
+            if not failed or parts or cancelled.is_set():
+                break
+            self.router.record_failure(backend)
+        self.last_backend = backend.name if backend else None
+        self.response = "".join(parts)
+        self.tracer.mark("llm_done")
+        self.report_tokens(messages, usage)
+        # anche una risposta interrotta fa parte della conversazione: l'utente ne ha sentito l'inizio
+        if self.response:
+            self.session.add(prompt, self.response)
+    
+    """ Chiamata alla wakeword: apre la connessione al modello mentre l'utente parla."""
+    def preconnect(self):
+        self.remote.preconnect()
+        if self.local is not None:
+            self.local.preconnect()
+    
+    """ Inizio di un nuovo turno: un evento di cancellazione nuovo, così lo stream del
+        turno precedente, ancora in chiusura, continua a vedere il suo evento impostato."""
+    def begin_turn(self):
+        self.cancelled = threading.Event()
+    
+    """ Interrompe la risposta in streaming chiudendo la connessione, senza aspettare
+        il prossimo evento del modello. Durante l'attesa del primo token è il trasporto a
+        chiudere le richieste in volo, appena vede l'evento cancelled."""
+    def cancel(self):
+        self.cancelled.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+    
+    """ Istruzioni, storico della conversazione (riassunto e ultimi turni) e domanda."""
+    def build_input(self, prompt: str):
+        return [
+            {
+                "role": "developer",
+                "content": self.istructions
+            },
+            *self.session.messages(),
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    """ Registra e stampa i token di prompt del turno: la stima locale sui messaggi
+        inviati e, se disponibile, il conteggio restituito dall'API."""
+    def report_tokens(self, messages: list, usage=None):
+        estimated = sum(count_tokens(message["content"]) for message in messages)
+        actual = getattr(usage, "input_tokens", None)
+        self.prompt_tokens.append({
+            "estimated": estimated,
+            "actual": actual,
+            "history_turns": len(self.session.turns)
+        })
+        reported = f"{actual}" if actual is not None else f"~{estimated}"
+        print(f"[TOKEN] prompt {reported} token, storico {len(self.session.turns)} turni "
+              f"({self.session.tokens} token), riassunto {count_tokens(self.session.summary)} token")
+    
+    """ Compatta nel riassunto i turni usciti dalla finestra della conversazione.
+        Usa il modello remoto e, se non risponde, quello locale."""
+    def summarize(self, summary: str, turns: list) -> str:
+        text = "\n".join(f"Utente: {user}\nAeris: {assistant}" for user, assistant in turns)
+        if summary:
+            text = f"Riassunto precedente: {summary}\n{text}"
+        backends = [self.remote] if self.local is None else [self.remote, self.local]
+        for i, backend in enumerate(backends):
+            try:
+                response = backend.create(
+                    text,
+                    instructions="Riassumi in poche frasi i fatti e le richieste di questa conversazione, "
+                                 "senza commenti. Scrivi in italiano.",
+                    max_output_tokens=self.session.summary_tokens
+                )
+                return response.output_text
+            except Exception:
+                self.router.record_failure(backend)
+                if i == len(backends) - 1:
+                    raise
+    
+    def close(self):
+        self.remote.close()
+        if self.local is not None:
+            self.local.close()
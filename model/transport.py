@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metrics.tracing import percentile
+from metrics.resources import get_resources
+
+
+class HedgedStream:
+    """ Stream già avviato: restituisce prima gli eventi letti per capire se la risposta
+        era partita, poi il resto. close() chiude lo stream sottostante."""
+    def __init__(self, stream, buffered: list, events):
+        self.stream = stream
+        self.buffered = buffered
+        self.events = events
+
+    def __iter__(self):
+        yield from self.buffered
+        yield from self.events
+
+    def close(self):
+        self.stream.close()
+
+
+""" Chiude il risultato di una richiesta arrivata dopo la vincitrice o dopo la scadenza."""
+def _discard(future):
+    if not future.cancelled() and future.exception() is None:
+        result = future.result()
+        if hasattr(result, "close"):
+            result.close()
+
+
+class LLMTransport:
+    """ Trasporto HTTP del client OpenAI di AerisMind. Tiene un pool di connessioni
+        keep-alive (httpx), apre la connessione in anticipo con preconnect() quando
+        scatta la wakeword, così DNS, TCP e TLS si sovrappongono al parlato dell'utente,
+        e fissa i tempi massimi: connect_timeout per la connessione, read_timeout tra un
+        evento e l'altro dello stream, first_token_timeout per il primo delta e deadline
+        per una risposta completa. Gli errori di rete e i 429/5xx vengono ripetuti dal
+        client fino a max_retries volte.
+
+        Con hedge, se una richiesta non ha risposto entro il p95 delle latenze recenti
+        (limitato a [hedge_min_delay, hedge_max_delay]) ne parte una copia e vince la
+        prima che risponde; l'altra viene chiusa. Costa una richiesta in più nei casi
+        lenti, quindi è disattivato di default.
+
+        Con client viene usato un client già pronto (ad esempio quello finto del replay):
+        valgono tempi massimi e hedging, non il pool né la preconnessione."""
+    def __init__(self,
+                 client=None,
+                 api_key: str = None,
+                 base_url: str = None,
+                 connect_timeout: float = 3.0,
+                 read_timeout: float = 10.0,
+                 first_token_timeout: float = 8.0,
+                 deadline: float = 30.0,
+                 max_retries: int = 2,
+                 pool_size: int = 4,
+                 keepalive_seconds: float = 120.0,
+                 warm_seconds: float = 20.0,
+                 hedge: bool = False,
+                 hedge_min_delay: float = 0.3,
+                 hedge_max_delay: float = 3.0,
+                 window: int = 50,
+                 min_samples: int = 5):
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.deadline = deadline
+        self.warm_seconds = warm_seconds # oltre questo silenzio la connessione va riaperta
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.min_samples = min_samples
+
+        self.http = None
+        if client is None:
+            with get_resources().imports("llm"):
+                import httpx
+                from openai import OpenAI
+            self.http = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size,
+                                    keepalive_expiry=keepalive_seconds),
+                timeout=httpx.Timeout(deadline, connect=connect_timeout, read=read_timeout)
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http,
+                            timeout=httpx.Timeout(deadline, connect=connect_timeout, read=read_timeout),
+                            max_retries=max_retries)
+        self.client = client
+
+        # latenze (secondi al primo delta o alla risposta) delle ultime window richieste
+        self.latencies = deque(maxlen=window)
+        self.last_used = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="llm-http")
+
+    """ Ritardo dopo cui parte la copia: p95 delle latenze recenti, oppure il massimo
+        finché non ci sono abbastanza misure."""
+    def hedge_delay(self) -> float:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.min_samples:
+            return self.hedge_max_delay
+        return min(max(percentile(samples, 95), self.hedge_min_delay), self.hedge_max_delay)
+
+    """ Apre in background le connessioni che serviranno alla prossima richiesta (due con
+        l'hedging) se quelle nel pool potrebbero essere state chiuse dal server."""
+    def preconnect(self):
+        if self.http is None or time.monotonic() - self.last_used < self.warm_seconds:
+            return
+        self.last_used = time.monotonic()
+        for _ in range(2 if self.hedge else 1):
+            self._executor.submit(self._preconnect)
+
+    def _preconnect(self):
+        try:
+            # basta una risposta qualsiasi: la connessione resta nel pool
+            self.http.head(str(self.client.base_url), timeout=self.connect_timeout * 2)
+        except Exception as e:
+            print(f"[LLM] preconnessione fallita: {e}")
+
+    """ client.responses.create senza stream, entro deadline secondi."""
+    def create(self, **kwargs):
+        return self._race(lambda: self.client.responses.create(**kwargs), self.deadline)
+
+    """ client.responses.create con stream: restituisce lo stream appena arriva il primo
+        delta di testo, entro first_token_timeout secondi. Le richieste che non servono
+        più vengono chiuse subito, senza aspettare il loro primo token: la copia che
+        perde con l'hedging, quelle ancora in volo alla scadenza e, se durante l'attesa
+        viene impostato l'evento cancel (barge-in), tutte, sollevando CancelledError."""
+    def stream(self, cancel: threading.Event = None, **kwargs):
+        opened = []
+        settled = threading.Event()
+
+        def abort(keep=None):
+            settled.set()
+            for stream in list(opened):
+                if stream is keep:
+                    continue
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+
+        def stopped() -> bool:
+            return settled.is_set() or (cancel is not None and cancel.is_set())
+
+        result = self._race(lambda: self._open_stream(kwargs, opened, stopped), self.first_token_timeout,
+                            cancel=cancel, abort=abort)
+        abort(keep=result.stream)
+        return result
+
+    def _open_stream(self, kwargs: dict, opened: list = None, stopped=None) -> HedgedStream:
+        stream = self.client.responses.create(stream=True, **kwargs)
+        if opened is not None:
+            opened.append(stream)
+        if stopped is not None and stopped():
+            # la gara è finita mentre si apriva la connessione: abort() non l'ha vista
+            stream.close()
+            raise CancelledError()
+        events = iter(stream)
+        buffered = []
+        try:
+            for event in events:
+                buffered.append(event)
+                if event.type in ("response.output_text.delta", "response.completed", "error"):
+                    break
+        except Exception:
+            stream.close()
+            raise
+        if not buffered and stopped is not None and stopped():
+            # chiusa da abort() prima del primo evento: non è una risposta né una latenza
+            raise CancelledError()
+        return HedgedStream(stream, buffered, events)
+
+    """ Esegue call in un thread e aspetta al massimo timeout secondi. Con l'hedging, se
+        call non risponde entro hedge_delay() o fallisce prima, ne lancia una seconda copia
+        e restituisce il primo risultato riuscito. Le richieste rimaste in volo vengono
+        chiuse appena terminano; abort(), se c'è, le chiude subito alla scadenza. Con
+        cancel l'evento si controlla ogni cancel_poll secondi: appena è impostato chiama
+        abort() e solleva CancelledError."""
+    def _race(self, call, timeout: float, cancel: threading.Event = None, abort=None, cancel_poll: float = 0.02):
+        def timed():
+            begin = time.perf_counter()
+            result = call()
+            with self._lock:
+                self.latencies.append(time.perf_counter() - begin)
+            self.last_used = time.monotonic()
+            return result
+
+        self.requests += 1
+        start = time.perf_counter()
+        pending = {self._executor.submit(timed)}
+        hedge_at = start + self.hedge_delay() if self.hedge else None
+        error = None
+        while True:
+            if cancel is not None and cancel.is_set():
+                for other in pending:
+                    other.add_done_callback(_discard)
+                if abort is not None:
+                    abort()
+                raise CancelledError()
+            now = time.perf_counter()
+            if now >= start + timeout:
+                break
+            wake = start + timeout if hedge_at is None else min(start + timeout, hedge_at)
+            if cancel is not None:
+                wake = min(wake, now + cancel_poll)
+            done, pending = wait(pending, timeout=max(wake - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.add_done_callback(_discard)
+                    return future.result()
+                error = future.exception()
+            if hedge_at is not None and (not pending or time.perf_counter() >= hedge_at):
+                # ritardo superato o prima richiesta fallita: parte la copia
+                hedge_at = None
+                self.hedges += 1
+                pending.add(self._executor.submit(timed))
+            elif not pending:
+                raise error
+
+        for other in pending:
+            other.add_done_callback(_discard)
+        if abort is not None:
+            abort()
+        self.timeouts += 1
+        raise TimeoutError(f"nessuna risposta dal modello in {timeout:.1f}s")
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if self.http is not None:
+            self.http.close()
@@ -0,0 +1,338 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from audio.streaming import StreamingTranscriber
+from speech.chunker import SentenceChunker
+from metrics.tracing import get_tracer
+
+_END = object()
+
+
+class AerisPipeline:
+    """ Orchestratore asyncio dell'assistente. Cattura, wakeword/VAD, trascrizione,
+        modello e sintesi vocale sono stadi collegati da asyncio.Queue limitate: ogni
+        stadio si sveglia quando arriva un elemento, senza sleep né flag da controllare.
+        Le operazioni bloccanti (lettura del microfono, whisper, stream del modello,
+        Piper e attesa della riproduzione) girano in executor dedicati, così uno stadio
+        lento non ferma gli altri.
+
+        Usa i componenti già inizializzati di un oggetto Aeris: capture, wakeword,
+        ears, mind e voice."""
+    def __init__(self, aeris, queue_size: int = 64, block_size: int = 1323, max_turns: int = None):
+        self.capture = aeris.capture
+        self.wakeword = aeris.wakeword
+        self.ears = aeris.ears
+        self.mind = aeris.mind
+        self.voice = aeris.voice
+        # comandi risolti senza modello, assente se l'oggetto non ne ha
+        self.intents = getattr(aeris, "intents", None)
+        # monitor di barge-in, assente se l'interruzione è disattivata
+        self.barge_in = getattr(aeris, "barge_in", None)
+        # secondi dopo una risposta in cui il VAD riapre la registrazione senza wakeword
+        self.follow_up_seconds = getattr(aeris, "follow_up_seconds", None)
+        self.follow_up = False
+        self.tracer = getattr(aeris, "tracer", None) or get_tracer()
+        self.queue_size = queue_size
+        self.block_size = block_size # ~30 ms a 44.1kHz
+        self.max_turns = max_turns
+        # attesa massima del turno in corso quando la sorgente audio termina
+        self.drain_seconds = 30.0
+
+        # un executor per stadio: la cattura non aspetta mai whisper o Piper
+        self.capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        self.stt_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt")
+        self.llm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm")
+        self.tts_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+
+        self.turns = [] # istanti (perf_counter) di ogni turno completato
+        self.turn = None
+        self.dropped_blocks = 0
+        self.capture_reader = None # lettore della cattura: i suoi campioni persi finiscono nella traccia
+        self.speaking = False # il player sta riproducendo la risposta del turno corrente
+        
+        # numero dell'ultimo aggiornamento del parlato in corso inviato alla trascrizione
+        self.open_seq = 0
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.audio_queue = asyncio.Queue(self.queue_size) # (posizione, blocco int16 a 44.1kHz)
+        self.speech_queue = asyncio.Queue(self.queue_size) # ("segment" | "open" | "end", audio)
+        self.text_queue = asyncio.Queue(4) # (turno, trascrizione finale)
+        self.sentence_queue = asyncio.Queue(self.queue_size) # (turno, frase da sintetizzare o _END)
+        self.listening = asyncio.Event() # impostato quando si può ascoltare una nuova wakeword
+        self.listening.set()
+        self.stopped = asyncio.Event()
+
+        stages = [
+            self.capture_stage(),
+            self.listen_stage(),
+            self.stt_stage(),
+            self.llm_stage(),
+            self.tts_stage()
+        ]
+        tasks = [asyncio.create_task(stage) for stage in stages]
+        try:
+            await self.stopped.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for executor in (self.capture_executor, self.stt_executor, self.llm_executor, self.tts_executor):
+                executor.shutdown(wait=False)
+        return self.turns
+
+    def stop(self):
+        self.stopped.set()
+
+    """ Legge i blocchi dal buffer di cattura. Se gli stadi successivi sono in ritardo
+        scarta il blocco più vecchio invece di bloccare la lettura."""
+    async def capture_stage(self):
+        reader = self.capture_reader = self.capture.reader()
+        while True:
+            block = await self.loop.run_in_executor(self.capture_executor, reader.read, self.block_size, 1.0)
+            if block is None:
+                if reader.ring.closed:
+                    # la sorgente è terminata (ad esempio la fine del file nel replay):
+                    # il turno già avviato viene completato prima di fermare la pipeline
+                    try:
+                        await asyncio.wait_for(self.listening.wait(), self.drain_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.stop()
+                    return
+                continue
+            if self.audio_queue.full():
+                self.audio_queue.get_nowait()
+                self.dropped_blocks += 1
+            self.audio_queue.put_nowait((reader.position, block))
+            self.tracer.queue_depth("audio_queue", self.audio_queue.qsize())
+
+    """ Fra un turno e l'altro cerca la wakeword; dopo la rilevazione passa i blocchi
+        ricampionati al VAD e inoltra segmenti, parlato in corso e fine del turno.
+        Mentre l'assistente parla i blocchi vanno al monitor di barge-in: se l'utente
+        lo interrompe la risposta viene cancellata e si registra subito il nuovo turno."""
+    async def listen_stage(self):
+        mode = "wake"
+        step = int(self.ears.stream_step_seconds * self.ears.target_rate)
+        self.since_open = 0
+        while True:
+            position, block = await self.audio_queue.get()
+
+            if mode == "busy":
+                if self.speaking and self.barge_in is not None and self.barge_in.process(block, position):
+                    await self.interrupt_turn()
+                    await self.start_turn(self.barge_in.preroll_audio)
+                    for old in self.barge_in.blocks_since(self.barge_in.start_at):
+                        await self.record(old, step)
+                    mode = "record"
+                    continue
+                if not self.listening.is_set():
+                    continue
+                if self.follow_up:
+                    self.follow_up = False
+                    await self.start_turn(None, no_speech_timeout=self.follow_up_seconds)
+                    self.turn["follow_up"] = True
+                    mode = "record"
+                else:
+                    self.wakeword.reset()
+                    mode = "wake"
+
+            if mode == "wake":
+                if not self.wakeword.detect(block, position):
+                    continue
+                await self.start_turn(self.wakeword.preroll_audio)
+                mode = "record"
+                continue
+
+            if await self.record(block, step):
+                mode = "busy"
+
+    """ Apre un nuovo turno dopo la wakeword, un barge-in o nella finestra di follow-up
+        e passa al VAD l'audio già ricampionato che precede la rilevazione."""
+    async def start_turn(self, preroll, no_speech_timeout: float = None):
+        self.turn = {"wake": time.perf_counter()}
+        self.tracer.begin(follow_up=no_speech_timeout is not None)
+        # nuovo evento di cancellazione: un barge-in da qui in poi vale per questo turno
+        self.mind.begin_turn()
+        # la connessione al modello si apre mentre l'utente parla
+        self.mind.preconnect()
+        self.listening.clear()
+        self.ears.resampler.reset()
+        self.ears.vad.reset(no_speech_timeout=no_speech_timeout)
+        self.since_open = 0
+        if preroll is not None and len(preroll):
+            await self.forward_speech(self.ears.vad.process(preroll))
+
+    """ Ricampiona un blocco e lo passa al VAD. Restituisce True a fine turno."""
+    async def record(self, block, step: int) -> bool:
+        audio = self.ears.resampler.process(block, scale=1 / 32768, copy=False)
+        if "first_audio" not in self.turn:
+            self.turn["first_audio"] = time.perf_counter()
+        await self.forward_speech(self.ears.vad.process(audio))
+
+        self.since_open += len(audio)
+        if self.since_open >= step and self.ears.vad.in_speech:
+            self.since_open = 0
+            self.open_seq += 1
+            await self.speech_queue.put(("open", (self.open_seq, self.ears.vad.open_segment())))
+
+        if self.ears.vad.turn_ended:
+            segment = self.ears.vad.flush()
+            if segment is not None:
+                await self.forward_speech([segment])
+            self.turn["end_of_speech"] = time.perf_counter()
+            await self.speech_queue.put(("end", None))
+            return True
+        return False
+
+    """ Interrompe la risposta in corso: ferma il player, chiude lo stream del modello e
+        registra il turno interrotto. Le frasi del vecchio turno ancora in coda vengono
+        scartate da tts_stage perché appartengono a un turno diverso da quello corrente."""
+    async def interrupt_turn(self):
+        turn = self.turn
+        turn["barge_in"] = time.perf_counter()
+        self.speaking = False
+        await self.loop.run_in_executor(None, self.barge_in.interrupt, self.mind.cancel)
+        if self.voice.player.silenced.is_set():
+            turn["silence"] = self.voice.player.silence_time + self.voice.player.output_latency
+        self.finish_turn(turn, listen=False)
+
+    async def forward_speech(self, segments):
+        for segment in segments:
+            await self.speech_queue.put(("segment", segment))
+            self.tracer.queue_depth("speech_queue", self.speech_queue.qsize())
+
+    """ Trascrizione incrementale: whisper gira nell'executor dedicato ad ogni
+        aggiornamento del parlato in corso e produce la trascrizione finale a fine turno."""
+    async def stt_stage(self):
+        while True:
+            transcriber = StreamingTranscriber(
+                self.ears.transcribe_audio,
+                sample_rate=self.ears.target_rate,
+                step_seconds=self.ears.stream_step_seconds
+            )
+            while True:
+                kind, audio = await self.speech_queue.get()
+                if kind == "segment":
+                    transcriber.append(audio)
+                elif kind == "open":
+                    seq, audio = audio
+                    if seq < self.open_seq:
+                        continue # whisper è in ritardo: in coda c'è già un aggiornamento più recente
+                    transcriber.update(audio)
+                    await self.loop.run_in_executor(self.stt_executor, transcriber.step)
+                else:
+                    break
+            turn = self.turn
+            text = await self.loop.run_in_executor(self.stt_executor, transcriber.finish)
+            turn["stt_done"] = time.perf_counter()
+            turn["transcript"] = text
+            if text.strip():
+                await self.text_queue.put((turn, text.strip()))
+            else:
+                print("Nessuna trascrizione ottenuta.")
+                self.finish_turn(turn)
+
+    """ Inoltra la trascrizione al modello in streaming e divide la risposta in frasi.
+        Il generatore sincrono di AerisMind gira nell'executor e consegna i delta al
+        loop con call_soon_threadsafe. I comandi riconosciuti dal motore degli intent
+        vengono risolti qui, in pochi microsecondi, senza passare dal modello."""
+    async def llm_stage(self):
+        while True:
+            turn, text = await self.text_queue.get()
+            reply = self.intents.handle(text) if self.intents is not None else None
+            if reply is not None:
+                turn["intent"] = self.intents.last_intent
+                turn["llm_first_token"] = turn["llm_done"] = time.perf_counter()
+                turn["response"] = reply
+                print(f"[INTENT] {turn['intent']}: {reply}")
+                if reply:
+                    await self.sentence_queue.put((turn, reply))
+                await self.sentence_queue.put((turn, _END))
+                continue
+            deltas = asyncio.Queue()
+
+            def produce():
+                try:
+                    for delta in self.mind.stream_response(text):
+                        self.loop.call_soon_threadsafe(deltas.put_nowait, delta)
+                finally:
+                    self.loop.call_soon_threadsafe(deltas.put_nowait, _END)
+
+            producer = self.loop.run_in_executor(self.llm_executor, produce)
+            chunker = SentenceChunker()
+            while True:
+                delta = await deltas.get()
+                if delta is _END:
+                    break
+                if "llm_first_token" not in turn:
+                    turn["llm_first_token"] = time.perf_counter()
+                if turn is not self.turn or "barge_in" in turn:
+                    continue # interrotto: lo stream sta per chiudersi
+                for sentence in chunker.feed(delta):
+                    await self.sentence_queue.put((turn, sentence))
+                    self.tracer.queue_depth("sentence_queue", self.sentence_queue.qsize())
+            for sentence in chunker.flush():
+                await self.sentence_queue.put((turn, sentence))
+            await producer
+            turn["llm_done"] = time.perf_counter()
+            turn["response"] = self.mind.response
+            print(f"{self.mind.response}")
+            if self.intents is not None:
+                self.intents.remember(self.mind.response)
+            await self.sentence_queue.put((turn, _END))
+
+    """ Sintetizza ogni frase nel player mentre la precedente è in riproduzione e a fine
+        risposta aspetta l'evento di fine riproduzione, poi riapre l'ascolto."""
+    async def tts_stage(self):
+        player = self.voice.player
+        started = None # turno per cui è stato chiamato player.begin()
+        while True:
+            turn, sentence = await self.sentence_queue.get()
+            if turn is not self.turn or "barge_in" in turn:
+                continue # frase di un turno interrotto
+            if sentence is _END:
+                player.end()
+                await self.loop.run_in_executor(self.tts_executor, player.wait)
+                if "barge_in" in turn:
+                    continue # interrotto durante la riproduzione
+                if started is turn and player.first_sample_latency is not None:
+                    turn["tts_first_sample"] = player.begin_time + player.first_sample_latency
+                started = None
+                self.speaking = False
+                self.finish_turn(turn)
+                continue
+            if started is not turn:
+                player.begin()
+                started = turn
+                if self.barge_in is not None:
+                    self.barge_in.reset()
+                self.speaking = True
+            await self.loop.run_in_executor(self.tts_executor, self.voice.feed, sentence)
+
+    def finish_turn(self, turn: dict, listen: bool = True):
+        turn["playback_done"] = time.perf_counter()
+        self.turns.append(turn)
+        path = None
+        if "stt_done" in turn and "response" in turn:
+            path = "intent" if "intent" in turn else "llm"
+            if self.intents is not None and "barge_in" not in turn:
+                # dalla fine della trascrizione alla prima voce, o alla risposta se è vuota
+                end = turn.get("tts_first_sample", turn["llm_done"])
+                self.intents.record(path, end - turn["stt_done"])
+                self.intents.print_stats()
+        self.tracer.end(marks=turn, interrupted="barge_in" in turn, overflows=self.capture.overflows,
+                        dropped=self.capture_reader.dropped if self.capture_reader else 0,
+                        dropped_blocks=self.dropped_blocks, path=path, intent=turn.get("intent"),
+                        llm=getattr(self.mind, "last_backend", None) if path == "llm" else None)
+        wake = turn["wake"]
+        steps = ", ".join(f"{name} +{(t - wake) * 1000:.0f} ms" for name, t in turn.items()
+                          if isinstance(t, float) and name != "wake")
+        print(f"[TURNO] {steps}")
+        if listen:
+            # dopo una risposta completa si può continuare senza wakeword
+            self.follow_up = bool(self.follow_up_seconds and turn.get("response"))
+            self.listening.set()
+        if self.max_turns is not None and len(self.turns) >= self.max_turns:
+            self.stop()
@@ -0,0 +1,211 @@
+import itertools
+import threading
+import time
+import types
+import numpy as np
+from audio.decoding import split_batch_time
+from model.conversation import count_tokens
+from speech.cache import PhraseCache
+from speech.player import PcmPlayer
+from speech.voice import AerisVoice
+from metrics.tracing import get_tracer
+
+
+class ScriptedWakeword:
+    """ Motore di rilevazione al posto di pvporcupine, da passare a Porcupine(engine=...).
+        Rileva la wakeword quando la sorgente del replay supera uno degli istanti indicati
+        (secondi dall'inizio del file). Gli istanti passati mentre nessuno ascoltava da più
+        di tolerance secondi (ad esempio durante una risposta) vengono contati in missed,
+        come farebbe un utente non ascoltato, invece di scattare in ritardo."""
+    def __init__(self, capture, times: list, frame_length: int = 512, sample_rate: int = 16000,
+                 tolerance: float = 1.0):
+        self.capture = capture
+        self.times = sorted(times)
+        self.frame_length = frame_length
+        self.sample_rate = sample_rate
+        self.tolerance = tolerance
+        self.detected = 0
+        self.missed = 0
+        self._next = 0
+
+    def process(self, frame) -> int:
+        now = self.capture.position / self.capture.sample_rate
+        while self._next < len(self.times) and now >= self.times[self._next]:
+            late = now - self.times[self._next]
+            self._next += 1
+            if late <= self.tolerance:
+                self.detected += 1
+                return 0
+            self.missed += 1
+        return -1
+
+    def delete(self):
+        pass
+
+
+class FakeTranscriber:
+    """ Backend di trascrizione al posto di whisper, da passare ad AerisEars(stt=...) o ad
+        Aeris(stt=...): ogni segmento con audio restituisce text e costa rtf volte la sua
+        durata a 16kHz, quindi i tempi della trascrizione restano proporzionali al parlato
+        senza torch né modello."""
+    name = "fake"
+
+    def __init__(self, text: str = "Raccontami qualcosa di interessante.", rtf: float = 0.05):
+        self.text = text
+        self.rtf = rtf
+        self.processor = None
+        self.model = "fake"
+        self.last_stats = []
+        self.segments = 0 # segmenti trascritti, warm-up compreso
+
+    def transcribe(self, audio_data) -> str:
+        return self.transcribe_batch([audio_data])[0]
+
+    def transcribe_batch(self, segments: list) -> list:
+        durations = [len(audio) / 16000 for audio in segments]
+        elapsed = sum(durations) * self.rtf
+        time.sleep(elapsed)
+        self.segments += len(segments)
+        self.last_stats = [{"audio_seconds": audio_seconds, "decode_seconds": seconds, "batch_seconds": elapsed}
+                           for audio_seconds, seconds in zip(durations, split_batch_time(durations, elapsed))]
+        return [self.text if np.any(audio) else "" for audio in segments]
+
+
+class FakeStream:
+    """ Stream di eventi dell'API Responses: un delta per parola dopo first_token secondi,
+        poi response.completed con l'uso dei token. close() interrompe l'attesa in corso."""
+    def __init__(self, words: list, usage, first_token: float, token_interval: float):
+        self.words = words
+        self.usage = usage
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.closed.wait(self.first_token):
+            return
+        for i, word in enumerate(self.words):
+            if i and self.closed.wait(self.token_interval):
+                return
+            yield types.SimpleNamespace(type="response.output_text.delta", delta=word)
+        yield types.SimpleNamespace(type="response.completed",
+                                    response=types.SimpleNamespace(usage=self.usage))
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeOpenAI:
+    """ Client con la parte dell'interfaccia di OpenAI usata da AerisMind
+        (client.responses.create, con e senza stream). Le risposte vengono prese a turno
+        da replies oppure ripetono la domanda; i tempi sono fissi: first_token secondi
+        al primo delta e token_interval secondi tra una parola e l'altra."""
+    def __init__(self, replies: list = None, first_token: float = 0.3, token_interval: float = 0.02):
+        self.replies = itertools.cycle(replies) if replies else None
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.requests = [] # domande ricevute, nell'ordine
+        self.responses = self
+
+    def create(self, model: str, input, stream: bool = False, instructions: str = None, **kwargs):
+        prompt = input if isinstance(input, str) else input[-1]["content"]
+        self.requests.append(prompt)
+        reply = next(self.replies) if self.replies else f"Hai detto: {prompt.strip()}. Ecco una risposta di prova."
+        context = input if isinstance(input, str) else " ".join(message["content"] for message in input)
+        usage = types.SimpleNamespace(input_tokens=count_tokens(f"{instructions or ''} {context}"),
+                                      output_tokens=count_tokens(reply))
+        words = [word + " " for word in reply.split(" ")]
+        words[-1] = words[-1].rstrip()
+        if stream:
+            return FakeStream(words, usage, self.first_token, self.token_interval)
+        time.sleep(self.first_token + self.token_interval * (len(words) - 1))
+        return types.SimpleNamespace(output_text=reply, usage=usage)
+
+
+class ClockStream:
+    """ Stream di uscita senza dispositivo: un thread chiama la callback del player
+        ogni frames_per_buffer campioni, alla velocità reale dell'altoparlante."""
+    def __init__(self, callback, sample_rate: int, frames_per_buffer: int):
+        self.callback = callback
+        self.period = frames_per_buffer / sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start_stream(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            self.callback(None, self.frames_per_buffer, None, 0)
+            deadline += self.period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def get_output_latency(self) -> float:
+        return self.period
+
+    def stop_stream(self):
+        self._stop.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+
+    def close(self):
+        self.stop_stream()
+
+
+class NullPlayer(PcmPlayer):
+    """ PcmPlayer senza altoparlante: jitter buffer, fine dell'enunciato, stop e
+        latenza del primo campione si comportano come con PyAudio, ma i buffer vengono
+        consumati da ClockStream e scartati."""
+    def start(self):
+        if self.stream is not None:
+            return
+        self.stream = ClockStream(self._callback, self.sample_rate, self.frames_per_buffer)
+        self.stream.start_stream()
+
+
+class FakeVoice(AerisVoice):
+    """ Voce senza Piper per le macchine senza modello della voce: ogni frase produce
+        seconds_per_char secondi di silenzio per carattere, in blocchi di chunk_seconds,
+        e la sintesi di ogni blocco costa rtf volte la sua durata. Cache delle frasi e
+        tracciamento sono quelli di AerisVoice."""
+    def __init__(self,
+                 sample_rate: int = 22050,
+                 seconds_per_char: float = 0.06,
+                 rtf: float = 0.1,
+                 chunk_seconds: float = 0.5,
+                 cache_dir: str = None,
+                 player=NullPlayer):
+        self.voice = "fake"
+        self.player_factory = player
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.rtf = rtf
+        self.chunk_seconds = chunk_seconds
+        self.tts = None
+        self.load_time = 0.0
+        self.warmup_time = None
+        self.player = player(sample_rate)
+        self.cache = PhraseCache(self.voice, params=self.synthesis_params(), cache_dir=cache_dir)
+        self.tracer = get_tracer()
+
+    def synthesis_params(self) -> dict:
+        return {"sample_rate": self.sample_rate, "seconds_per_char": self.seconds_per_char}
+
+    def synthesize_uncached(self, text: str):
+        samples = int(len(text) * self.seconds_per_char * self.sample_rate)
+        chunk = int(self.chunk_seconds * self.sample_rate)
+        for start in range(0, samples, chunk):
+            n = min(chunk, samples - start)
+            time.sleep(n / self.sample_rate * self.rtf)
+            yield np.zeros(n, dtype=np.int16).tobytes()
+
+    """ Cambio di voce senza Piper: ricorda la voce richiesta e apre la cache delle frasi
+        di quella voce, come AerisVoice, continuando a sintetizzare silenzio."""
+    def set_voice(self, voice: str):
+        self.voice = voice
+        self.cache = PhraseCache(self.voice, params=self.synthesis_params(), cache_dir=self.cache.cache_dir)
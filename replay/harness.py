@@ -0,0 +1,188 @@
+""" Replay di sessioni registrate attraverso Aeris senza microfono, Picovoice, OpenAI
+    né altoparlante. Una sessione è un file audio (WAV o PCM grezzo) con accanto,
+    facoltativo, un JSON con lo stesso nome:
+
+        {"wake": [1.5, 12.0], "replies": ["Sono le dieci."], "raw_rate": 16000}
+
+    wake sono gli istanti (secondi dall'inizio del file) in cui la wakeword termina; se
+    mancano vengono stimati dall'energia come inizio di ogni frase preceduta da almeno
+    un secondo di silenzio. replies sono le risposte del modello finto, usate a turno."""
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import numpy as np
+from metrics.tracing import Tracer, percentile, set_tracer
+from metrics.resources import peak_rss_mb, rss_mb
+from replay.fakes import FakeOpenAI, FakeVoice, NullPlayer, ScriptedWakeword
+from replay.source import FileCapture, load_audio
+
+RATE = 44100
+
+
+class Session:
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        meta = {}
+        sidecar = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding="utf-8") as f:
+                meta = json.load(f)
+        self.wake_times = meta.get("wake")
+        self.replies = meta.get("replies")
+        self.raw_rate = meta.get("raw_rate", 16000)
+
+    """ Audio int16 a sample_rate; completa wake_times dall'energia se non annotati."""
+    def load(self, sample_rate: int = RATE) -> np.ndarray:
+        audio = load_audio(self.path, sample_rate, self.raw_rate)
+        if self.wake_times is None:
+            self.wake_times = find_utterances(audio, sample_rate)
+        return audio
+
+
+""" Secondi di inizio delle frasi precedute da almeno min_gap secondi di silenzio,
+    con frame da frame_ms ms e soglia RMS threshold (0-1)."""
+def find_utterances(audio: np.ndarray, sample_rate: int, frame_ms: int = 20,
+                    threshold: float = 0.02, min_gap: float = 1.0) -> list:
+    frame = int(sample_rate * frame_ms / 1000)
+    count = len(audio) // frame
+    if not count:
+        return []
+    frames = audio[:count * frame].astype(np.float32).reshape(count, frame) / 32768.0
+    voiced = np.sqrt(np.mean(np.square(frames), axis=1)) > threshold
+    onsets = []
+    silent = min_gap * 1000 / frame_ms # si parte come dopo un silenzio
+    for i, active in enumerate(voiced):
+        if active:
+            if silent * frame_ms / 1000 >= min_gap:
+                onsets.append(i * frame / sample_rate)
+            silent = 0
+        else:
+            silent += 1
+    return onsets
+
+
+""" Esegue una sessione con l'orchestratore scelto ("threaded" o "async") e restituisce
+    le metriche: latenza wakeword -> primo campione di risposta e fine del parlato ->
+    primo campione, real-time factor di whisper (tempo di trascrizione / durata
+    registrata), overflow della cattura e campioni persi dai lettori, CPU media e RSS.
+    Con stt_worker la trascrizione gira in un processo separato: CPU e RSS restano quelli
+    del processo di Aeris e il picco di RSS del worker è riportato a parte. Tempo e CPU partono dall'avvio del replay, dopo il
+    caricamento dei modelli, di cui vengono riportati i tempi a parte. stt sostituisce
+    whisper con un backend già pronto (FakeTranscriber), per i test senza torch.
+
+    speed=0 riproduce il file al ritmo dei lettori: con l'orchestratore asyncio la cattura
+    legge sempre e le wakeword cadrebbero durante le risposte, quindi lì resta il tempo reale.
+    Fuori dal tempo reale anche la frase dell'utente viene accelerata: la latenza dalla
+    wakeword non ha senso e viene riportata solo quella dalla fine del parlato; con speed=0
+    manca anche il real-time factor, perché la durata registrata non è nota."""
+def run_session(session: Session,
+                mode: str = "threaded",
+                speed: float = 1.0,
+                stt_backend: str = None,
+                tts: str = "fake",
+                voice_path: str = None,
+                streaming_stt: bool = None,
+                stt_worker: bool = False,
+                stt=None,
+                first_token: float = 0.3,
+                token_interval: float = 0.02,
+                tail_seconds: float = 6.0) -> dict:
+    from Aeris import Aeris
+    from model.response_gen import AerisMind
+    from speech.voice import AerisVoice
+
+    if mode == "async" and speed == 0:
+        print("[REPLAY] la pipeline asyncio non supporta speed=0: replay in tempo reale")
+        speed = 1.0
+
+    stt_process = getattr(stt, "name", None) or ("worker" if stt_worker else "inproc")
+    workdir = tempfile.mkdtemp(prefix="aeris-replay-")
+    trace_path = os.path.join(workdir, "trace.jsonl")
+    tracer = Tracer(path=trace_path)
+    set_tracer(tracer)
+    try:
+        audio = session.load(RATE)
+        started = {}
+
+        def on_start():
+            started.update(wall=time.perf_counter(), cpu=time.process_time(), rss=rss_mb())
+
+        capture = FileCapture(audio, sample_rate=RATE, speed=speed, tail_seconds=tail_seconds, on_start=on_start)
+        engine = ScriptedWakeword(capture, session.wake_times)
+        client = FakeOpenAI(session.replies, first_token=first_token, token_interval=token_interval)
+        cache_dir = os.path.join(workdir, "tts")
+        if tts == "fake":
+            voice = FakeVoice(cache_dir=cache_dir)
+        else:
+            voice = AerisVoice(voice_path, cache_dir=cache_dir, player=NullPlayer) if voice_path \
+                else AerisVoice(cache_dir=cache_dir, player=NullPlayer)
+
+        aeris = Aeris(streaming_stt=streaming_stt, barge_in=None, follow_up_seconds=0,
+                      capture=capture, mind=AerisMind(client=client), voice=voice,
+                      wake_engine=engine, stt_backend=stt_backend, stt_worker=stt_worker, stt=stt)
+        if mode == "async":
+            aeris.run_async()
+        else:
+            aeris.start_listening_cycle(timeout=10)
+        wall = time.perf_counter() - started.get("wall", time.perf_counter())
+        cpu = time.process_time() - started.get("cpu", time.process_time())
+
+        with open(trace_path, encoding="utf-8") as f:
+            turns = [json.loads(line) for line in f if line.strip()]
+    finally:
+        tracer.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    response, after_speech, rtf = [], [], []
+    for turn in turns:
+        marks = turn["marks_ms"]
+        if "tts_first_sample" in marks:
+            response.append(marks["tts_first_sample"])
+            if "end_of_speech" in marks:
+                after_speech.append(marks["tts_first_sample"] - marks["end_of_speech"])
+        stt = turn["wall_ms"].get("stt")
+        if stt is not None and marks.get("end_of_speech") and speed > 0:
+            # secondi di audio registrati: il tempo di orologio riportato alla velocità del replay
+            recorded = marks["end_of_speech"] / 1000 * speed + aeris.preroll_seconds
+            rtf.append(stt / 1000 / recorded)
+    response.sort()
+    after_speech.sort()
+    # i contatori dei lettori nella traccia sono cumulativi: vale l'ultimo turno
+    dropped = max([turn.get("dropped", 0) for turn in turns] or [0])
+    realtime = speed == 1.0
+    return {
+        "session": session.name,
+        "mode": mode,
+        "speed": speed,
+        "stt_process": stt_process,
+        "audio_seconds": round(len(audio) / RATE, 2),
+        "wakes": len(session.wake_times),
+        "detected": engine.detected,
+        "missed": engine.missed,
+        "turns": len(turns),
+        "answered": len(response),
+        "wake_to_response_p50_ms": percentile(response, 50) if realtime and response else None,
+        "wake_to_response_p95_ms": percentile(response, 95) if realtime and response else None,
+        "speech_to_response_p50_ms": percentile(after_speech, 50) if after_speech else None,
+        "speech_to_response_p95_ms": percentile(after_speech, 95) if after_speech else None,
+        "stt_rtf": float(np.mean(rtf)) if rtf else None,
+        "overflows": capture.overflows,
+        "dropped_ms": dropped / RATE * 1000,
+        "stt_restarts": getattr(aeris.ears.stt, "restarts", 0) if aeris.ears else 0,
+        "replay_seconds": wall,
+        "cpu_seconds": cpu,
+        "cpu_percent": 100 * cpu / wall if wall > 0 else 0.0,
+        "rss_start_mb": started.get("rss"),
+        "rss_peak_mb": peak_rss_mb(),
+        # il worker è già terminato in cleanup: i figli attesi contano in RUSAGE_CHILDREN
+        "rss_worker_peak_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 if stt_worker else None,
+        "startup": {name: {"load": load, "warmup": warmup}
+                    for name, (load, warmup) in aeris.startup_timings.items()},
+        "llm_requests": len(client.requests),
+        # turni risolti dal motore degli intent senza chiamare il modello
+        "intent_turns": sum(turn.get("path") == "intent" for turn in turns)
+    }
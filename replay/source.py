@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+import wave
+import weakref
+from typing import Callable
+import numpy as np
+from audio.capture import AudioRing, RingReader
+from audio.resampler import StreamingResampler
+
+
+""" Legge un file audio e lo restituisce in int16 mono a sample_rate. I WAV portano la
+    propria frequenza; i file .raw/.pcm sono PCM int16 mono a raw_rate. Se serve
+    l'audio viene ricampionato con lo stesso resampler polifase della cattura."""
+def load_audio(path: str, sample_rate: int = 44100, raw_rate: int = 16000) -> np.ndarray:
+    if os.path.splitext(path)[1].lower() in (".raw", ".pcm"):
+        rate = raw_rate
+        with open(path, "rb") as f:
+            audio = np.frombuffer(f.read(), dtype=np.int16)
+    else:
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"{path}: sono supportati solo WAV a 16 bit")
+            rate = wav.getframerate()
+            audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                audio = audio.reshape(-1, wav.getnchannels()).mean(axis=1).astype(np.int16)
+    if rate == sample_rate:
+        return audio.copy()
+    resampler = StreamingResampler(orig_sr=rate, target_sr=sample_rate)
+    audio = audio.astype(np.float32) / 32768.0
+    audio = np.concatenate((resampler.process(audio), resampler.process(np.zeros(resampler.taps, dtype=np.float32))))
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+
+class ReplayReader(RingReader):
+    """ Lettore del buffer di FileCapture: segnala alla sorgente quando sta leggendo,
+        così la riproduzione accelerata avanza al ritmo di chi consuma l'audio."""
+    def __init__(self, capture, start: int = None):
+        super().__init__(capture.ring, start)
+        self.capture = capture
+        self.reading = False
+        self.last_read = time.monotonic()
+
+    def read(self, n: int, timeout: float = None):
+        return self._tracked(super().read, n, timeout)
+
+    def view(self, n: int, timeout: float = None):
+        return self._tracked(super().view, n, timeout)
+
+    def _tracked(self, method, n: int, timeout: float):
+        self.reading = True
+        try:
+            return method(n, timeout)
+        finally:
+            self.reading = False
+            self.last_read = time.monotonic()
+            self.capture.notify_progress()
+
+
+class FileCapture:
+    """ Sorgente audio da file al posto di CaptureEngine: stessa interfaccia (start, stop,
+        reader, position, ring, sample_rate, overflows) ma i campioni arrivano da un WAV o
+        da PCM grezzo invece che da PyAudio, quindi Porcupine, AerisEars, AerisEars2 e la
+        pipeline asyncio girano senza microfono.
+
+        Con speed=1.0 i blocchi vengono scritti alla velocità reale del microfono, con
+        speed=2.0 al doppio e così via. Con speed=0 la riproduzione è la più veloce
+        possibile: ogni blocco viene scritto appena i lettori attivi hanno consumato il
+        precedente (al massimo lookahead campioni di anticipo) e la sorgente si ferma quando
+        nessuno legge, come un utente che aspetta la risposta prima di parlare di nuovo.
+        Dopo il file vengono scritti tail_seconds di silenzio, poi il buffer viene chiuso.
+        on_start, se indicata, viene chiamata all'avvio della riproduzione.
+
+        Come la callback di PyAudio anche la scrittura ha bisogno del GIL: fuori dalla
+        riproduzione accelerata ogni blocco scritto con più di overflow_seconds di ritardo
+        (di default quattro buffer, quanti ne tiene il dispositivo) conta come un overflow."""
+    def __init__(self,
+                 audio,
+                 sample_rate: int = 44100,
+                 speed: float = 1.0,
+                 frames_per_buffer: int = 1024,
+                 tail_seconds: float = 0.0,
+                 buffer_seconds: float = 10.0,
+                 raw_rate: int = 16000,
+                 lookahead: int = 4096,
+                 idle_seconds: float = 0.2,
+                 overflow_seconds: float = None,
+                 on_start: Callable = None):
+        if isinstance(audio, str):
+            self.path = audio
+            audio = load_audio(audio, sample_rate, raw_rate)
+        else:
+            self.path = None
+        self.audio = np.asarray(audio, dtype=np.int16)
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.frames_per_buffer = frames_per_buffer
+        self.tail = int(tail_seconds * sample_rate)
+        self.lookahead = max(lookahead, 2 * frames_per_buffer)
+        self.idle_seconds = idle_seconds
+        self.overflow_seconds = overflow_seconds if overflow_seconds is not None else 4 * frames_per_buffer / sample_rate
+        self.ring = AudioRing(int(sample_rate * buffer_seconds))
+
+        self.pa = None # nessun dispositivo: list_audio_dev e simili lo controllano
+        self.overflows = 0
+        self.finished = threading.Event() # impostato quando tutto il file è stato scritto
+        self._readers = weakref.WeakSet()
+        self._progress = threading.Condition()
+        self._stop = threading.Event()
+        self.on_start = on_start
+        self.thread = None
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    @property
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    """ Posizione assoluta (in campioni) dell'ultimo campione scritto: coincide con
+        l'istante del file già riprodotto."""
+    @property
+    def position(self) -> int:
+        return self.ring.written
+
+    """ Avvia la riproduzione. Come per CaptureEngine le chiamate successive non fanno
+        nulla: il file viene riprodotto una sola volta."""
+    def start(self):
+        if self.thread is not None:
+            return
+        if self.on_start:
+            self.on_start()
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.notify_progress()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        self.ring.close()
+
+    def reader(self, start: int = None) -> ReplayReader:
+        reader = ReplayReader(self, start)
+        self._readers.add(reader)
+        self.notify_progress()
+        return reader
+
+    def notify_progress(self):
+        with self._progress:
+            self._progress.notify_all()
+
+    def _feed(self):
+        block = self.frames_per_buffer
+        silence = np.zeros(block, dtype=np.int16)
+        total = len(self.audio) + self.tail
+        start = time.perf_counter()
+        for offset in range(0, total, block):
+            if self.speed > 0:
+                delay = start + offset / self.sample_rate / self.speed - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                if -delay > self.overflow_seconds / self.speed:
+                    self.overflows += 1
+            elif not self._wait_readers():
+                break
+            if self._stop.is_set():
+                break
+            data = self.audio[offset:offset + block] if offset < len(self.audio) else silence
+            if len(data) < block and offset + len(data) < total:
+                # ultimo blocco del file: completato con l'inizio del silenzio finale
+                data = np.concatenate((data, silence[:min(block, total - offset) - len(data)]))
+            self.ring.write(data)
+        self.finished.set()
+        self.ring.close()
+
+    """ Riproduzione accelerata: aspetta che almeno un lettore sia attivo e che nessuno
+        dei lettori attivi sia indietro di più di lookahead campioni. Un lettore che non
+        legge da idle_seconds (ad esempio quello della wakeword durante un turno) non
+        trattiene la sorgente."""
+    def _wait_readers(self) -> bool:
+        def ready():
+            if self._stop.is_set():
+                return True
+            now = time.monotonic()
+            active = [r for r in list(self._readers)
+                      if r.reading or now - r.last_read < self.idle_seconds]
+            return bool(active) and all(self.ring.written - r.position < self.lookahead for r in active)
+
+        with self._progress:
+            while not ready():
+                self._progress.wait(0.05)
+        return not self._stop.is_set()
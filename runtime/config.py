@@ -0,0 +1,145 @@
+import os
+import threading
+
+""" Variabili lette dalle librerie di calcolo al momento dell'import (OpenMP di torch,
+    OpenBLAS e MKL di numpy, numba): impostate prima dell'import, nel processo e nei
+    processi figli come il worker di trascrizione."""
+_THREAD_ENV = {
+    "OMP_NUM_THREADS": "stt_threads",
+    "MKL_NUM_THREADS": "blas_threads",
+    "OPENBLAS_NUM_THREADS": "blas_threads",
+    "NUMBA_NUM_THREADS": "blas_threads"
+}
+
+
+def _int_env(name: str):
+    value = os.getenv(name, "")
+    return int(value) if value.strip() else None
+
+
+def _cpus_env(name: str):
+    value = os.getenv(name, "")
+    return tuple(int(c) for c in value.split(",")) if value.strip() else None
+
+
+class RuntimeConfig:
+    """ Budget di thread e CPU dei motori che condividono i core della scheda: torch per
+        whisper, onnxruntime per Piper e le librerie BLAS di numpy. Senza limiti torch usa
+        tutti i core per ogni operazione e la callback di cattura, il VAD e la wakeword
+        restano senza CPU proprio mentre l'utente parla.
+
+        Di default whisper usa tutti i core meno uno (lasciato a cattura e wakeword) con un
+        solo thread inter-op, Piper metà dei core e le BLAS di numpy un thread: gli array
+        del percorso audio sono piccoli e i thread di OpenBLAS girerebbero a vuoto.
+        capture_cpu fissa il thread della callback di PyAudio su un core (nessun
+        vincolo di default), stt_cpus i core del worker di trascrizione: se la cattura
+        ha un core fissato il worker di default usa tutti gli altri.
+
+        Le variabili d'ambiente AERIS_STT_THREADS, AERIS_STT_INTEROP_THREADS,
+        AERIS_TTS_THREADS, AERIS_BLAS_THREADS, AERIS_CAPTURE_CPU e AERIS_STT_CPUS
+        sostituiscono i default; AERIS_PROFILE_STARTUP=1 carica i componenti in sequenza
+        per attribuire l'RSS a ciascuno."""
+    def __init__(self,
+                 cores: int = None,
+                 stt_threads: int = None,
+                 stt_interop_threads: int = 1,
+                 tts_threads: int = None,
+                 blas_threads: int = 1,
+                 capture_cpu: int = None,
+                 stt_cpus: tuple = None,
+                 profile_startup: bool = False):
+        self.cores = cores or len(os.sched_getaffinity(0))
+        self.stt_threads = stt_threads or max(1, self.cores - 1)
+        self.stt_interop_threads = stt_interop_threads or 1
+        self.tts_threads = tts_threads or max(1, self.cores // 2)
+        self.blas_threads = blas_threads or 1
+        self.capture_cpu = capture_cpu
+        if not stt_cpus and capture_cpu is not None and self.cores > 1:
+            stt_cpus = [cpu for cpu in sorted(os.sched_getaffinity(0)) if cpu != capture_cpu]
+        self.stt_cpus = tuple(stt_cpus) if stt_cpus else None
+        self.profile_startup = profile_startup
+        self._torch_configured = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(stt_threads=_int_env("AERIS_STT_THREADS"),
+                   stt_interop_threads=_int_env("AERIS_STT_INTEROP_THREADS"),
+                   tts_threads=_int_env("AERIS_TTS_THREADS"),
+                   blas_threads=_int_env("AERIS_BLAS_THREADS"),
+                   capture_cpu=_int_env("AERIS_CAPTURE_CPU"),
+                   stt_cpus=_cpus_env("AERIS_STT_CPUS"),
+                   profile_startup=os.getenv("AERIS_PROFILE_STARTUP") == "1")
+
+    """ Imposta le variabili dei thread delle librerie di calcolo senza sovrascrivere
+        quelle già presenti. Ha effetto sulle librerie non ancora importate e sui processi
+        figli: va chiamata il prima possibile, prima di importare numpy."""
+    def apply_environment(self):
+        for variable, attribute in _THREAD_ENV.items():
+            os.environ.setdefault(variable, str(getattr(self, attribute)))
+        # il tokenizer veloce di whisper aprirebbe un suo pool di thread
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    """ Thread intra-op e inter-op di torch per whisper nel processo corrente. I thread
+        inter-op si possono fissare una sola volta e prima di qualsiasi lavoro parallelo:
+        se è troppo tardi resta il valore attuale."""
+    def configure_torch(self, threads: int = None):
+        import torch
+        torch.set_num_threads(threads or self.stt_threads)
+        if self._torch_configured:
+            return
+        self._torch_configured = True
+        try:
+            torch.set_num_interop_threads(self.stt_interop_threads)
+        except RuntimeError:
+            pass
+
+    """ Opzioni della sessione onnxruntime di Piper: tts_threads thread intra-op ed
+        esecuzione sequenziale dei nodi, senza pool inter-op."""
+    def onnx_session_options(self):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.tts_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        return options
+
+    """ Fissa il thread che la chiama sul core cpu (Linux: l'affinità per thread usa il
+        suo id nativo). Restituisce False se non è possibile."""
+    @staticmethod
+    def pin_current_thread(cpu: int) -> bool:
+        try:
+            os.sched_setaffinity(threading.get_native_id(), {cpu})
+            return True
+        except (OSError, AttributeError, ValueError) as e:
+            print(f"Impossibile fissare il thread sul core {cpu}: {e}")
+            return False
+
+    def describe(self) -> str:
+        text = (f"{self.cores} core, whisper {self.stt_threads}+{self.stt_interop_threads} thread, "
+                f"Piper {self.tts_threads}, BLAS {self.blas_threads}")
+        if self.stt_cpus:
+            text += f", worker STT sui core {','.join(map(str, self.stt_cpus))}"
+        if self.capture_cpu is not None:
+            text += f", cattura sul core {self.capture_cpu}"
+        return text
+
+
+_RUNTIME = None
+_RUNTIME_LOCK = threading.Lock()
+
+
+""" Configurazione condivisa dal processo, letta dall'ambiente al primo uso."""
+def get_runtime() -> RuntimeConfig:
+    global _RUNTIME
+    if _RUNTIME is None:
+        with _RUNTIME_LOCK:
+            if _RUNTIME is None:
+                _RUNTIME = RuntimeConfig.from_env()
+    return _RUNTIME
+
+
+""" Sostituisce la configurazione condivisa. Va chiamata prima di creare i componenti."""
+def set_runtime(runtime: RuntimeConfig):
+    global _RUNTIME
+    with _RUNTIME_LOCK:
+        _RUNTIME = runtime
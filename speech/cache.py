@@ -0,0 +1,198 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PhraseCache:
+    """ Cache dell'audio sintetizzato indirizzata per contenuto: la chiave è l'hash di
+        (modello della voce, testo normalizzato, parametri di sintesi). Ha due livelli:
+        una LRU in memoria con un budget in byte e una cartella di file PCM grezzi che
+        vengono mappati in memoria al momento della riproduzione. Anche la cartella ha
+        un budget (disk_budget byte e max_disk_entries frasi, AERIS_TTS_CACHE_MB per i
+        byte): ogni frase nuova del modello finisce su disco e senza limite la cartella
+        crescerebbe per sempre. Oltre il budget si cancellano le frasi usate meno di
+        recente; l'ordine viene dalla data di modifica dei file, aggiornata ad ogni uso,
+        così sopravvive ai riavvii."""
+    def __init__(self,
+                 voice_path: str,
+                 params: dict = None,
+                 cache_dir: str = None,
+                 memory_budget: int = 8 * 1024 * 1024,
+                 max_entry_bytes: int = 2 * 1024 * 1024,
+                 disk_budget: int = None,
+                 max_disk_entries: int = 2000):
+        self.voice_path = voice_path
+        self.params = json.dumps(params or {}, sort_keys=True)
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "aeris", "tts")
+        self.memory_budget = memory_budget
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_budget = disk_budget or int(float(os.getenv("AERIS_TTS_CACHE_MB", "64")) * 1024 * 1024)
+        self.max_disk_entries = max_disk_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._memory = OrderedDict() # chiave -> (pcm, secondi di sintesi)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        # contatori
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evicted = 0 # frasi cancellate dal disco per stare nel budget
+        self.saved_seconds = 0.0
+
+        # frasi su disco dalla meno alla più usata di recente: chiave -> byte del PCM
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._scan_disk()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def key(self, text: str) -> str:
+        raw = f"{self.voice_path}\n{self.normalize(text)}\n{self.params}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved_seconds": self.saved_seconds,
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+            "disk_entries": len(self._disk),
+            "evicted": self.evicted
+        }
+
+    """ Restituisce il PCM della frase se è in cache, altrimenti None. I file su disco
+        vengono mappati in memoria e promossi nella LRU."""
+    def get(self, text: str):
+        key = self.key(text)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                synth_time = json.load(f)["synth_time"]
+            with open(path + ".pcm", "rb") as f:
+                pcm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self.saved_seconds += synth_time
+            self._remember(key, pcm, synth_time)
+            self._touch(key, len(pcm))
+        return pcm
+
+    """ Salva il PCM sintetizzato in entrambi i livelli."""
+    def put(self, text: str, pcm: bytes, synth_time: float):
+        if not pcm or len(pcm) > self.max_entry_bytes:
+            return
+        key = self.key(text)
+        path = os.path.join(self.cache_dir, key)
+        try:
+            # scrittura atomica: un file a metà non deve mai essere mappato
+            with open(path + ".pcm.tmp", "wb") as f:
+                f.write(pcm)
+            os.replace(path + ".pcm.tmp", path + ".pcm")
+            with open(path + ".json", "w", encoding="utf-8") as f:
+                json.dump({"text": self.normalize(text), "synth_time": synth_time}, f)
+        except OSError as e:
+            print(f"Impossibile salvare la frase in cache: {e}")
+            with self._lock:
+                self._remember(key, pcm, synth_time)
+            return
+        with self._lock:
+            self._remember(key, pcm, synth_time)
+            self._touch(key, len(pcm))
+            self._evict_disk()
+
+    """ Sintetizza in anticipo le frasi ricorrenti che non sono ancora in cache."""
+    def prewarm(self, phrases, synthesize) -> int:
+        added = 0
+        for text in phrases:
+            if os.path.exists(os.path.join(self.cache_dir, self.key(text) + ".pcm")):
+                continue
+            start = time.perf_counter()
+            pcm = b"".join(synthesize(text))
+            self.put(text, pcm, time.perf_counter() - start)
+            added += 1
+        return added
+
+    def _remember(self, key: str, pcm, synth_time: float):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(pcm) > self.memory_budget:
+            return
+        self._memory[key] = (pcm, synth_time)
+        self._memory_bytes += len(pcm)
+        while self._memory_bytes > self.memory_budget:
+            _, (old, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    """ Legge le frasi già su disco (anche di altre voci: il budget è della cartella),
+        ordinate per data di modifica, e rientra nel budget."""
+    def _scan_disk(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for item in it:
+                    if item.name.endswith(".pcm"):
+                        stat = item.stat()
+                        entries.append((stat.st_mtime, item.name[:-4], stat.st_size))
+        except OSError as e:
+            print(f"Impossibile leggere la cache delle frasi: {e}")
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk()
+
+    """ Segna la frase come usata adesso, nell'indice e nella data del file."""
+    def _touch(self, key: str, size: int):
+        self._disk_bytes += size - self._disk.get(key, 0)
+        self._disk[key] = size
+        self._disk.move_to_end(key)
+        try:
+            os.utime(os.path.join(self.cache_dir, key + ".pcm"))
+        except OSError:
+            pass
+
+    """ Cancella le frasi usate meno di recente finché la cartella non rientra nel budget.
+        Un file già mappato in memoria resta leggibile anche dopo la cancellazione."""
+    def _evict_disk(self):
+        while self._disk and (self._disk_bytes > self.disk_budget or len(self._disk) > self.max_disk_entries):
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evicted += 1
+            path = os.path.join(self.cache_dir, key)
+            for suffix in (".pcm", ".json"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Impossibile cancellare la frase dalla cache: {e}")
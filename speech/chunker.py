@@ -0,0 +1,50 @@
+import re
+
+
+class SentenceChunker:
+    """ Accumula i delta di testo generati dal modello e restituisce le frasi complete,
+        così la sintesi vocale può iniziare mentre il resto della risposta viene generato.
+        Una frase termina con . ! ? … seguiti da uno spazio; se il testo accumulato è lungo
+        si spezza anche su ; : e , per non far aspettare troppo la prima frase."""
+    SENTENCE_END = re.compile(r"[.!?…]+[\"')»]*\s")
+    CLAUSE_END = re.compile(r"[;:,]\s")
+
+    def __init__(self, min_chars: int = 12, clause_chars: int = 80, first_clause_chars: int = 30):
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.first_clause_chars = first_clause_chars
+        self.buffer = ""
+        self.emitted = 0
+
+    def feed(self, delta: str) -> list:
+        self.buffer += delta
+        chunks = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            chunk, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip()
+            if chunk:
+                chunks.append(chunk)
+                self.emitted += 1
+        return chunks
+
+    """ Restituisce l'eventuale testo rimasto alla fine dello stream."""
+    def flush(self) -> list:
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+    def _find_cut(self):
+        for match in self.SENTENCE_END.finditer(self.buffer):
+            if match.end() >= self.min_chars:
+                return match.end()
+
+        # la prima frase si spezza prima sulle pause per ridurre il tempo alla prima voce
+        limit = self.first_clause_chars if self.emitted == 0 else self.clause_chars
+        if len(self.buffer) >= limit:
+            last = None
+            for match in self.CLAUSE_END.finditer(self.buffer):
+                if match.end() >= self.min_chars:
+                    last = match.end()
+            return last
+        return None
@@ -0,0 +1,73 @@
+import threading
+import time
+from queue import Empty, Queue
+from metrics.tracing import get_tracer
+
+
+class PlaybackQueue:
+    """ Coda di riproduzione: un thread sintetizza le frasi man mano che arrivano e scrive
+        i chunk PCM nel jitter buffer del player, che li riproduce mentre la sintesi
+        prosegue. La frase N+1 viene quindi sintetizzata mentre la frase N è in riproduzione."""
+    _END = object()
+
+    def __init__(self, voice):
+        self.voice = voice
+        self.player = voice.player
+        self.texts = Queue()
+        self.cancelled = threading.Event()
+        self.tracer = get_tracer()
+
+        self.created_at = time.perf_counter()
+        self.player.begin()
+
+        self.synth_thread = threading.Thread(target=self._synth_loop, daemon=True)
+        self.synth_thread.start()
+
+    """ Secondi dalla creazione della coda al primo campione riprodotto."""
+    @property
+    def first_audio_latency(self):
+        if self.player.first_sample_latency is None:
+            return None
+        return self.player.begin_time + self.player.first_sample_latency - self.created_at
+
+    def put(self, text: str):
+        if not self.cancelled.is_set():
+            self.texts.put(text)
+            self.tracer.queue_depth("tts_queue", self.texts.qsize())
+
+    """ Segnala che non arriveranno altre frasi."""
+    def close(self):
+        self.texts.put(self._END)
+
+    """ Aspetta che tutte le frasi siano state riprodotte."""
+    def wait(self):
+        self.synth_thread.join()
+        self.player.wait()
+
+    """ Interrompe sintesi e riproduzione scartando le frasi in attesa."""
+    def cancel(self):
+        self.cancelled.set()
+        # svuota la coda: le frasi non ancora sintetizzate non servono più
+        while True:
+            try:
+                self.texts.get_nowait()
+            except Empty:
+                break
+        self.texts.put(self._END)
+        self.player.stop()
+
+    def _synth_loop(self):
+        while True:
+            text = self.texts.get()
+            if text is self._END or self.cancelled.is_set():
+                break
+            try:
+                with self.tracer.stage("tts"):
+                    for pcm in self.voice.synthesize(text):
+                        if self.cancelled.is_set():
+                            break
+                        self.player.write(pcm)
+            except Exception as e:
+                print(f"Errore durante la sintesi: {e}")
+        if not self.cancelled.is_set():
+            self.player.end()
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+class PcmPlayer:
+    """ Riproduzione diretta di PCM int16 mono tramite uno stream PyAudio in modalità callback.
+        I chunk prodotti da Piper vengono scritti in un piccolo jitter buffer: la riproduzione
+        parte appena ci sono jitter_ms di audio e la fine viene segnalata da un evento
+        quando il buffer si svuota dopo end(), senza polling.
+        Durante la riproduzione tiene il livello dei blocchi appena emessi, usato come
+        riferimento per distinguere l'eco dell'altoparlante dalla voce dell'utente."""
+    def __init__(self,
+                 sample_rate: int,
+                 jitter_ms: int = 60,
+                 frames_per_buffer: int = 512,
+                 output_device_index: int = None):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.output_device_index = output_device_index
+        self.jitter_bytes = int(sample_rate * jitter_ms / 1000) * 2
+
+        self.pa = None
+        self.stream = None
+        self._continue = None # pyaudio.paContinue, letto in start()
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._playing = False
+        self._ended = True
+        self._stopped = False
+        self.done = threading.Event()
+        self.done.set()
+        
+        # volume di uscita, abbassato durante il barge-in (ducking)
+        self.gain = 1.0
+        # volume scelto dall'utente (0.1-1.0), resta uguale tra un enunciato e l'altro
+        self.volume = 1.0
+        # RMS degli ultimi blocchi riprodotti (~200 ms), segnale di riferimento per l'eco
+        self._reference = deque(maxlen=max(1, int(0.2 * sample_rate / frames_per_buffer)))
+        
+        # istante di stop() e del primo buffer di silenzio consegnato al dispositivo dopo
+        self.stop_time = None
+        self.silence_time = None
+        self.silenced = threading.Event()
+        self._stopping = False
+
+        self.begin_time = None
+        self.first_sample_latency = None # secondi da begin() al primo campione riprodotto
+        self.underruns = 0
+
+    def start(self):
+        if self.stream is not None:
+            return
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        self.pa = pyaudio.PyAudio()
+        config = {
+            'format' : pyaudio.paInt16,
+            'channels' : 1,
+            'rate' : self.sample_rate,
+            'frames_per_buffer' : self.frames_per_buffer,
+            'output' : True,
+            'stream_callback' : self._callback
+        }
+        if self.output_device_index is not None:
+            config['output_device_index'] = self.output_device_index
+        self.stream = self.pa.open(**config)
+        self.stream.start_stream()
+
+    def close(self):
+        self.stop()
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+
+    """ Inizia un nuovo enunciato."""
+    def begin(self):
+        self.start()
+        with self._lock:
+            self._buffer.clear()
+            self._playing = False
+            self._ended = False
+            self._stopped = False
+            self.gain = 1.0
+            self.done.clear()
+            self.begin_time = time.perf_counter()
+            self.first_sample_latency = None
+
+    """ Accoda PCM al jitter buffer. Dopo stop() i campioni vengono scartati fino
+        al prossimo begin(), così una sintesi ancora in corso non riprende a parlare."""
+    def write(self, pcm: bytes):
+        with self._lock:
+            if not self._stopped:
+                self._buffer += pcm
+
+    """ Segnala che non arriveranno altri campioni: done verrà impostato a buffer vuoto."""
+    def end(self):
+        with self._lock:
+            self._ended = True
+            if not self._buffer:
+                self._playing = False
+                self.done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
+
+    """ Interrompe subito la riproduzione scartando l'audio in attesa. silenced viene
+        impostato quando il callback consegna il primo buffer di silenzio."""
+    def stop(self):
+        with self._lock:
+            was_playing = bool(self._buffer) or not self._ended
+            self._buffer.clear()
+            self._playing = False
+            self._ended = True
+            self._stopped = True
+            self.done.set()
+            self.stop_time = time.perf_counter()
+            self.silenced.clear()
+            self._stopping = was_playing and self.stream is not None
+            if not self._stopping:
+                self.silence_time = self.stop_time
+                self.silenced.set()
+    
+    """ Imposta il volume di uscita (1.0 = volume pieno)."""
+    def duck(self, gain: float):
+        self.gain = gain
+    
+    """ Imposta il volume scelto dall'utente, limitato a [0.1, 1.0] perché l'assistente
+        resti udibile. Si somma al ducking del barge-in."""
+    def set_volume(self, volume: float):
+        self.volume = min(max(volume, 0.1), 1.0)
+    
+    """ Livello RMS (0-1) più alto riprodotto negli ultimi ~200 ms."""
+    def reference_level(self) -> float:
+        return max(self._reference, default=0.0)
+    
+    """ Secondi di audio già consegnati al dispositivo ma non ancora usciti dall'altoparlante."""
+    @property
+    def output_latency(self) -> float:
+        return self.stream.get_output_latency() if self.stream is not None else 0.0
+
+    @property
+    def buffered_seconds(self) -> float:
+        return len(self._buffer) / 2 / self.sample_rate
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        size = frame_count * 2
+        chunk = b""
+        with self._lock:
+            if not self._playing and self._buffer:
+                # parte quando il jitter buffer è pieno, o subito se l'enunciato è finito
+                self._playing = len(self._buffer) >= self.jitter_bytes or self._ended
+            if self._playing:
+                chunk = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                if self.first_sample_latency is None and chunk:
+                    self.first_sample_latency = time.perf_counter() - self.begin_time
+                if not self._buffer:
+                    self._playing = False
+                    if self._ended:
+                        self.done.set()
+                    else:
+                        self.underruns += 1 # la sintesi è più lenta della riproduzione: riempie di nuovo il buffer
+            if self._stopping:
+                self._stopping = False
+                self.silence_time = time.perf_counter()
+                self.silenced.set()
+        if chunk:
+            samples = np.frombuffer(chunk, dtype=np.int16)
+            gain = self.gain * self.volume
+            if gain != 1.0:
+                samples = (samples * gain).astype(np.int16)
+                chunk = samples.tobytes()
+            self._reference.append(float(np.sqrt(np.mean(np.square(samples / 32768.0)))))
+        else:
+            self._reference.append(0.0)
+        if len(chunk) < size:
+            chunk += b"\x00" * (size - len(chunk))
+        return (chunk, self._continue)
@@ -1,51 +1,136 @@
-from piper import PiperVoice
-import wave
-import pygame
-import numpy as np
-import io
+import json
+import time
+from typing import Callable
+from speech.player import PcmPlayer
+from speech.cache import PhraseCache
+from metrics.tracing import get_tracer
+from metrics.resources import get_resources
+from runtime.config import get_runtime
+
+""" Frasi che l'assistente pronuncia spesso, sintetizzate in anticipo all'avvio."""
+COMMON_PHRASES = [
+    "Ciao, sono Aeris.",
+    "Non sento nulla.",
+    "Scusa, non ho capito.",
+    "Non riesco a rispondere in questo momento.",
+    "Fatto.",
+    "Va bene."
+]
 
 class AerisVoice:
-    def __init__(self, voice: str = "/home/aeris/aeris/speech/it_IT-paola-medium.onnx"):
-        
+    def __init__(self,
+                 voice: str = "/home/aeris/aeris/speech/it_IT-paola-medium.onnx",
+                 cache_dir: str = None,
+                 player: Callable = PcmPlayer):
+
         # inizializza Piper
         self.voice = voice
         
-        self.tts = PiperVoice.load(self.voice)
-        
-        pygame.mixer.init()
+        # costruttore del player a partire dalla frequenza della voce: di default
+        # l'altoparlante, nel replay un player senza dispositivo
+        self.player_factory = player
+
+        # tempi di avvio in secondi, riempiti dal costruttore e da warmup
+        self.load_time = None
+        self.warmup_time = None
+
+        start = time.perf_counter()
+        self.tts = self.load_voice(self.voice)
+        self.load_time = time.perf_counter() - start
+
+        # la frequenza di campionamento viene dal file di configurazione della voce
+        self.sample_rate = self.tts.config.sample_rate
+        self.player = self.player_factory(self.sample_rate)
         
-    """ Metodo che prende in input il testo restituito dal modello ia e una frequenza di campionamento.
-        Successivamente riproduce l'audio tramite gli altoparlanti del dispotivo"""
-    def play_audio(self, text: str, sample_rate: int):
+        # cache delle frasi già sintetizzate con questa voce e questi parametri
+        self.cache = PhraseCache(self.voice, params=self.synthesis_params(), cache_dir=cache_dir)
+        self.tracer = get_tracer()
+
+    """ Carica il modello Piper; il modulo viene importato solo quando serve una voce vera.
+        PiperVoice.load non accetta opzioni di onnxruntime e userebbe tutti i core: la
+        voce viene costruita con una sessione limitata ai thread della configurazione di
+        runtime, oppure caricata normalmente se questa versione di piper non lo permette."""
+    @staticmethod
+    def load_voice(voice: str):
+        with get_resources().imports("tts"):
+            import onnxruntime
+            from piper import PiperVoice
+        try:
+            from piper.config import PiperConfig
+            with open(f"{voice}.json", encoding="utf-8") as f:
+                config = PiperConfig.from_dict(json.load(f))
+            session = onnxruntime.InferenceSession(str(voice), sess_options=get_runtime().onnx_session_options(),
+                                                   providers=["CPUExecutionProvider"])
+            return PiperVoice(config=config, session=session)
+        except (ImportError, OSError, TypeError, AttributeError) as e:
+            print(f"Sessione Piper con thread limitati non disponibile ({e}), caricamento standard")
+            return PiperVoice.load(voice)
+
+    def synthesis_params(self) -> dict:
+        config = self.tts.config
+        return {name: getattr(config, name, None) for name in ("sample_rate", "noise_scale", "length_scale", "noise_w_scale")}
+
+    """ Sintetizza una frase breve senza riprodurla per inizializzare la sessione
+        onnxruntime e phonemizer prima della prima risposta reale."""
+    def warmup(self, text: str = "Ciao.", phrases: list = COMMON_PHRASES):
+        start = time.perf_counter()
+        for _ in self.synthesize_uncached(text):
+            pass
+        self.player.start()
+        added = self.cache.prewarm(phrases, self.synthesize_uncached)
+        if added:
+            print(f"[AVVIO] {added} frasi ricorrenti sintetizzate nella cache")
+        self.warmup_time = time.perf_counter() - start
+        return self.warmup_time
+
+    """ Metodo che prende in input il testo restituito dal modello ia e lo riproduce
+        tramite gli altoparlanti del dispositivo. I chunk PCM prodotti da Piper vengono
+        scritti direttamente nello stream di uscita man mano che sono pronti."""
+    def play_audio(self, text: str):
         try:
             if not text:
                 raise ValueError("Non c'è risposta dal modello")
 
-            audio_buffer = io.BytesIO() # permette di creare un buffer in memoria RAM
-            
-            """ Sezione di codice che scrive nell'audio buffer i bytes presenti
-                nell'array audio dopo che è stato normalizzato."""
-            with wave.open(audio_buffer, 'wb') as wav_buffer: # wb = scrittura binaria
-                wav_buffer.setnchannels(1)
-                wav_buffer.setsampwidth(2)
-                wav_buffer.setframerate(sample_rate)
-                
-                self.tts.synthesize_wav(text, wav_buffer)      
-            
-            audio_buffer.seek(0) # punta all'inizio dell'audio buffer dopo aver scritto fino alla fine
-            
-            pygame.mixer.music.load(audio_buffer)
-            
-            pygame.mixer.music.play()
-            
-            # aspetta 100 millisecondi che pygame abbia finito di riprodurre l'audio
-            while pygame.mixer.music.get_busy():
-                pygame.time.wait(100)
+            self.player.begin()
+            self.feed(text)
+            self.player.end()
+            self.player.wait()
+            if self.player.first_sample_latency is not None:
+                print(f"Primo campione riprodotto dopo {self.player.first_sample_latency * 1000:.0f} ms")
         except Exception as e:
             print(f"Errore durante riproduzione audio: {e}")
-            
+
+    """ Restituisce i chunk PCM int16 del testo: dalla cache se la frase è già stata
+        sintetizzata, altrimenti man mano che Piper li produce salvando il risultato."""
+    def synthesize(self, text: str):
+        cached = self.cache.get(text)
+        if cached is not None:
+            yield cached
+            return
+        
+        start = time.perf_counter()
+        parts = []
+        for pcm in self.synthesize_uncached(text):
+            parts.append(pcm)
+            yield pcm
+        self.cache.put(text, b"".join(parts), time.perf_counter() - start)
+    
+    def synthesize_uncached(self, text: str):
+        for chunk in self.tts.synthesize(text):
+            yield chunk.audio_int16_bytes
+
+    """ Scrive nel player l'audio di una frase senza aspettarne la riproduzione."""
+    def feed(self, text: str):
+        with self.tracer.stage("tts"):
+            for pcm in self.synthesize(text):
+                self.player.write(pcm)
+
     """ Funzione usata per modificare la voce del modello. """
     def set_voice(self, voice: str):
         self.voice = voice
-        self.tts = PiperVoice.load(self.voice)
-        
+        self.tts = self.load_voice(self.voice)
+        self.cache = PhraseCache(self.voice, params=self.synthesis_params(), cache_dir=self.cache.cache_dir)
+        if self.tts.config.sample_rate != self.sample_rate:
+            self.player.close()
+            self.sample_rate = self.tts.config.sample_rate
+            self.player = self.player_factory(self.sample_rate)
@@ -0,0 +1,67 @@
+import threading
+import numpy as np
+import pytest
+from audio.audio_local import AerisEars
+from replay.fakes import FakeTranscriber
+
+
+class RecordingTranscriber(FakeTranscriber):
+    """ Restituisce per ogni segmento il suo livello e ricorda la dimensione di ogni chiamata."""
+    def __init__(self):
+        super().__init__(rtf=0.0)
+        self.calls = []
+
+    def transcribe_batch(self, segments: list) -> list:
+        self.calls.append(len(segments))
+        super().transcribe_batch(segments)
+        return [f"{audio[0]:.1f}" for audio in segments]
+
+
+def segment(level: float) -> np.ndarray:
+    return np.full(8000, level, dtype=np.float32)
+
+
+@pytest.fixture
+def ears():
+    ears = AerisEars(stt=RecordingTranscriber(), adaptive=False, batch_size=4, batch_wait=0.2)
+    yield ears
+    ears.close()
+
+
+def test_queued_segments_are_decoded_in_one_call(ears):
+    for level in (0.1, 0.2, 0.0, 0.3):
+        ears.audio_queue.put(segment(level))
+    # il segmento silenzioso non arriva al modello ma resta al suo posto
+    assert ears.transcribe_next_batch() == ["0.1", "0.2", None, "0.3"]
+    assert ears.stt.calls == [3]
+    assert ears.skipped_segments == 1
+    assert ears.audio_queue.unfinished_tasks == 0
+
+
+def test_batches_are_limited_to_batch_size(ears):
+    ears.batch_size = 2
+    for level in (0.1, 0.2, 0.3):
+        ears.audio_queue.put(segment(level))
+    assert ears.transcribe_next_batch() == ["0.1", "0.2"]
+    assert ears.transcribe_next_batch() == ["0.3"]
+    assert ears.stt.calls == [2, 1]
+
+
+def test_waits_for_late_segments_only_while_recording(ears):
+    ears.is_recording = True
+    ears.audio_queue.put(segment(0.1))
+    threading.Timer(0.05, ears.audio_queue.put, args=(segment(0.2),)).start()
+    assert ears.transcribe_next_batch() == ["0.1", "0.2"]
+
+    ears.is_recording = False
+    ears.audio_queue.put(segment(0.3))
+    threading.Timer(0.05, ears.audio_queue.put, args=(segment(0.4),)).start()
+    assert ears.transcribe_next_batch() == ["0.3"]
+    assert ears.transcribe_next_batch() == ["0.4"]
+
+
+def test_decode_stats_share_the_batch_time():
+    stt = FakeTranscriber(rtf=0.1)
+    stt.transcribe_batch([np.ones(16000, dtype=np.float32), np.ones(48000, dtype=np.float32)])
+    assert [stat["decode_seconds"] for stat in stt.last_stats] == pytest.approx([0.1, 0.3])
+    assert all(stat["batch_seconds"] == pytest.approx(0.4) for stat in stt.last_stats)
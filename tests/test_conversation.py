@@ -0,0 +1,51 @@
+import threading
+import time
+from model.conversation import ConversationSession, count_tokens
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_old_turns_leave_the_window_and_are_summarized():
+    session = ConversationSession(max_tokens=40)
+    for i in range(5):
+        session.add(f"Domanda numero {i} sulla storia di Roma?", f"Risposta {i}. Altri dettagli.")
+    assert session.tokens <= 40 and len(session.turns) < 5
+    assert "Domanda numero 0" in session.summary
+    assert count_tokens(session.summary) <= session.summary_tokens
+    assert session.messages()[0]["role"] == "developer"
+
+
+def test_clear_during_summary_keeps_the_new_session_empty():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append(turns)
+        started.set()
+        release.wait(2.0)
+        return "L'utente parlava di Roma."
+
+    session = ConversationSession(max_tokens=20, summarize=summarize)
+    session.add("Parlami della storia di Roma antica", "Roma fu fondata nel 753 a.C.")
+    session.add("E poi cosa successe dopo la fondazione?", "Ci furono i re, poi la repubblica.")
+    assert started.wait(2.0)
+    session.clear() # scadenza o nuova sessione mentre il riassunto è in corso
+    release.set()
+    time.sleep(0.1)
+    assert session.summary == ""
+    assert session.is_empty()
+
+    # la compattazione riparte nella nuova sessione
+    started.clear()
+    session.add("Dimmi qualcosa sulle stelle vicine", "La più vicina è Proxima Centauri.")
+    session.add("E quanto dista da noi in anni luce?", "Circa 4,2 anni luce.")
+    assert started.wait(2.0)
+    assert wait_for(lambda: session.summary == "L'utente parlava di Roma.")
+    assert len(calls) == 2
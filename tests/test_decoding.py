@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from audio.decoding import DecodingPolicy, repeated_rows, split_batch_time, text_tokens, trim_repeats
+
+EOS = 50257
+PROMPT = [50258, 50267, 50359, 50363] # inizio, lingua, task, senza timestamp
+
+
+def test_repeated_token_stops_the_row():
+    ids = np.array([PROMPT + [10, 11] + [7] * 8])
+    assert repeated_rows(ids, 4, 8, EOS).tolist() == [True]
+
+
+def test_repeated_trigram_stops_the_row():
+    ids = np.array([PROMPT + [1, 2, 3] * 3])
+    assert repeated_rows(ids, 4, 8, EOS).tolist() == [True]
+
+
+def test_clean_row_is_not_stopped():
+    ids = np.array([PROMPT + list(range(20, 32))])
+    assert repeated_rows(ids, 4, 8, EOS).tolist() == [False]
+
+
+def test_eos_padding_of_finished_rows_is_not_a_repeat():
+    # la prima riga ha finito presto e generate la riempie di eos, la seconda continua
+    finished = PROMPT + [20, 21, EOS] + [EOS] * 9
+    running = PROMPT + list(range(30, 42))
+    ids = np.array([finished, running])
+    assert repeated_rows(ids, 4, 8, EOS).tolist() == [False, False]
+
+
+def test_finished_row_does_not_hide_a_repeating_row():
+    finished = PROMPT + [20, EOS] + [EOS] * 8
+    looping = PROMPT + [5, 6] + [9] * 8
+    ids = np.array([finished, looping])
+    assert repeated_rows(ids, 4, 8, EOS).tolist() == [False, True]
+
+
+def test_text_tokens_stop_at_first_eos():
+    assert text_tokens(PROMPT + [20, 20, 21, EOS, EOS, EOS], EOS) == [20, 20, 21]
+    assert text_tokens([20, 50364, 21], EOS) == [20, 21]
+
+
+def test_trim_repeats_keeps_one_occurrence():
+    assert trim_repeats([1, 2, 3, 4, 4, 4, 4], 4) == [1, 2, 3, 4]
+    assert trim_repeats([1, 2, 3, 2, 3, 2, 3], 4) == [1, 2, 3]
+
+
+def test_max_tokens_grows_with_duration():
+    policy = DecodingPolicy()
+    assert policy.max_tokens(1.0) < policy.max_tokens(10.0) <= policy.max_new_tokens
+
+
+def test_batch_time_is_split_by_duration():
+    assert split_batch_time([1.0, 3.0], 2.0) == pytest.approx([0.5, 1.5])
+    assert sum(split_batch_time([0.5, 2.0, 1.5], 1.2)) == pytest.approx(1.2)
+    assert split_batch_time([0.0, 0.0], 1.0) == [0.5, 0.5]
+    assert split_batch_time([], 1.0) == []
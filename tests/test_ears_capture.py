@@ -0,0 +1,28 @@
+from audio.audio_local import AerisEars
+from replay.fakes import FakeTranscriber
+
+
+class StubCapture:
+    def __init__(self):
+        self.stopped = 0
+
+    def stop(self):
+        self.stopped += 1
+
+
+def test_close_releases_owned_capture_when_not_recording():
+    ears = AerisEars(stt=FakeTranscriber())
+    capture = StubCapture()
+    ears.capture = capture # come se start_recording l'avesse aperto
+    assert not ears.is_recording
+    ears.close()
+    assert capture.stopped == 1
+    assert ears.capture is None
+
+
+def test_close_leaves_shared_capture_open():
+    capture = StubCapture()
+    ears = AerisEars(capture=capture, stt=FakeTranscriber())
+    ears.close()
+    assert capture.stopped == 0
+    assert ears.capture is capture
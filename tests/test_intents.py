@@ -0,0 +1,110 @@
+import threading
+import types
+from datetime import datetime
+import pytest
+from benchmark.intent_bench import COMMANDS
+from model.intents import IntentEngine, describe_duration, normalize, parse_number
+from speech.player import PcmPlayer
+
+
+@pytest.fixture
+def engine():
+    voice = types.SimpleNamespace(player=PcmPlayer(22050))
+    engine = IntentEngine(voice=voice, clock=lambda: datetime(2026, 3, 1, 13, 15))
+    yield engine
+    engine.close()
+
+
+@pytest.mark.parametrize("text, expected", COMMANDS)
+def test_benchmark_commands_match_their_intent(engine, text, expected):
+    found = engine.match(text)
+    assert (found[0].name if found else None) == expected
+
+
+def test_normalize_strips_accents_punctuation_and_courtesy():
+    assert normalize("Aeris, mi dici che ore sono?") == "che ore sono"
+    assert normalize("Ehi, che giorno è oggi, per favore?") == "che giorno e oggi"
+    assert normalize("Volume al 40%!") == "volume al 40%"
+
+
+@pytest.mark.parametrize("word, value", [("5", 5), ("cinque", 5), ("venti", 20), ("ventuno", 21),
+                                         ("ventotto", 28), ("quarantacinque", 45), ("ciao", None)])
+def test_parse_number(word, value):
+    assert parse_number(word) == value
+
+
+@pytest.mark.parametrize("hour, minute, reply", [(13, 15, "È l'una e un quarto."), (0, 0, "È mezzanotte."),
+                                                 (12, 0, "È mezzogiorno."), (9, 5, "Sono le 9 e 5."),
+                                                 (21, 30, "Sono le 21 e mezza."), (8, 0, "Sono le 8 in punto.")])
+def test_time_reply(engine, hour, minute, reply):
+    engine.clock = lambda: datetime(2026, 3, 1, hour, minute)
+    assert engine.handle("Che ore sono?") == reply
+    assert engine.last_intent == "time"
+
+
+def test_date_reply(engine):
+    assert engine.handle("Che giorno è oggi?") == "Oggi è domenica primo marzo 2026."
+
+
+def test_timer_start_left_and_cancel(engine):
+    assert engine.handle("Imposta un timer di 5 minuti.") == "Timer di 5 minuti avviato."
+    assert engine.handle("Timer di mezz'ora, per favore.") == "Timer di 30 minuti avviato."
+    assert engine.handle("Quanto manca al timer?") == "Mancano 5 minuti."
+    assert engine.handle("Annulla il timer.") == "2 timer annullati."
+    assert engine.handle("Quanto manca?") == "Non ci sono timer attivi."
+
+
+def test_timer_announces_when_it_expires():
+    rang = threading.Event()
+    messages = []
+    engine = IntentEngine(announce=lambda text: (messages.append(text), rang.set()))
+    assert engine.handle("metti un timer di un secondo") == "Timer di 1 secondo avviato."
+    assert rang.wait(3.0)
+    assert messages == ["Il timer di 1 secondo è scaduto."]
+    assert engine.timers == []
+
+
+def test_volume_commands_change_the_player_volume(engine):
+    player = engine.voice.player
+    assert engine.handle("Volume al 40%") == "Fatto."
+    assert player.volume == pytest.approx(0.4)
+    engine.handle("volume a 7")
+    assert player.volume == pytest.approx(0.7)
+    engine.handle("Alza il volume.")
+    engine.handle("Alza il volume.")
+    assert player.volume == 1.0
+    engine.handle("imposta il volume al minimo")
+    assert player.volume == pytest.approx(0.1)
+
+
+def test_repeat_returns_the_last_answer(engine):
+    assert engine.handle("Puoi ripetere?") == "Non ho ancora detto nulla."
+    engine.remember("Roma è la capitale d'Italia.")
+    assert engine.handle("Cosa hai detto?") == "Roma è la capitale d'Italia."
+    # una risposta locale diventa l'ultima risposta
+    reply = engine.handle("Che ore sono?")
+    assert engine.handle("ripeti") == reply
+
+
+def test_unmatched_or_failed_commands_go_to_the_model(engine):
+    assert engine.handle("Che tempo farà domani a Milano?") is None
+    assert engine.handle("timer di boh minuti") is None
+    assert engine.last_intent is None
+    assert engine.timers == []
+
+
+def test_stats_report_the_local_share(engine):
+    engine.record("intent", 0.05)
+    engine.record("llm", 0.8)
+    engine.record("llm", 1.0)
+    stats = engine.stats()
+    assert stats["turns"] == 3
+    assert stats["local_share"] == pytest.approx(1 / 3)
+    assert stats["intent_p50_ms"] == pytest.approx(50)
+    assert stats["llm_p50_ms"] == pytest.approx(900)
+
+
+def test_describe_duration():
+    assert describe_duration(90) == "1 minuto e 30 secondi"
+    assert describe_duration(3600 + 120 + 1) == "1 ora, 2 minuti e 1 secondo"
+    assert describe_duration(0) == "0 secondi"
@@ -0,0 +1,105 @@
+import types
+import pytest
+from model.llm_backends import ChatStream, LLMRouter, LocalBackend, RemoteBackend
+from model.response_gen import AerisMind
+from replay.fakes import FakeOpenAI
+
+
+@pytest.fixture
+def router():
+    return LLMRouter(RemoteBackend(None), LocalBackend())
+
+
+@pytest.mark.parametrize("prompt", [
+    "Ciao",
+    "grazie mille!",
+    "Ok, va bene, grazie Aeris.",
+    "Ciao Aeris, come stai? Chi sei?"
+])
+def test_greeting_only_prompts_go_local(router, prompt):
+    assert router.route(prompt)[0] is router.local
+    assert router.last_reason == "saluto"
+
+
+@pytest.mark.parametrize("prompt", ["chi ha scritto l'Odissea?", "che tempo fa domani?", "Perché?"])
+def test_short_questions_go_remote(router, prompt):
+    assert router.route(prompt)[0] is router.remote
+
+
+@pytest.mark.parametrize("prompt", [
+    "Ciao, mi spieghi come funziona un motore a reazione?",
+    "ok adesso raccontami la storia dell'impero romano",
+    "Grazie, e quali sono le capitali dei paesi del nord Europa?"
+])
+def test_long_questions_starting_with_a_greeting_go_remote(router, prompt):
+    assert router.route(prompt)[0] is router.remote
+    assert router.last_reason is None
+
+
+def test_slow_remote_sends_long_questions_local(router):
+    for _ in range(router.min_samples):
+        router.record(router.remote, router.budget + 1.0)
+    assert router.route("Mi spieghi come funziona un motore a reazione?")[0] is router.local
+
+
+def test_remote_failure_sends_everything_local_until_the_cooldown_ends(router):
+    prompt = "Mi spieghi come funziona un motore a reazione?"
+    router.record_failure(router.remote)
+    assert router.route(prompt)[0] is router.local
+    assert router.last_reason == "remoto non raggiungibile"
+    router.cooldown = 0.0
+    assert router.route(prompt)[0] is router.remote
+    router.record_failure(router.remote)
+    router.cooldown = 60.0
+    # una risposta riuscita del remoto chiude subito il cooldown
+    router.record(router.remote, 0.2)
+    assert router.route(prompt)[0] is router.remote
+
+
+def test_old_latencies_expire(router):
+    for _ in range(router.min_samples):
+        router.record(router.remote, router.budget + 1.0)
+    router.window_seconds = 0.0
+    assert router.p95(router.remote.name) is None
+    assert router.route("Mi spieghi come funziona un motore a reazione?")[0] is router.remote
+
+
+def test_without_local_backend_only_the_remote_is_tried():
+    router = LLMRouter(RemoteBackend(None))
+    assert router.route("ciao") == [router.remote]
+
+
+def test_chat_stream_becomes_responses_events():
+    chunks = [{"choices": [{"delta": {"content": "Ciao"}}]},
+              types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=" a te."))],
+                                    usage=None),
+              {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 3}}]
+    events = list(ChatStream(iter(chunks), input_tokens=99))
+    assert [event.type for event in events] == ["response.output_text.delta"] * 2 + ["response.completed"]
+    assert "".join(event.delta for event in events[:2]) == "Ciao a te."
+    usage = events[-1].response.usage
+    assert (usage.input_tokens, usage.output_tokens) == (12, 3)
+
+    # senza uso riportato dal server restano le stime
+    events = list(ChatStream(iter(chunks[:1]), input_tokens=99))
+    assert events[-1].response.usage.input_tokens == 99
+    assert events[-1].response.usage.output_tokens > 0
+
+
+def test_local_messages_use_the_system_role():
+    messages = LocalBackend.messages([{"role": "developer", "content": "Sei Aeris."},
+                                      {"role": "user", "content": "ciao"}], instructions="Rispondi breve.")
+    assert [m["role"] for m in messages] == ["system", "system", "user"]
+    assert LocalBackend.messages("ciao") == [{"role": "user", "content": "ciao"}]
+
+
+class BrokenLocal(LocalBackend):
+    def stream(self, input, max_output_tokens: int, instructions: str = None, cancel=None, **options):
+        raise ConnectionError("server locale spento")
+
+
+def test_failed_local_model_falls_back_to_the_remote():
+    mind = AerisMind(client=FakeOpenAI(replies=["Ciao a te!"], first_token=0.01), local=BrokenLocal())
+    assert "".join(mind.stream_response("ciao", use_cache=False)) == "Ciao a te!"
+    assert mind.last_backend == "openai"
+    mind.close()
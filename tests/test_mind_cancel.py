@@ -0,0 +1,66 @@
+import threading
+import time
+from model.response_gen import AerisMind
+from replay.fakes import FakeOpenAI
+
+
+class RecordingClient(FakeOpenAI):
+    """ FakeOpenAI che tiene gli stream aperti, per controllare che vengano chiusi."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.streams = []
+
+    def create(self, model: str, input, stream: bool = False, instructions: str = None, **kwargs):
+        result = super().create(model, input, stream=stream, instructions=instructions, **kwargs)
+        if stream:
+            self.streams.append(result)
+        return result
+
+
+def test_cancel_during_first_token_wait_closes_the_request():
+    client = RecordingClient(first_token=5.0)
+    mind = AerisMind(client=client)
+    threading.Timer(0.2, mind.cancel).start()
+
+    start = time.perf_counter()
+    deltas = list(mind.stream_response("Raccontami una storia lunga", use_cache=False))
+    elapsed = time.perf_counter() - start
+
+    assert deltas == []
+    assert elapsed < 1.0
+    assert mind.response == ""
+    assert len(client.streams) == 1
+    assert client.streams[0].closed.is_set()
+    mind.close()
+
+
+def test_stream_without_cancel_still_answers():
+    mind = AerisMind(client=FakeOpenAI(replies=["Ciao a te."], first_token=0.05))
+    assert "".join(mind.stream_response("ciao", use_cache=False)) == "Ciao a te."
+    mind.close()
+
+
+def test_cancel_before_the_first_iteration_is_not_lost():
+    client = RecordingClient(replies=["Una risposta che non va detta."], first_token=0.05)
+    mind = AerisMind(client=client)
+    mind.begin_turn()
+    deltas = mind.stream_response("ciao", use_cache=False)
+    mind.cancel() # barge-in prima che la pipeline inizi a leggere il generatore
+    assert list(deltas) == []
+    assert client.streams == []
+
+    # il turno successivo riparte da un evento nuovo
+    mind.begin_turn()
+    assert "".join(mind.stream_response("ciao", use_cache=False)) == "Una risposta che non va detta."
+    mind.close()
+
+
+def test_new_turn_does_not_reset_the_cancel_of_the_previous_stream():
+    mind = AerisMind(client=RecordingClient(first_token=5.0))
+    mind.begin_turn()
+    old = mind.stream_response("Raccontami una storia lunga", use_cache=False)
+    mind.cancel()
+    mind.begin_turn()
+    assert not mind.cancelled.is_set()
+    assert list(old) == []
+    mind.close()
@@ -0,0 +1,95 @@
+import types
+import numpy as np
+import pytest
+from audio.noise import GainNormalizer, NoiseFloor, SpectralDenoiser, frame_rms
+from benchmark.noise_bench import make_noise, make_speech, run_scenario, snr
+
+
+def db(value: float) -> float:
+    return 20 * np.log10(value)
+
+
+def track_seconds(floor: NoiseFloor, audio: np.ndarray):
+    return floor.track(frame_rms(audio, 320))
+
+
+def test_noise_floor_converges_to_steady_noise():
+    rng = np.random.default_rng(0)
+    floor = NoiseFloor()
+    track_seconds(floor, make_noise(5.0, 0.03, rng))
+    # il 15° percentile dell'RMS per frame sta poco sotto l'RMS complessivo
+    assert db(0.03) - 4 < db(floor.level) < db(0.03)
+    assert floor.frames == 250
+
+
+def test_noise_floor_falls_fast_and_rises_slowly():
+    rng = np.random.default_rng(0)
+    floor = NoiseFloor()
+    track_seconds(floor, make_noise(5.0, 0.03, rng))
+    loud = floor.level
+    # un secondo di parlato 12 dB sopra il rumore alza la stima di pochi dB
+    speech = make_speech(0.12, rng, words=2)
+    track_seconds(floor, speech + make_noise(len(speech) / 16000, 0.03, rng))
+    assert db(floor.level) - db(loud) < 6
+    # il rumore cala di 20 dB: in due secondi la stima lo segue
+    track_seconds(floor, make_noise(2.0, 0.003, rng))
+    assert db(floor.level) < db(0.003) + 3
+
+
+def test_thresholds_follow_the_floor_with_minimums():
+    floor = NoiseFloor(initial=0.01)
+    assert floor.on_threshold() == pytest.approx(0.01 * 10 ** (8 / 20))
+    quiet = NoiseFloor(initial=0.0001)
+    assert quiet.on_threshold() == quiet.min_on
+    on, off = quiet.track(np.full(3, 0.0001))
+    assert np.all(on == quiet.min_on) and np.all(off == quiet.min_off)
+    assert NoiseFloor().on_threshold() == NoiseFloor().min_on
+
+
+def test_frame_rms():
+    audio = np.concatenate((np.full(320, 0.5), np.zeros(320), np.full(100, 1.0))).astype(np.float32)
+    assert np.allclose(frame_rms(audio, 320), [0.5, 0.0])
+    assert np.allclose(frame_rms(np.full(100, 0.2, dtype=np.float32), 320), [0.2])
+
+
+def test_gain_brings_speech_to_the_target_within_limits():
+    rng = np.random.default_rng(0)
+    gain = GainNormalizer()
+    soft = gain.apply(make_speech(0.02, rng))
+    assert 1 < gain.last_gain < 10
+    assert np.percentile(frame_rms(soft), 90) == pytest.approx(gain.target_rms, rel=0.01)
+
+    gain.apply(make_speech(0.0005, rng)) # 44 dB sotto il target: il guadagno si ferma a +20 dB
+    assert gain.last_gain == pytest.approx(10)
+    loud = gain.apply(make_speech(0.9, rng))
+    assert gain.last_gain == pytest.approx(10 ** (-12 / 20))
+    assert np.max(np.abs(loud)) <= 1.0
+    silence = np.zeros(1600, dtype=np.float32)
+    assert gain.apply(silence) is silence
+
+
+def test_denoiser_reconstructs_clean_audio_and_improves_snr():
+    rng = np.random.default_rng(0)
+    speech = make_speech(0.1, rng)
+    untouched = SpectralDenoiser(over_subtraction=0.0, floor=0.0).apply(speech)
+    assert np.allclose(untouched, speech, atol=1e-4)
+
+    noisy = speech + make_noise(len(speech) / 16000, 0.03, rng)
+    cleaned = SpectralDenoiser().apply(noisy)
+    assert len(cleaned) == len(noisy)
+    # circa +2 dB su rumore a bassa frequenza 10 dB sotto il parlato
+    assert snr(speech, cleaned) > snr(speech, noisy) + 1.5
+
+    short = np.ones(300, dtype=np.float32)
+    assert SpectralDenoiser().apply(short) is short
+
+
+def test_adaptive_vad_ends_noisy_turns_and_keeps_soft_speech():
+    args = types.SimpleNamespace(turns=3, max_turn=15.0)
+    # stanza rumorosa: con le soglie fisse il turno arriva sempre al timeout
+    length, _, timeouts, lost = run_scenario("rumorosa", 0.03, 0.12, True, args)
+    assert (timeouts, lost) == (0, 0) and length < 10
+    assert run_scenario("rumorosa", 0.03, 0.12, False, args)[2] == 3
+    # voce sommessa in una stanza silenziosa: con le soglie fisse va persa
+    assert run_scenario("voce sommessa", 0.0005, 0.01, True, args)[3] == 0
+    assert run_scenario("voce sommessa", 0.0005, 0.01, False, args)[3] == 3
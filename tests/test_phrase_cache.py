@@ -0,0 +1,51 @@
+import os
+from speech.cache import PhraseCache
+
+
+def pcm_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pcm"))
+
+
+def test_disk_tier_stays_within_byte_budget(tmp_path):
+    cache = PhraseCache("voce", cache_dir=str(tmp_path), disk_budget=10_000)
+    for i in range(20):
+        cache.put(f"Frase numero {i}.", b"\x01" * 1000, 0.1)
+    assert len(pcm_files(tmp_path)) == 10
+    assert sum(os.path.getsize(tmp_path / name) for name in pcm_files(tmp_path)) <= 10_000
+    assert cache.stats()["evicted"] == 10
+    assert len(os.listdir(tmp_path)) == 20 # ogni frase rimasta ha il suo .json
+
+
+def test_disk_tier_stays_within_entry_budget(tmp_path):
+    cache = PhraseCache("voce", cache_dir=str(tmp_path), max_disk_entries=3)
+    for i in range(5):
+        cache.put(f"Frase {i}.", b"\x01" * 10, 0.1)
+    assert len(pcm_files(tmp_path)) == 3
+
+
+def test_recently_used_phrase_survives_eviction(tmp_path):
+    cache = PhraseCache("voce", cache_dir=str(tmp_path), disk_budget=3000, memory_budget=0)
+    for i in range(3):
+        cache.put(f"Frase {i}.", b"\x01" * 1000, 0.1)
+    assert cache.get("Frase 0.") is not None # letta dal disco: diventa la più recente
+    cache.put("Frase 3.", b"\x01" * 1000, 0.1)
+    fresh = PhraseCache("voce", cache_dir=str(tmp_path), memory_budget=0)
+    assert fresh.get("Frase 0.") is not None
+    assert fresh.get("Frase 1.") is None
+    assert fresh.get("Frase 3.") is not None
+
+
+def test_budget_applies_to_existing_files_on_startup(tmp_path):
+    cache = PhraseCache("voce", cache_dir=str(tmp_path), disk_budget=100_000)
+    for i in range(8):
+        cache.put(f"Frase {i}.", b"\x01" * 1000, 0.1)
+    smaller = PhraseCache("voce", cache_dir=str(tmp_path), disk_budget=4000)
+    assert len(pcm_files(tmp_path)) == 4
+    assert smaller.stats()["disk_entries"] == 4
+
+
+def test_memory_hit_after_put(tmp_path):
+    cache = PhraseCache("voce", cache_dir=str(tmp_path))
+    cache.put("Fatto.", b"\x02" * 100, 0.2)
+    assert bytes(cache.get("Fatto.")) == b"\x02" * 100
+    assert cache.stats()["memory_hits"] == 1
@@ -0,0 +1,47 @@
+import numpy as np
+from audio.preroll import PreRollBuffer
+
+
+def feed(buffer: PreRollBuffer, total: int, frame: int) -> np.ndarray:
+    samples = np.arange(total, dtype=np.int16)
+    for start in range(0, total, frame):
+        buffer.write(samples[start:start + frame])
+    return samples
+
+
+def expected(samples: np.ndarray, capacity: int) -> np.ndarray:
+    return samples[-capacity:].astype(np.float32) / 32768.0
+
+
+def test_snapshot_is_chronological_with_small_frames():
+    buffer = PreRollBuffer(seconds=0.02) # 320 campioni
+    samples = feed(buffer, 1000, 100)
+    np.testing.assert_array_equal(buffer.snapshot(), expected(samples, 320))
+
+
+def test_snapshot_before_buffer_is_full():
+    buffer = PreRollBuffer(seconds=0.02)
+    samples = feed(buffer, 200, 50)
+    np.testing.assert_array_equal(buffer.snapshot(), samples.astype(np.float32) / 32768.0)
+
+
+def test_frames_larger_than_capacity_stay_aligned():
+    buffer = PreRollBuffer(seconds=0.02)
+    samples = feed(buffer, 512 * 3, 512)
+    np.testing.assert_array_equal(buffer.snapshot(), expected(samples, 320))
+
+
+def test_small_frames_after_large_frame():
+    buffer = PreRollBuffer(seconds=0.02)
+    samples = np.arange(2000, dtype=np.int16)
+    buffer.write(samples[:512])
+    buffer.write(samples[512:612])
+    buffer.write(samples[612:1500])
+    buffer.write(samples[1500:1530])
+    np.testing.assert_array_equal(buffer.snapshot(), expected(samples[:1530], 320))
+
+
+def test_frames_equal_to_capacity():
+    buffer = PreRollBuffer(seconds=0.02)
+    samples = feed(buffer, 320 * 3 + 100, 320)
+    np.testing.assert_array_equal(buffer.snapshot(), expected(samples, 320))
@@ -0,0 +1,28 @@
+""" Regressione della latenza dalla fine del parlato al primo campione di risposta,
+    con le sessioni in tests/fixtures (parlato simulato a 16kHz con accanto gli istanti
+    della wakeword e le risposte) riprodotte in tempo reale da replay/harness.py. Whisper,
+    OpenAI e Piper sono sostituiti dai finti backend di replay/fakes.py con tempi fissi,
+    quindi il limite misura l'orchestrazione: VAD, code, streaming del modello e sintesi."""
+import os
+import pytest
+from replay.fakes import FakeTranscriber
+from replay.harness import Session, run_session
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# fine del parlato (dopo il silenzio di fine turno del VAD) -> primo campione: trascrizione
+# finale, primo token finto (0.3 s) e primo blocco di sintesi, circa 0.6 s, con margine
+MAX_SPEECH_TO_RESPONSE_MS = 1500
+
+
+@pytest.mark.parametrize("mode", ["threaded", "async"])
+@pytest.mark.parametrize("name, turns", [("una_domanda", 1), ("due_domande", 2)])
+def test_replay_turns_and_latency(name, turns, mode):
+    result = run_session(Session(os.path.join(FIXTURES, f"{name}.wav")), mode=mode,
+                         stt=FakeTranscriber(), tail_seconds=4.0)
+    assert result["detected"] == turns
+    assert result["stt_process"] == "fake"
+    assert result["turns"] == turns
+    assert result["answered"] == turns
+    assert result["llm_requests"] == turns
+    assert result["speech_to_response_p95_ms"] < MAX_SPEECH_TO_RESPONSE_MS
@@ -0,0 +1,86 @@
+import time
+import types
+import wave
+import numpy as np
+from replay.fakes import FakeVoice, ScriptedWakeword
+from replay.source import FileCapture, load_audio
+
+
+def read_all(reader, block: int, pause: float = 0.0) -> np.ndarray:
+    parts = []
+    while True:
+        data = reader.read(block, timeout=2.0)
+        if data is None:
+            return np.concatenate(parts)
+        parts.append(data)
+        time.sleep(pause)
+
+
+def test_lockstep_delivers_the_whole_file_to_a_slow_reader():
+    audio = (np.arange(40000) % 20000).astype(np.int16)
+    # buffer più corto del file: senza lockstep il lettore lento perderebbe campioni
+    capture = FileCapture(audio, sample_rate=16000, speed=0, frames_per_buffer=512,
+                          tail_seconds=0.1, buffer_seconds=0.5)
+    reader = capture.reader(0)
+    capture.start()
+    data = read_all(reader, 320, pause=0.001)
+
+    assert capture.finished.wait(1.0)
+    assert reader.dropped == 0
+    assert np.array_equal(data[:len(audio)], audio)
+    assert len(data) >= len(audio) + 1600 - 320
+    assert not np.any(data[len(audio):])
+
+
+def test_speed_scales_real_time_playback():
+    capture = FileCapture(np.zeros(16000, dtype=np.int16), sample_rate=16000, speed=4.0, frames_per_buffer=512)
+    start = time.perf_counter()
+    capture.start()
+    assert capture.finished.wait(2.0)
+    elapsed = time.perf_counter() - start
+    # un secondo di audio a velocità 4
+    assert 0.2 < elapsed < 0.6
+    assert capture.position >= 16000
+
+
+def test_load_audio_resamples_wav_to_the_capture_rate(tmp_path):
+    path = str(tmp_path / "tono.wav")
+    tone = (np.sin(2 * np.pi * 440 * np.arange(16000) / 16000) * 10000).astype(np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(tone.tobytes())
+
+    audio = load_audio(path, sample_rate=44100)
+    assert audio.dtype == np.int16
+    assert 44100 <= len(audio) < 44100 + 500
+    # stesso livello del tono originale, a parte i bordi del filtro
+    middle = audio[4410:-4410].astype(np.float32)
+    assert abs(np.sqrt(np.mean(middle ** 2)) - 10000 / np.sqrt(2)) < 300
+    assert np.array_equal(load_audio(path, sample_rate=16000), tone)
+
+
+def test_scripted_wakeword_fires_on_time_and_counts_missed_words():
+    capture = types.SimpleNamespace(position=0, sample_rate=16000)
+    wakeword = ScriptedWakeword(capture, [5.0, 1.0, 2.0], tolerance=1.0)
+
+    def at(seconds: float) -> int:
+        capture.position = int(seconds * 16000)
+        return wakeword.process(None)
+
+    assert at(0.9) == -1
+    assert at(1.05) == 0
+    assert at(1.1) == -1
+    # nessuno ascoltava tra 1.1 e 4.0 s: la parola a 2.0 s è persa, non rilevata in ritardo
+    assert at(4.0) == -1
+    assert at(5.2) == 0
+    assert (wakeword.detected, wakeword.missed) == (2, 1)
+
+
+def test_fake_voice_switch_keeps_synthesizing(tmp_path):
+    voice = FakeVoice(cache_dir=str(tmp_path), rtf=0.0)
+    voice.set_voice("it_IT-riccardo-x_low")
+    assert voice.voice == "it_IT-riccardo-x_low"
+    assert voice.cache.voice_path == "it_IT-riccardo-x_low"
+    assert len(b"".join(voice.synthesize_uncached("Ciao."))) == int(5 * 0.06 * 22050) * 2
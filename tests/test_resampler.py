@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from audio.capture import AudioRing, RingReader
+from audio.resampler import FrameResampler, StreamingResampler
+
+
+def tone(freq: float, seconds: float = 1.0, rate: int = 44100, level: float = 0.5) -> np.ndarray:
+    return (np.sin(2 * np.pi * freq * np.arange(int(seconds * rate)) / rate) * level).astype(np.float32)
+
+
+def in_blocks(resampler, signal: np.ndarray, sizes: list, **kwargs) -> np.ndarray:
+    parts, start, i = [], 0, 0
+    while start < len(signal):
+        size = sizes[i % len(sizes)]
+        parts.append(resampler.process(signal[start:start + size], **kwargs))
+        start += size
+        i += 1
+    return np.concatenate(parts)
+
+
+def test_output_does_not_depend_on_block_size():
+    signal = tone(440)
+    whole = StreamingResampler().process(signal)
+    # blocchi piccoli, il blocco di cattura e blocchi che fanno crescere i buffer interni
+    blocks = in_blocks(StreamingResampler(), signal, [1323, 7, 5000, 1024, 1])
+    assert len(blocks) == len(whole)
+    assert np.allclose(blocks, whole, atol=1e-5)
+    assert abs(len(whole) - 16000) <= 1
+
+
+def test_int16_input_with_scale_matches_float_input():
+    samples = (tone(440) * 32767).astype(np.int16)
+    expected = StreamingResampler().process(samples.astype(np.float32) / 32768.0)
+    assert np.allclose(in_blocks(StreamingResampler(), samples, [1323], scale=1 / 32768.0), expected, atol=1e-6)
+
+
+def test_copy_false_reuses_the_output_buffer():
+    resampler = StreamingResampler()
+    first = resampler.process(tone(440)[:1323], copy=False)
+    second = resampler.process(tone(440)[1323:2646], copy=False)
+    assert np.shares_memory(first, second)
+    copied = resampler.process(tone(440)[2646:3969])
+    assert not np.shares_memory(copied, second)
+
+
+def test_low_pass_keeps_speech_and_removes_aliases():
+    def rms(x):
+        return float(np.sqrt(np.mean(x[1000:-1000] ** 2)))
+
+    speech = StreamingResampler().process(tone(1000))
+    alias = StreamingResampler().process(tone(12000)) # sopra gli 8kHz di Nyquist a 16kHz
+    assert rms(speech) == pytest.approx(0.5 / np.sqrt(2), rel=0.01)
+    assert rms(alias) < 0.5 / np.sqrt(2) / 100
+
+
+def test_frame_resampler_returns_exact_int16_frames():
+    signal = (tone(440) * 20000).astype(np.int16)
+    frames_resampler = FrameResampler(frame_length=512)
+    frames = []
+    for start in range(0, len(signal), 1323):
+        frames += [frame.copy() for frame in frames_resampler.frames(signal[start:start + 1323])]
+    assert all(len(frame) == 512 and frame.dtype == np.int16 for frame in frames)
+
+    expected = StreamingResampler().process(signal)
+    produced = np.concatenate(frames)
+    assert len(produced) == len(expected) // 512 * 512
+    assert np.max(np.abs(produced.astype(np.float32) - expected[:len(produced)])) <= 1.0
+
+
+def test_ring_view_matches_read_and_avoids_copies():
+    ring = AudioRing(1000)
+    data = np.arange(1500, dtype=np.int16)
+    ring.write(data[:900])
+    viewer, reader = RingReader(ring, 0), RingReader(ring, 0)
+
+    contiguous = viewer.view(600)
+    assert np.shares_memory(contiguous, ring.buffer)
+    assert np.array_equal(contiguous, reader.read(600))
+
+    ring.write(data[900:1500])
+    # i campioni 600..1100 attraversano la fine del buffer: arrivano nel buffer del lettore
+    wrapped = viewer.view(500)
+    assert not np.shares_memory(wrapped, ring.buffer)
+    assert np.array_equal(wrapped, data[600:1100])
+    assert np.array_equal(wrapped, reader.read(500))
+    assert viewer.dropped == 0
@@ -0,0 +1,61 @@
+import pytest
+from model.response_cache import ResponseCache
+from model.response_gen import AerisMind
+from replay.fakes import FakeOpenAI
+
+MODEL, INSTRUCTIONS = "modello", "istruzioni"
+
+
+def cached(cache: ResponseCache, stored: str, asked: str):
+    cache.put(stored, MODEL, INSTRUCTIONS, f"risposta a: {stored}", latency=1.0)
+    return cache.get(asked, MODEL, INSTRUCTIONS)
+
+
+def test_fuzzy_tier_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("AERIS_RESPONSE_CACHE_FUZZY", raising=False)
+    mind = AerisMind(client=FakeOpenAI())
+    assert mind.cache.fuzzy_threshold is None
+    assert cached(mind.cache, "Come funziona la fotosintesi?", "come funziona la fotosintes") is None
+
+
+def test_fuzzy_tier_enabled_by_env(monkeypatch):
+    monkeypatch.setenv("AERIS_RESPONSE_CACHE_FUZZY", "0.85")
+    assert AerisMind(client=FakeOpenAI()).cache.fuzzy_threshold == 0.85
+
+
+def test_fuzzy_hit_on_small_transcription_difference():
+    cache = ResponseCache(fuzzy_threshold=0.85)
+    assert cached(cache, "Come funziona la fotosintesi clorofilliana?",
+                  "come funziona la fotosintesi clorofilliana") is not None
+    assert cached(cache, "Mi racconti la storia del Colosseo?", "mi racconti la storia del colosseo ?") is not None
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("Come funziona la fotosintesi clorofilliana nelle piante?",
+     "Come non funziona la fotosintesi clorofilliana nelle piante?"),
+    ("Quanto fa 12 per 3?", "Quanto fa 12 per 4?"),
+    ("Dimmi tre curiosità sui gatti", "Dimmi sei curiosità sui gatti"),
+    ("Posso mangiare le fragole in gravidanza?", "Non posso mangiare le fragole in gravidanza?")
+])
+def test_fuzzy_rejects_different_negations_or_numbers(stored, asked):
+    cache = ResponseCache(fuzzy_threshold=0.85)
+    assert cached(cache, stored, asked) is None
+
+
+@pytest.mark.parametrize("text", [
+    "Che ore sono?", "Che ora è", "che tempo fa domani a Milano", "Cosa c'è di nuovo nelle notizie",
+    "imposta una sveglia alle sette", "Che giorno è oggi?", "quali sono le previsioni per il weekend"
+])
+def test_time_sensitive_requests_bypass_the_cache(text):
+    assert ResponseCache.is_time_sensitive(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Buongiorno Aeris", "E ora raccontami una storia", "Qual è la temperatura di ebollizione dell'acqua?",
+    "Quanti giorni ha un anno bisestile?", "Qual è la data della presa della Bastiglia?",
+    "Le ultime parole di Giulio Cesare"
+])
+def test_timeless_requests_are_cached(text):
+    assert not ResponseCache.is_time_sensitive(text)
+    cache = ResponseCache()
+    assert cached(cache, text, text) is not None
@@ -0,0 +1,133 @@
+import mmap
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+import pytest
+from metrics.resources import ResourceReport, rss_mb
+from runtime.config import RuntimeConfig
+
+
+ENV = ("AERIS_STT_THREADS", "AERIS_STT_INTEROP_THREADS", "AERIS_TTS_THREADS", "AERIS_BLAS_THREADS",
+       "AERIS_CAPTURE_CPU", "AERIS_STT_CPUS", "AERIS_PROFILE_STARTUP")
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    for name in ENV:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_defaults_leave_a_core_to_capture(clean_env):
+    config = RuntimeConfig(cores=8)
+    assert (config.stt_threads, config.stt_interop_threads, config.tts_threads, config.blas_threads) == (7, 1, 4, 1)
+    assert config.capture_cpu is None and config.stt_cpus is None
+    single = RuntimeConfig(cores=1)
+    assert (single.stt_threads, single.tts_threads) == (1, 1)
+
+
+def test_from_env_overrides_the_defaults(clean_env):
+    clean_env.setenv("AERIS_STT_THREADS", "3")
+    clean_env.setenv("AERIS_TTS_THREADS", "2")
+    clean_env.setenv("AERIS_BLAS_THREADS", " ")
+    clean_env.setenv("AERIS_CAPTURE_CPU", "0")
+    clean_env.setenv("AERIS_STT_CPUS", "2,3")
+    clean_env.setenv("AERIS_PROFILE_STARTUP", "1")
+    config = RuntimeConfig.from_env()
+    assert (config.stt_threads, config.tts_threads, config.blas_threads) == (3, 2, 1)
+    assert config.capture_cpu == 0 and config.stt_cpus == (2, 3)
+    assert config.profile_startup
+
+
+def test_stt_worker_gets_the_cores_left_by_capture(clean_env):
+    clean_env.setattr(os, "sched_getaffinity", lambda pid: {0, 1, 2, 3})
+    config = RuntimeConfig(capture_cpu=1)
+    assert config.cores == 4
+    assert config.stt_cpus == (0, 2, 3)
+    assert config.describe() == ("4 core, whisper 3+1 thread, Piper 2, BLAS 1, "
+                                 "worker STT sui core 0,2,3, cattura sul core 1")
+    assert RuntimeConfig(capture_cpu=1, stt_cpus=(3,)).stt_cpus == (3,)
+
+
+def test_apply_environment_does_not_override_existing_variables(clean_env):
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMBA_NUM_THREADS",
+                 "TOKENIZERS_PARALLELISM"):
+        clean_env.delenv(name, raising=False)
+    clean_env.setenv("OPENBLAS_NUM_THREADS", "4")
+    RuntimeConfig(cores=8, blas_threads=2).apply_environment()
+    assert os.environ["OMP_NUM_THREADS"] == "7"
+    assert os.environ["MKL_NUM_THREADS"] == "2"
+    assert os.environ["OPENBLAS_NUM_THREADS"] == "4"
+    assert os.environ["TOKENIZERS_PARALLELISM"] == "false"
+
+
+def test_pin_current_thread():
+    results = []
+
+    def pin(cpu):
+        results.append(RuntimeConfig.pin_current_thread(cpu))
+        results.append(os.sched_getaffinity(threading.get_native_id()))
+
+    cpu = min(os.sched_getaffinity(0))
+    # in un thread a parte, per non fissare il processo dei test
+    for target in (cpu, 100000):
+        thread = threading.Thread(target=pin, args=(target,))
+        thread.start()
+        thread.join()
+    assert results[:2] == [True, {cpu}]
+    assert results[2] is False
+    assert results[3] == os.sched_getaffinity(0)
+
+
+def test_report_measures_imports_and_components():
+    report = ResourceReport()
+    with report.imports("stt"):
+        sys.modules.pop("colorsys", None)
+        import colorsys # noqa: F401
+    # mmap anonimo: pagine sempre nuove, mentre malloc può riusare memoria già residente
+    # lasciata libera dai test precedenti
+    block = mmap.mmap(-1, 64 * 1024 * 1024)
+    with report.component("stt"):
+        for offset in range(0, len(block), mmap.PAGESIZE):
+            block[offset] = 1
+        time.sleep(0.01)
+    entry = report.summary()["components"]["stt"]
+    assert entry["modules"] == 1 and entry["import_s"] > 0
+    assert entry["load_s"] >= 0.01
+    assert entry["rss_mb"] > 50
+    assert entry["pid"] is None
+    block.close()
+
+
+def test_report_follows_a_component_in_another_process():
+    report = ResourceReport()
+    child = subprocess.Popen([sys.executable, "-c", "import time; print(flush=True); time.sleep(30)"],
+                             stdout=subprocess.PIPE)
+    try:
+        child.stdout.readline() # l'interprete è partito: l'RSS non è più quello del fork
+        process = types.SimpleNamespace(pid=child.pid)
+        with report.component("stt"):
+            report.set_process("stt", process, import_s=1.5)
+        entry = report.summary()["components"]["stt"]
+        assert entry["pid"] == child.pid and entry["import_s"] == 1.5
+        assert entry["rss_mb"] > 1
+        # worker riavviato: il report segue il nuovo pid
+        process.pid = os.getpid()
+        assert report.summary()["components"]["stt"]["pid"] == os.getpid()
+    finally:
+        child.kill()
+        child.wait()
+    assert rss_mb(child.pid) is None
+    assert rss_mb() > 0
+
+
+def test_importing_aeris_does_not_load_heavy_modules():
+    heavy = ("torch", "transformers", "openai", "httpx", "pyaudio", "piper", "onnxruntime")
+    code = f"import sys, Aeris; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
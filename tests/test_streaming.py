@@ -0,0 +1,173 @@
+import http.client
+import json
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+from replay.fakes import FakeVoice, NullPlayer
+from speech.chunker import SentenceChunker
+from speech.playback import PlaybackQueue
+
+REPLY = ("Ciao! Oggi il cielo è sereno su tutta la città. Domani invece pioverà, "
+         "quindi porta l'ombrello. Buona giornata!")
+SENTENCES = ["Ciao! Oggi il cielo è sereno su tutta la città.",
+             "Domani invece pioverà, quindi porta l'ombrello.",
+             "Buona giornata!"]
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """ Risponde a POST /v1/responses come l'API Responses in streaming: response.created,
+        un response.output_text.delta per parola e response.completed."""
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = [word + " " for word in server.reply.split(" ")]
+        words[-1] = words[-1].rstrip()
+        events = [{"type": "response.created"}]
+        events += [{"type": "response.output_text.delta", "delta": word} for word in words]
+        events.append({"type": "response.completed"})
+        for i, event in enumerate(events):
+            time.sleep(server.first_token if i == 1 else server.token_interval if i > 1 else 0)
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+
+
+class SSEServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, reply: str, first_token: float, token_interval: float):
+        super().__init__(("127.0.0.1", 0), SSEHandler)
+        self.reply = reply
+        self.first_token = first_token
+        self.token_interval = token_interval
+
+
+@pytest.fixture
+def sse_server():
+    server = SSEServer(REPLY, first_token=0.1, token_interval=0.03)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+""" Eventi dello stream letti riga per riga, come oggetti con type e delta."""
+def read_events(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    connection.request("POST", "/v1/responses", body=json.dumps({"stream": True}),
+                       headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    try:
+        for line in response:
+            if line.startswith(b"data: "):
+                yield types.SimpleNamespace(**json.loads(line[6:]))
+    finally:
+        connection.close()
+
+
+def test_sentence_boundaries_arrive_in_order(sse_server):
+    chunker = SentenceChunker()
+    chunks = []
+    for event in read_events(sse_server):
+        if event.type == "response.output_text.delta":
+            chunks += chunker.feed(event.delta)
+    chunks += chunker.flush()
+    assert chunks == SENTENCES
+
+
+def test_first_chunk_arrives_while_the_reply_is_still_streaming(sse_server):
+    chunker = SentenceChunker()
+    start = time.perf_counter()
+    first_chunk = None
+    for event in read_events(sse_server):
+        if event.type == "response.output_text.delta" and chunker.feed(event.delta) and first_chunk is None:
+            first_chunk = time.perf_counter() - start
+    total = time.perf_counter() - start
+
+    # la prima frase sono 10 parole: primo token più 9 intervalli, con margine
+    words = len(SENTENCES[0].split())
+    assert first_chunk < sse_server.first_token + words * sse_server.token_interval + 0.25
+    # e arriva mentre mancano ancora le 9 parole delle altre frasi
+    assert first_chunk < total - 5 * sse_server.token_interval
+
+
+def test_long_first_sentence_is_cut_at_a_pause():
+    chunker = SentenceChunker()
+    chunks = []
+    for word in "Allora, vediamo un attimo: la risposta a questa domanda è piuttosto lunga da spiegare. ".split(" "):
+        chunks += chunker.feed(word + " ")
+    assert chunks[0] == "Allora, vediamo un attimo:"
+    assert chunks[1:] == ["la risposta a questa domanda è piuttosto lunga da spiegare."]
+
+
+class RecordingPlayer(NullPlayer):
+    """ NullPlayer che ricorda, nell'ordine, le frasi di cui ha riprodotto i campioni."""
+    def __init__(self, sample_rate: int):
+        super().__init__(sample_rate)
+        self.played = []
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        chunk, flag = super()._callback(in_data, frame_count, time_info, status)
+        for tag in np.unique(np.frombuffer(chunk, dtype=np.int16)):
+            if tag and (not self.played or self.played[-1] != tag):
+                self.played.append(int(tag))
+        return chunk, flag
+
+
+class TaggedVoice(FakeVoice):
+    """ FakeVoice i cui campioni valgono il numero della frase, per riconoscerle in uscita."""
+    def __init__(self, texts: list, **kwargs):
+        super().__init__(player=RecordingPlayer, **kwargs)
+        self.tags = {text: i + 1 for i, text in enumerate(texts)}
+        self.synthesized = []
+
+    def synthesize_uncached(self, text: str):
+        self.synthesized.append(text)
+        for pcm in super().synthesize_uncached(text):
+            yield np.full(len(pcm) // 2, self.tags[text], dtype=np.int16).tobytes()
+
+
+def test_playback_queue_plays_chunks_in_order(tmp_path):
+    voice = TaggedVoice(SENTENCES, seconds_per_char=0.004, chunk_seconds=0.05, cache_dir=str(tmp_path))
+    queue = PlaybackQueue(voice)
+    for text in SENTENCES:
+        queue.put(text)
+    queue.close()
+    queue.wait()
+    assert voice.synthesized == SENTENCES
+    assert voice.player.played == [1, 2, 3]
+    assert queue.first_audio_latency is not None
+    voice.player.close()
+
+
+def test_playback_queue_cancel_drains_pending_chunks(tmp_path):
+    texts = [f"Frase numero {i} abbastanza lunga da durare un po'." for i in range(5)]
+    voice = TaggedVoice(texts, seconds_per_char=0.02, chunk_seconds=0.1, cache_dir=str(tmp_path))
+    queue = PlaybackQueue(voice)
+    for text in texts:
+        queue.put(text)
+    deadline = time.perf_counter() + 2.0
+    while not voice.player.played and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert voice.player.played[:1] == [1]
+
+    queue.cancel()
+    queue.synth_thread.join(timeout=1.0)
+    assert not queue.synth_thread.is_alive()
+    # frasi in attesa scartate, jitter buffer vuoto e nessun campione dopo lo stop
+    assert queue.texts.qsize() == 0
+    assert voice.player.buffered_seconds == 0
+    assert voice.player.done.is_set()
+    played = list(voice.player.played)
+    time.sleep(0.2)
+    assert voice.player.played == played
+    assert len(voice.synthesized) < len(texts)
+    voice.player.close()
@@ -0,0 +1,27 @@
+import pytest
+from audio.decoding import get_policy
+
+stt_backends = pytest.importorskip("audio.stt_backends", reason="i backend di whisper richiedono torch e transformers")
+
+
+@pytest.fixture
+def cached_backend(monkeypatch):
+    # backend non caricato già nella cache del processo: get_backend non scarica il modello
+    backend = stt_backends.TransformersBackend("whisper-finto")
+    backend.model = object()
+    monkeypatch.setitem(stt_backends._BACKEND_CACHE, ("hf", "whisper-finto"), backend)
+    return backend
+
+
+def test_policy_does_not_change_the_shared_backend(cached_backend):
+    default = cached_backend.policy
+    beam = stt_backends.get_backend("hf", "whisper-finto", policy=get_policy("beam"))
+    assert beam.policy.num_beams > 1
+    assert beam.model is cached_backend.model
+    assert cached_backend.policy is default
+    assert stt_backends.get_backend("hf", "whisper-finto") is cached_backend
+
+    greedy = stt_backends.get_backend("hf", "whisper-finto", policy=get_policy("greedy"))
+    assert greedy.policy.num_beams == 1 and beam.policy.num_beams > 1
+    greedy.last_stats = [{"tokens": 1}]
+    assert beam.last_stats == [] and cached_backend.last_stats == []
@@ -0,0 +1,135 @@
+import importlib.util
+import os
+import time
+import numpy as np
+import pytest
+from audio.stt_worker import SharedAudioRing, SttWorker
+
+
+""" Corpo del worker senza torch, con lo stesso protocollo di _worker_main: ogni segmento
+    viene "trascritto" come lunghezza e primo campione. backend sceglie un guasto che
+    avviene solo la prima volta (il file model_name ricorda che è già successo):
+    crash termina il processo, hang smette di rispondere, error restituisce un errore."""
+def scripted_main(conn, ring_name: str, capacity: int, backend: str, model_name: str,
+                  policy, threads: int, cpus: tuple, interop_threads: int = 1):
+    ring = SharedAudioRing(capacity, name=ring_name)
+    try:
+        conn.send(("ready", 0.0, 0.0))
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+            segments = [ring.read(*item) if isinstance(item, tuple) else item for item in message[1]]
+            if backend != "ok" and not os.path.exists(model_name):
+                open(model_name, "w").close()
+                if backend == "crash":
+                    os._exit(1)
+                if backend == "hang":
+                    time.sleep(60)
+                if backend == "error":
+                    conn.send(("error", "ValueError: segmento non valido"))
+                    continue
+            texts = [f"{len(audio)}:{audio[0]:.2f}" for audio in segments]
+            conn.send(("ok", texts, [{"tokens": 1} for _ in segments]))
+    except EOFError:
+        pass
+    finally:
+        ring.close()
+
+
+class ScriptedWorker(SttWorker):
+    main = staticmethod(scripted_main)
+
+
+def segment(level: float, n: int = 1600) -> np.ndarray:
+    return np.full(n, level, dtype=np.float32)
+
+
+@pytest.fixture
+def worker_factory(tmp_path):
+    workers = []
+
+    def make(backend: str = "ok", **kwargs):
+        worker = ScriptedWorker(backend, str(tmp_path / f"{backend}.done"), **kwargs).start()
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.close()
+
+
+def test_segments_travel_through_shared_memory(worker_factory):
+    worker = worker_factory(buffer_seconds=0.5)
+    assert worker.transcribe_batch([segment(0.1), segment(0.2, 800)]) == ["1600:0.10", "800:0.20"]
+    assert worker.transcribe(segment(0.3)) == "1600:0.30"
+    assert worker.last_stats == [{"tokens": 1}]
+    # il buffer condiviso viene riusato in giro: la posizione supera la capacità
+    for i in range(5):
+        assert worker.transcribe(segment(i / 10, 3000)) == f"3000:{i / 10:.2f}"
+    assert worker.ring.written > worker.ring.capacity
+
+
+def test_batch_larger_than_the_ring_goes_through_the_pipe(worker_factory):
+    worker = worker_factory(buffer_seconds=0.1) # 1600 campioni
+    written = worker.ring.written
+    assert worker.transcribe_batch([segment(0.4), segment(0.5)]) == ["1600:0.40", "1600:0.50"]
+    assert worker.ring.written == written
+
+
+def test_crashed_worker_is_restarted_and_the_request_retried(worker_factory):
+    worker = worker_factory("crash")
+    pid = worker.pid
+    assert worker.transcribe(segment(0.1)) == "1600:0.10"
+    assert worker.restarts == 1
+    assert worker.pid != pid and worker.is_alive
+
+
+def test_hung_worker_is_killed_after_the_timeout(worker_factory):
+    worker = worker_factory("hang", timeout=0.5)
+    start = time.perf_counter()
+    assert worker.transcribe(segment(0.1)) == "1600:0.10"
+    assert 0.5 <= time.perf_counter() - start < 5.0
+    assert worker.restarts == 1
+
+
+def test_transcription_errors_keep_the_worker(worker_factory):
+    worker = worker_factory("error")
+    pid = worker.pid
+    with pytest.raises(RuntimeError, match="segmento non valido"):
+        worker.transcribe(segment(0.1))
+    assert worker.restarts == 0 and worker.pid == pid
+    assert worker.transcribe(segment(0.2)) == "1600:0.20"
+
+
+def test_close_stops_the_process_and_frees_the_ring(worker_factory):
+    worker = worker_factory()
+    process = worker.process
+    worker.close()
+    assert not process.is_alive()
+    assert worker.ring.buffer is None
+    with pytest.raises(FileNotFoundError):
+        SharedAudioRing(worker.ring.capacity, name=worker.ring.name)
+
+
+@pytest.mark.skipif(importlib.util.find_spec("torch") is not None, reason="con torch il worker carica whisper")
+def test_start_fails_cleanly_without_torch():
+    worker = SttWorker()
+    with pytest.raises(RuntimeError, match="torch"):
+        worker.start()
+    assert not worker.is_alive
+    assert worker.ring.buffer is None
+
+
+def test_shared_ring_wraps_and_is_visible_by_name():
+    ring = SharedAudioRing(1000)
+    other = SharedAudioRing(1000, name=ring.name)
+    try:
+        ring.write(np.zeros(700, dtype=np.float32))
+        data = np.arange(600, dtype=np.float32)
+        start = ring.write(data)
+        assert start == 700
+        assert np.array_equal(other.read(start, 600), data)
+    finally:
+        other.close()
+        ring.close()
@@ -0,0 +1,77 @@
+import json
+import time
+import pytest
+from metrics.tracing import Tracer, percentile
+
+
+def test_turn_record_is_written_as_jsonl(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(path=str(path))
+    tracer.begin(mode="threaded")
+    wake = tracer.current["marks"]["wake"]
+    tracer.mark("end_of_speech", at=wake + 0.5)
+    tracer.mark("end_of_speech", at=wake + 0.9) # vale la prima occorrenza
+    tracer.mark("stt_done", at=wake + 0.7)
+    with tracer.stage("stt"):
+        sum(range(10000))
+    tracer.queue_depth("audio_queue", 3)
+    tracer.queue_depth("audio_queue", 1)
+    tracer.end(marks={"llm_first_token": wake + 1.2, "stt_done": wake + 5.0, "playback_done": wake + 2.0,
+                       "turn_id": "x"}, answered=True)
+    tracer.close()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    marks = record["marks_ms"]
+    assert marks["end_of_speech"] == pytest.approx(500)
+    assert marks["stt_done"] == pytest.approx(700)
+    assert marks["llm_first_token"] == pytest.approx(1200)
+    assert "turn_id" not in marks
+    # istanti in ordine di tempo, a partire dalla wakeword
+    assert list(marks) == ["wake", "end_of_speech", "stt_done", "llm_first_token", "playback_done"]
+    assert record["cpu_ms"]["stt"] >= 0 and record["wall_ms"]["stt"] > 0
+    assert record["queues"] == {"audio_queue": 3}
+    assert record["mode"] == "threaded" and record["answered"] is True
+
+
+def test_summary_percentiles_over_the_rolling_window():
+    tracer = Tracer(window=5)
+    for i in range(10):
+        tracer.begin()
+        tracer.mark("stt_done", at=tracer.current["marks"]["wake"] + i / 1000)
+        tracer.end()
+    summary = tracer.summary()["stt_done"]
+    # restano solo gli ultimi 5 turni: 5..9 ms
+    assert summary["count"] == 5
+    assert summary["p50"] == pytest.approx(7)
+    assert summary["p99"] == pytest.approx(8.96)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    tracer.begin()
+    tracer.mark("stt_done")
+    with tracer.stage("stt"):
+        pass
+    assert tracer.stage("stt") is tracer.stage("tts")
+    assert tracer.end() is None
+    assert tracer.turns == 0 and tracer.summary() == {}
+
+
+def test_percentile_interpolates():
+    assert percentile([], 95) == 0.0
+    assert percentile([10.0], 95) == 10.0
+    assert percentile([0.0, 10.0], 50) == 5.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 100) == 4.0
+
+
+def test_marks_outside_a_turn_are_ignored():
+    tracer = Tracer()
+    tracer.mark("stt_done")
+    tracer.queue_depth("audio_queue", 2)
+    assert tracer.end() is None
+    tracer.begin()
+    time.sleep(0.01)
+    record = tracer.end()
+    assert record["marks_ms"]["playback_done"] >= 10
@@ -0,0 +1,161 @@
+import time
+import types
+import pytest
+from model.llm_backends import LocalBackend
+from model.response_gen import AerisMind
+from model.transport import LLMTransport
+from replay.fakes import FakeStream
+
+REQUEST = dict(model="stub", input=[{"role": "user", "content": "che ore sono?"}], max_output_tokens=100)
+
+
+class ScriptedClient:
+    """ Client con la parte dell'interfaccia di OpenAI usata da LLMTransport: la richiesta
+        i-esima manda il primo delta dopo delays[i] secondi (l'ultimo vale per le successive)."""
+    def __init__(self, delays: list):
+        self.delays = delays
+        self.streams = []
+        self.responses = self
+
+    def create(self, stream: bool = False, **kwargs):
+        delay = self.delays[min(len(self.streams), len(self.delays) - 1)]
+        usage = types.SimpleNamespace(input_tokens=10, output_tokens=3)
+        result = FakeStream(["Sono ", "le ", "dieci."], usage, delay, 0.0)
+        self.streams.append(result)
+        return result
+
+
+class ChatClient:
+    """ Server locale compatibile con OpenAI: chat completions in streaming."""
+    def __init__(self, text: str):
+        self.text = text
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model: str, messages: list, max_tokens: int, stream: bool):
+        return iter([{"choices": [{"delta": {"content": word + " "}}]} for word in self.text.split()])
+
+    def close(self):
+        pass
+
+
+def text_of(stream) -> str:
+    return "".join(event.delta for event in stream if event.type == "response.output_text.delta")
+
+
+def test_first_token_deadline_raises_and_closes_the_request():
+    client = ScriptedClient([5.0])
+    transport = LLMTransport(client=client, first_token_timeout=0.2)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        transport.stream(**REQUEST)
+    assert time.perf_counter() - start < 1.0
+    assert transport.timeouts == 1
+    assert client.streams[0].closed.is_set()
+    transport.close()
+
+
+def test_remote_deadline_falls_back_to_the_local_model():
+    transport = LLMTransport(client=ScriptedClient([5.0]), first_token_timeout=0.2)
+    local = LocalBackend()
+    local.client = ChatClient("Risposta del modello locale.")
+    mind = AerisMind(transport=transport, local=local)
+
+    start = time.perf_counter()
+    text = "".join(mind.stream_response("Mi spieghi come funziona un motore a reazione?", use_cache=False))
+    assert time.perf_counter() - start < 1.0
+    assert text.strip() == "Risposta del modello locale."
+    assert mind.last_backend == "local"
+    mind.close()
+
+
+def test_hedge_second_request_wins_and_loser_is_closed():
+    client = ScriptedClient([5.0, 0.05])
+    transport = LLMTransport(client=client, hedge=True, hedge_min_delay=0.1, hedge_max_delay=0.1,
+                             first_token_timeout=3.0)
+    start = time.perf_counter()
+    stream = transport.stream(**REQUEST)
+    assert time.perf_counter() - start < 1.0
+    assert transport.hedges == 1
+    assert len(client.streams) == 2
+    assert client.streams[0].closed.is_set()
+    assert not client.streams[1].closed.is_set()
+    assert text_of(stream) == "Sono le dieci."
+    time.sleep(0.1)
+    # la copia chiusa non conta come latenza per il p95 dell'hedging
+    assert len(transport.latencies) == 1
+    transport.close()
+
+
+def test_hedge_does_not_fire_when_the_first_request_is_fast():
+    client = ScriptedClient([0.02])
+    transport = LLMTransport(client=client, hedge=True, hedge_min_delay=0.2, hedge_max_delay=0.2)
+    assert text_of(transport.stream(**REQUEST)) == "Sono le dieci."
+    assert transport.hedges == 0
+    assert len(client.streams) == 1
+    transport.close()
+
+
+# le prove seguenti usano il client OpenAI vero contro il server finto di
+# benchmark.llm_transport_bench: pool di connessioni e preconnessione esistono solo con httpx
+
+
+@pytest.fixture
+def server():
+    pytest.importorskip("httpx")
+    pytest.importorskip("openai")
+    from benchmark.llm_transport_bench import StubServer
+    server = StubServer(handshake=0.0, first_token=0.05, token_interval=0.0, slow_share=0.0,
+                        slow=0.0, stall_share=0.0, idle_close=10.0).start()
+    yield server
+    server.stop()
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_preconnect_warms_the_pool_before_the_first_request(server):
+    transport = LLMTransport(api_key="stub", base_url=server.base_url)
+    transport.preconnect()
+    assert wait_until(lambda: server.heads == 1)
+    assert server.connections == 1
+    assert text_of(transport.stream(**REQUEST)).strip()
+    # la richiesta usa la connessione aperta alla wakeword
+    assert server.connections == 1
+    transport.close()
+
+
+def test_pool_reuses_the_connection_across_requests(server):
+    transport = LLMTransport(api_key="stub", base_url=server.base_url)
+    for _ in range(3):
+        assert text_of(transport.stream(**REQUEST)).strip()
+    assert transport.requests == 3
+    assert server.connections == 1
+    transport.close()
+
+
+def test_stub_deadline_raises(server):
+    server.delays.append(3600)
+    transport = LLMTransport(api_key="stub", base_url=server.base_url, first_token_timeout=0.3)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        transport.stream(**REQUEST)
+    assert time.perf_counter() - start < 1.5
+    transport.close()
+
+
+def test_stub_hedge_cancels_the_stalled_request(server):
+    server.delays.extend([3600, 0.05])
+    transport = LLMTransport(api_key="stub", base_url=server.base_url, hedge=True,
+                             hedge_min_delay=0.1, hedge_max_delay=0.1, first_token_timeout=3.0)
+    start = time.perf_counter()
+    assert text_of(transport.stream(**REQUEST)).strip()
+    assert time.perf_counter() - start < 1.5
+    assert transport.hedges == 1
+    assert server.connections == 2
+    transport.close()